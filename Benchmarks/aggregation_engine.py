@@ -0,0 +1,87 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import gc
+import sys
+import copy
+import json
+import time
+
+# Project Imports
+sys.path.append('../Common')
+import functions
+import constants
+import columnar_aggregation
+import synthetic_events
+
+# --------------------------------------------------------------------------------------------------
+# Settings
+# --------------------------------------------------------------------------------------------------
+
+RECORDS_PER_BATCH   = 10000
+REPETITIONS         = 20
+
+# --------------------------------------------------------------------------------------------------
+# Benchmark: Dictionary Engine vs. Columnar Engine
+# --------------------------------------------------------------------------------------------------
+
+# Best time [ms] of both engines, runs alternate (in alternating order) so that both see the same
+# machine load, without garbage collection during the timed calls (as timeit)
+def measure(aggregate, records):
+    deltas = dict()
+    best_times = {'dict': None, 'columnar': None}
+    for i in range(REPETITIONS):
+        for engine in ('dict', 'columnar') if i % 2 == 0 else ('columnar', 'dict'):
+            functions.AGGREGATION_ENGINE = engine
+            gc.collect()
+            gc.disable()
+            start_time = time.perf_counter()
+            deltas[engine] = aggregate(records)
+            duration = time.perf_counter() - start_time
+            gc.enable()
+            if best_times[engine] is None or duration < best_times[engine]:
+                best_times[engine] = duration
+    return deltas['dict'], best_times['dict'] * 1000, deltas['columnar'], best_times['columnar'] * 1000
+
+print('\nAggregating ' + str(RECORDS_PER_BATCH) + ' records per batch (best of ' +
+    str(REPETITIONS) + ', numpy ' + ('enabled' if columnar_aggregation.numpy else 'not installed') +
+    ').\n')
+print('{:<20}{:>14}{:>16}{:>12}{:>12}'.format('Stream', 'dict [ms]', 'columnar [ms]', 'Speedup',
+    'Identical'))
+
+# The same StateTable records without the LeafKey attribute (items written before it was introduced)
+dynamo_records = synthetic_events.dynamo_records(RECORDS_PER_BATCH)
+dynamo_records_without_leaf_key = copy.deepcopy(dynamo_records)
+for record in dynamo_records_without_leaf_key:
+    for image in ('NewImage', 'OldImage'):
+        if image in record['dynamodb']:
+            record['dynamodb'][image].pop(constants.LEAF_KEY_COLUMN_NAME)
+            record['dynamodb'][image].pop(constants.HIERARCHY_SIGNATURE_COLUMN_NAME)
+
+# The Kinesis records are timed with and without decoding, which takes most of the time
+kinesis_records = synthetic_events.kinesis_records(RECORDS_PER_BATCH)
+
+streams = {
+    'Kinesis':          (functions.aggregate_over_kinesis_records, kinesis_records),
+    'Kinesis (decoded)':(functions.aggregate_over_kinesis_messages,
+                            list(functions.kinesis_messages(kinesis_records))),
+    'DynamoDB':         (functions.aggregate_over_dynamo_records, dynamo_records),
+    'DynamoDB (JSON)':  (functions.aggregate_over_dynamo_records, dynamo_records_without_leaf_key)
+}
+
+deltas = dict()
+for stream, (aggregate, records) in streams.items():
+    dict_delta, dict_time, columnar_delta, columnar_time = measure(aggregate, records)
+    deltas[stream] = json.dumps(dict_delta, sort_keys = True)
+    identical = deltas[stream] == json.dumps(columnar_delta, sort_keys = True)
+    print('{:<20}{:>14.2f}{:>16.2f}{:>11.2f}x{:>12}'.format(stream, dict_time, columnar_time,
+        dict_time / columnar_time, str(identical)))
+
+# Leaf keys and parsed hierarchies give the same delta
+assert deltas['DynamoDB'] == deltas['DynamoDB (JSON)']
+print('')
@@ -0,0 +1,65 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import sys
+import time
+import hashlib
+import tracemalloc
+
+# Project Imports
+sys.path.append('../Common')
+import functions
+import synthetic_events
+
+# --------------------------------------------------------------------------------------------------
+# Settings
+# --------------------------------------------------------------------------------------------------
+
+RECORDS_PER_BATCH   = 10000
+REPETITIONS         = 10
+
+# --------------------------------------------------------------------------------------------------
+# Benchmark: Hash over str(records) vs. Fingerprint over Record Identities
+# --------------------------------------------------------------------------------------------------
+
+def hash_of_repr(records):
+    return hashlib.sha256(str(records).encode()).hexdigest()
+
+def measure(fingerprint, records):
+
+    # CPU Time
+    best_time = None
+    for i in range(REPETITIONS):
+        start_time = time.process_time()
+        fingerprint(records)
+        duration = time.process_time() - start_time
+        best_time = duration if best_time is None else min(best_time, duration)
+
+    # Peak Memory
+    tracemalloc.start()
+    fingerprint(records)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best_time * 1000, peak_memory / 1024
+
+print('\nFingerprinting batches of ' + str(RECORDS_PER_BATCH) + ' records (best of ' +
+    str(REPETITIONS) + ').\n')
+print('{:<12}{:<26}{:>12}{:>16}'.format('Stream', 'Method', 'CPU [ms]', 'Peak [KiB]'))
+
+streams = {
+    'Kinesis':  synthetic_events.kinesis_records(RECORDS_PER_BATCH),
+    'DynamoDB': synthetic_events.dynamo_records(RECORDS_PER_BATCH)
+}
+
+for stream, records in streams.items():
+    for method, fingerprint in [('sha256(str(records))', hash_of_repr),
+        ('batch_fingerprint', functions.batch_fingerprint)]:
+        cpu_time, peak_memory = measure(fingerprint, records)
+        print('{:<12}{:<26}{:>12.2f}{:>16.0f}'.format(stream, method, cpu_time, peak_memory))
+print('')
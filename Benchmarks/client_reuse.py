@@ -0,0 +1,114 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import os
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# AWS Imports
+import boto3
+
+# Project Imports
+sys.path.append('../Common')
+import functions
+import constants
+
+# --------------------------------------------------------------------------------------------------
+# Settings
+# --------------------------------------------------------------------------------------------------
+
+NUMBER_OF_INVOCATIONS   = 200
+CALLS_PER_INVOCATION    = 5
+
+# Dummy credentials - the stub endpoint does not verify signatures
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+
+# --------------------------------------------------------------------------------------------------
+# Local Stub Endpoint: Answers every DynamoDB call with an empty JSON document
+# --------------------------------------------------------------------------------------------------
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    # Keep connections alive and answer without Nagle delays, just like the real endpoint
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-amz-json-1.0')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+# --------------------------------------------------------------------------------------------------
+# Simulated Invocations
+# --------------------------------------------------------------------------------------------------
+
+def put_items(ddb_client):
+    for i in range(CALLS_PER_INVOCATION):
+        ddb_client.put_item(
+            TableName = constants.DELTA_TABLE_NAME,
+            Item = {constants.DELTA_TABLE_KEY: {'S': str(i)}}
+        )
+
+# Old behaviour: Create a new client in every invocation
+def invocation_new_client(endpoint_url):
+    ddb_client = boto3.client(constants.DYNAMO_NAME, region_name = constants.REGION_NAME,
+        endpoint_url = endpoint_url)
+    put_items(ddb_client)
+
+# New behaviour: Reuse the cached client of the warm container
+def invocation_cached_client(endpoint_url):
+    put_items(functions.get_client(constants.DYNAMO_NAME, endpoint_url))
+
+def measure(invocation, endpoint_url):
+
+    # Warm up (first invocation pays the cold start in both cases)
+    invocation(endpoint_url)
+
+    durations = list()
+    for i in range(NUMBER_OF_INVOCATIONS):
+        start_time = time.perf_counter()
+        invocation(endpoint_url)
+        durations.append((time.perf_counter() - start_time) * 1000)
+
+    durations.sort()
+    return sum(durations) / len(durations), durations[len(durations) // 2], \
+        durations[int(len(durations) * 0.99)]
+
+# --------------------------------------------------------------------------------------------------
+# Main
+# --------------------------------------------------------------------------------------------------
+
+server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+threading.Thread(target = server.serve_forever, daemon = True).start()
+endpoint_url = 'http://127.0.0.1:' + str(server.server_address[1])
+
+print('\nBenchmarking ' + str(NUMBER_OF_INVOCATIONS) + ' invocations with ' +
+    str(CALLS_PER_INVOCATION) + ' DynamoDB call(s) each against ' + endpoint_url + '\n')
+
+results = dict()
+results['new client per invocation']    = measure(invocation_new_client, endpoint_url)
+results['cached client']                = measure(invocation_cached_client, endpoint_url)
+
+print('{:<28}{:>12}{:>12}{:>12}'.format('', 'mean [ms]', 'p50 [ms]', 'p99 [ms]'))
+for k,v in results.items():
+    print('{:<28}{:>12.2f}{:>12.2f}{:>12.2f}'.format(k, *v))
+
+saving = results['new client per invocation'][0] - results['cached client'][0]
+print('\nSaving per invocation: {:.2f} ms (mean).\n'.format(saving))
+
+server.shutdown()
@@ -0,0 +1,60 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import sys
+import json
+import time
+import base64
+
+# Project Imports
+sys.path.append('../Common')
+import functions
+import synthetic_events
+
+# --------------------------------------------------------------------------------------------------
+# Settings
+# --------------------------------------------------------------------------------------------------
+
+RECORDS_PER_DELTA   = 1000
+REPETITIONS         = 10000
+
+# --------------------------------------------------------------------------------------------------
+# Benchmark: JSON vs. Binary Delta Messages
+# --------------------------------------------------------------------------------------------------
+
+# Stream images as received by ReduceLambda (binary attributes arrive base64 encoded)
+def json_image(delta):
+    return {'Message': {'S': json.dumps(delta, sort_keys = True)}}
+
+def binary_image(delta):
+    return {'MessageBinary': {'B': base64.b64encode(functions.encode_delta(delta)).decode()}}
+
+def measure(function, argument):
+    start_time = time.perf_counter()
+    for i in range(REPETITIONS):
+        function(argument)
+    return (time.perf_counter() - start_time) / REPETITIONS * 10**6
+
+delta = functions.aggregate_along_tree(functions.aggregate_over_kinesis_records(
+    synthetic_events.kinesis_records(RECORDS_PER_DELTA)))
+
+json_size = len(json.dumps(delta, sort_keys = True).encode())
+binary_size = len(functions.encode_delta(delta))
+
+json_encode = measure(lambda d: json.dumps(d, sort_keys = True), delta)
+binary_encode = measure(functions.encode_delta, delta)
+json_decode = measure(functions.delta_from_image, json_image(delta))
+binary_decode = measure(functions.delta_from_image, binary_image(delta))
+
+assert functions.delta_from_image(binary_image(delta)) == delta
+
+print('\nDelta with ' + str(len(delta)) + ' entries (' + str(RECORDS_PER_DELTA) + ' records).\n')
+print('{:<10}{:>14}{:>16}{:>16}'.format('Format', 'Size [bytes]', 'Encode [us]', 'Decode [us]'))
+print('{:<10}{:>14}{:>16.1f}{:>16.1f}'.format('json', json_size, json_encode, json_decode))
+print('{:<10}{:>14}{:>16.1f}{:>16.1f}'.format('binary', binary_size, binary_encode, binary_decode))
+print('')
@@ -0,0 +1,133 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import gc
+import sys
+import time
+import base64
+import decimal
+
+# Project Imports
+sys.path.append('../Common')
+import functions
+import constants
+import synthetic_events
+
+# --------------------------------------------------------------------------------------------------
+# Settings
+# --------------------------------------------------------------------------------------------------
+
+RECORDS_PER_BATCH   = 10000
+DELTAS_PER_REDUCE   = 1000
+REPETITIONS         = 50
+DECIMALS            = 2
+
+# --------------------------------------------------------------------------------------------------
+# Benchmark: Float vs. Fixed-Point Accumulation (VALUE_FIXED_POINT_DECIMALS)
+# --------------------------------------------------------------------------------------------------
+
+def set_decimals(decimals):
+    scale = None if decimals is None else 10 ** decimals
+    functions.VALUE_FIXED_POINT_DECIMALS = decimals
+    functions.VALUE_SCALE = scale
+
+# Best time [ms] of float and fixed-point, runs alternate (in alternating order) so that both see the
+# same machine load, without garbage collection during the timed calls (as timeit)
+def measure(function, float_args, fixed_args):
+    best_times = {None: None, DECIMALS: None}
+    runs = [(None, float_args), (DECIMALS, fixed_args)]
+    for i in range(REPETITIONS):
+        for decimals, args in runs if i % 2 == 0 else reversed(runs):
+            set_decimals(decimals)
+            gc.collect()
+            gc.disable()
+            start_time = time.perf_counter()
+            function(*args)
+            duration = time.perf_counter() - start_time
+            gc.enable()
+            if best_times[decimals] is None or duration < best_times[decimals]:
+                best_times[decimals] = duration
+    return best_times[None] * 1000, best_times[DECIMALS] * 1000
+
+def print_row(name, float_time, fixed_time):
+    print('{:<34}{:>14.2f}{:>18.2f}{:>11.2f}x'.format(name, float_time, fixed_time, float_time / fixed_time))
+
+# Map: Aggregate (with the given engine), roll up and serialize a batch
+def map_batch(engine, aggregate, records, encode):
+    functions.AGGREGATION_ENGINE = engine
+    delta = functions.aggregate_along_tree(aggregate(records))
+    return encode(delta)
+
+# Reduce: Decode the deltas, add them up and format the numbers of the AggregateTable updates
+def reduce_batch(images):
+    totals = dict()
+    for image in images:
+        data = functions.delta_from_image(image)
+        for entry in data:
+            if entry == constants.TIMESTAMP_GENERATOR_FIRST:
+                functions.dict_entry_min(totals, entry, data[entry])
+            else:
+                functions.dict_entry_add(totals, entry, data[entry])
+    totals.pop(constants.TIMESTAMP_GENERATOR_FIRST)
+    totals.pop(constants.TIMESTAMP_GENERATOR_MEAN)
+    return {key: functions.aggregate_number_string(key, value) for key, value in totals.items()}
+
+# ReduceTable images of a delta as written by the map Lambdas (fixed-point deltas record their decimals)
+def json_image(delta):
+    functions.DELTA_MESSAGE_FORMAT = 'json'
+    return functions.delta_messages(delta)[0]
+
+def binary_image(delta):
+    functions.DELTA_MESSAGE_FORMAT = 'binary'
+    return {'MessageBinary': {'B': base64.b64encode(functions.delta_messages(delta)[0]['MessageBinary']['B'])}}
+
+kinesis_records = synthetic_events.kinesis_records(RECORDS_PER_BATCH)
+dynamo_records = synthetic_events.dynamo_records(RECORDS_PER_BATCH)
+reduce_records = [synthetic_events.kinesis_records(10) for i in range(DELTAS_PER_REDUCE)]
+
+cases = [
+    ('Map Kinesis, dict, json',         'dict', functions.aggregate_over_kinesis_records,
+                                            kinesis_records, json_image),
+    ('Map DynamoDB, dict, json',        'dict', functions.aggregate_over_dynamo_records,
+                                            dynamo_records, json_image),
+    ('Map DynamoDB, columnar, binary',  'columnar', functions.aggregate_over_dynamo_records,
+                                            dynamo_records, binary_image)
+]
+
+print('\nFloat vs. fixed-point (' + str(DECIMALS) + ' decimals) accumulation: ' + str(RECORDS_PER_BATCH) +
+    ' records per map batch, ' + str(DELTAS_PER_REDUCE) + ' deltas per reduce (best of ' +
+    str(REPETITIONS) + ').\n')
+print('{:<34}{:>14}{:>18}{:>12}'.format('', 'float [ms]', 'fixed-point [ms]', 'Speedup'))
+
+for name, engine, aggregate, records, encode in cases:
+    args = (engine, aggregate, records, encode)
+    print_row(name, *measure(map_batch, args, args))
+functions.AGGREGATION_ENGINE = 'dict'
+
+for name, encode in (('Reduce, json', json_image), ('Reduce, binary', binary_image)):
+    images = dict()
+    for decimals in (None, DECIMALS):
+        set_decimals(decimals)
+        images[decimals] = [encode(functions.aggregate_along_tree(
+            functions.aggregate_over_kinesis_records(records))) for records in reduce_records]
+    print_row(name, *measure(reduce_batch, (images[None],), (images[DECIMALS],)))
+
+# Drift: Running totals of a long run against the exact decimal sum
+set_decimals(DECIMALS)
+values = [functions.random_value() for i in range(1000000)]
+exact_total = sum(decimal.Decimal(repr(value)) for value in values)
+float_total = 0.0
+fixed_total = 0
+for value in values:
+    float_total += value
+    fixed_total += round(value * functions.VALUE_SCALE)
+
+print('\nTotal of ' + str(len(values)) + ' values: exact ' + str(exact_total) + ', float ' + repr(float_total) +
+    ' (error ' + '{:.2e}'.format(abs(decimal.Decimal(float_total) - exact_total)) + '), fixed-point ' +
+    functions.aggregate_number_string('Total', fixed_total) + ' (error ' +
+    str(abs(decimal.Decimal(functions.aggregate_number_string('Total', fixed_total)) - exact_total)) + ')\n')
@@ -0,0 +1,96 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import gc
+import sys
+import time
+import random
+
+# Project Imports
+sys.path.append('../Common')
+import functions
+from hierarchy import CompiledHierarchy
+
+# --------------------------------------------------------------------------------------------------
+# Settings: A wide and deep hierarchy, e.g. thousands of books
+# --------------------------------------------------------------------------------------------------
+
+AGGREGATION_HIERARCHY = ['RiskType', 'Region', 'TradeDesk', 'Book']
+HIERARCHY_DEFINITION = {
+    'RiskType'  : ['PV', 'Delta', 'Gamma', 'Vega'],
+    'Region'    : ['EMEA', 'APAC', 'AMER'],
+    'TradeDesk' : ['Desk' + str(i) for i in range(10)],
+    'Book'      : ['Book' + str(i) for i in range(100)]
+}
+
+LEAFS_PER_DELTA = [12, 1000, 10000]
+REPETITIONS     = 10
+
+# Pass criteria: The compiled rollup gives the same aggregates and is at least MIN_SPEEDUP times faster
+# than the scan for every delta size (including 10,000 leafs)
+MIN_SPEEDUP     = 1.5
+
+# --------------------------------------------------------------------------------------------------
+# Previous Implementation: Scans all keys once per level
+# --------------------------------------------------------------------------------------------------
+
+def aggregate_along_tree_scan(data):
+    aggregation_depth = max([key.count(':') for key in data.keys()])
+    for depth in range(aggregation_depth, 0, -1):
+        children = [key for key in data.keys() if key.count(':') == depth]
+        for child in children:
+            parent = child[:child.rfind(':')]
+            functions.dict_entry_add(data, parent, data[child])
+    return data
+
+# --------------------------------------------------------------------------------------------------
+# Benchmark
+# --------------------------------------------------------------------------------------------------
+
+# Best time [ms] of both rollups, runs alternate (in alternating order) so that both see the same
+# machine load, without garbage collection during the timed calls (as timeit)
+def measure(rollups, delta):
+    results = dict()
+    best_times = dict()
+    gc.collect()
+    gc.disable()
+    for i in range(REPETITIONS):
+        for name in rollups if i % 2 == 0 else reversed(rollups):
+            data = dict(delta)
+            start_time = time.perf_counter()
+            rollups[name](data)
+            duration = time.perf_counter() - start_time
+            results[name] = data
+            if name not in best_times or duration < best_times[name]:
+                best_times[name] = duration
+    gc.enable()
+    return results['scan'], best_times['scan'] * 1000, results['compiled'], best_times['compiled'] * 1000
+
+start_time = time.perf_counter()
+hierarchy = CompiledHierarchy(AGGREGATION_HIERARCHY, HIERARCHY_DEFINITION)
+compile_time = (time.perf_counter() - start_time) * 1000
+
+print('\nCompiled hierarchy with ' + str(hierarchy.leaf_count) + ' leafs and ' +
+    str(hierarchy.node_count) + ' nodes in {:.1f} ms.\n'.format(compile_time))
+print('{:<10}{:>12}{:>16}{:>12}{:>12}'.format('Leafs', 'scan [ms]', 'compiled [ms]', 'Speedup',
+    'Equal'))
+
+failures = list()
+for leaf_count in LEAFS_PER_DELTA:
+    delta = {key: random.uniform(-1000, 1000) for key in random.sample(hierarchy.leaf_keys, leaf_count)}
+    scan_result, scan_time, compiled_result, compiled_time = measure(
+        {'scan': aggregate_along_tree_scan, 'compiled': hierarchy.aggregate_along_tree}, delta)
+    equal = scan_result.keys() == compiled_result.keys() and \
+        all(abs(scan_result[k] - compiled_result[k]) < 1e-6 for k in scan_result)
+    print('{:<10}{:>12.2f}{:>16.2f}{:>11.2f}x{:>12}'.format(leaf_count, scan_time, compiled_time,
+        scan_time / compiled_time, str(equal)))
+    failures += [] if equal and scan_time / compiled_time >= MIN_SPEEDUP else [leaf_count]
+print('')
+
+assert not failures, 'Compiled rollup not equal or below {}x for {} leafs'.format(MIN_SPEEDUP,
+    ', '.join(str(leaf_count) for leaf_count in failures))
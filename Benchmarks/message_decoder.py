@@ -0,0 +1,73 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import sys
+import json
+import time
+import base64
+
+# Project Imports
+sys.path.append('../Common')
+import functions
+import trade_record
+import synthetic_events
+
+# --------------------------------------------------------------------------------------------------
+# Settings
+# --------------------------------------------------------------------------------------------------
+
+RECORDS_PER_BATCH   = 10000
+REPETITIONS         = 10
+
+# --------------------------------------------------------------------------------------------------
+# Benchmark: Decoding of Kinesis Records per JSON Backend
+# --------------------------------------------------------------------------------------------------
+
+# Previous decoding: UTF-8 string and a dictionary per message
+def decode_to_dicts(records):
+    messages = list()
+    for record in records:
+        data = json.loads(base64.b64decode(record['kinesis']['data']).decode('utf-8'))
+        if isinstance(data, list):
+            messages.extend(data)
+        else:
+            messages.append(data)
+    return messages
+
+def measure(decode, records):
+    best_time = None
+    for i in range(REPETITIONS):
+        start_time = time.perf_counter()
+        messages = decode(records)
+        duration = time.perf_counter() - start_time
+        best_time = duration if best_time is None else min(best_time, duration)
+    return messages, best_time * 1000
+
+def decode_with(decoder):
+    def decode(records):
+        trade_record.decode = decoder
+        return functions.kinesis_messages(records)
+    return decode
+
+records = synthetic_events.kinesis_records(RECORDS_PER_BATCH)
+
+print('\nDecoding ' + str(RECORDS_PER_BATCH) + ' Kinesis records (best of ' + str(REPETITIONS) +
+    ' runs), available backends: ' + ', '.join(trade_record.DECODERS) + '\n')
+
+reference, reference_time = measure(decode_to_dicts, records)
+print('{:<28}{:>12}{:>12}{:>12}'.format('', 'batch [ms]', 'record [us]', 'speedup'))
+print('{:<28}{:>12.2f}{:>12.2f}{:>12.2f}'.format('json, dictionaries', reference_time,
+    reference_time * 1000 / RECORDS_PER_BATCH, 1))
+
+for name, decoder in trade_record.DECODERS.items():
+    messages, duration = measure(decode_with(decoder), records)
+    assert [trade_record.TradeRecord(m.id, m.hierarchy, m.value, m.version, m.timestamp).to_dict()
+        for m in messages] == reference
+    print('{:<28}{:>12.2f}{:>12.2f}{:>12.2f}'.format(name + ', trade records', duration,
+        duration * 1000 / RECORDS_PER_BATCH, reference_time / duration))
+print('')
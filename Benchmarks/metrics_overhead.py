@@ -0,0 +1,90 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import os
+import sys
+import time
+import contextlib
+
+# Project Imports
+sys.path.append('../Common')
+from performance_tracker import EventsCounter, PerformanceTracker, PerformanceTrackerInitializer
+
+# --------------------------------------------------------------------------------------------------
+# Settings
+# --------------------------------------------------------------------------------------------------
+
+NUMBER_OF_INVOCATIONS   = 200
+
+# Simulated duration of a synchronous write to the metrics backend (InfluxDB write_points)
+BACKEND_WRITE_LATENCY   = 0.030
+
+# Flush on every invocation (worst case, the Lambdas use 5 s)
+MAX_BATCHING_DELAY_MS   = 0
+
+# --------------------------------------------------------------------------------------------------
+# Metrics Backend with Network Latency
+# --------------------------------------------------------------------------------------------------
+
+class SlowConnector:
+
+    def __init__(self):
+        self.samples_buffer = []
+
+    def add_sample(self, json_data_sample):
+        self.samples_buffer.append(json_data_sample)
+
+    def submit_measurements(self):
+        samples, self.samples_buffer = self.samples_buffer, []
+        time.sleep(BACKEND_WRITE_LATENCY)
+        return True
+
+# --------------------------------------------------------------------------------------------------
+# Simulated Invocations: Tracker calls of a Lambda handler
+# --------------------------------------------------------------------------------------------------
+
+def measure(perf_tracker):
+
+    perf_tracker.max_batching_delay_ms = MAX_BATCHING_DELAY_MS
+    event_counter = EventsCounter(['batch_size', 'random_failures', 'latency_ms'])
+
+    durations = list()
+    for i in range(NUMBER_OF_INVOCATIONS):
+        start_time = time.perf_counter()
+        event_counter.increment('batch_size', 100)
+        event_counter.set('latency_ms', 12.5)
+        perf_tracker.add_metric_sample(None, event_counter, None, None)
+        perf_tracker.submit_measurements()
+        durations.append((time.perf_counter() - start_time) * 1000)
+
+        # Time between two invocations
+        time.sleep(0.001)
+
+    durations.sort()
+    return sum(durations) / len(durations), durations[len(durations) // 2], \
+        durations[int(len(durations) * 0.99)]
+
+# --------------------------------------------------------------------------------------------------
+# Main
+# --------------------------------------------------------------------------------------------------
+
+print('\nBenchmarking the tracker overhead of ' + str(NUMBER_OF_INVOCATIONS) + ' invocations, ' +
+    'backend write latency {:.0f} ms\n'.format(BACKEND_WRITE_LATENCY * 1000))
+
+results = dict()
+with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+    results['disabled']                 = measure(PerformanceTrackerInitializer(False, '', ''))
+    results['backend, synchronous']     = measure(PerformanceTracker(SlowConnector(), False))
+    results['backend, asynchronous']    = measure(PerformanceTracker(SlowConnector(), True))
+    results['emf']                      = measure(PerformanceTrackerInitializer(True,
+                                            'emf Benchmark', ''))
+
+print('{:<28}{:>12}{:>12}{:>12}'.format('', 'mean [ms]', 'p50 [ms]', 'p99 [ms]'))
+for k,v in results.items():
+    print('{:<28}{:>12.3f}{:>12.3f}{:>12.3f}'.format(k, *v))
+print('')
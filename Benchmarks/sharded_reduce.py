@@ -0,0 +1,140 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import sys
+import json
+import time
+import uuid
+import threading
+import importlib.util
+
+# Project Imports: Use a hierarchy with enough top level values to spread over 8 reducers
+sys.path.append('../Common')
+import constants
+constants.HIERARCHY_DEFINITION = {
+    'RiskType'  : ['PV', 'Delta', 'Gamma', 'Vega', 'Rho', 'Theta', 'Vanna', 'Volga'],
+    'Region'    : ['EMEA', 'APAC', 'AMER'],
+    'TradeDesk' : ['FXSpot', 'FXOptions']
+}
+import functions
+import synthetic_events
+
+# --------------------------------------------------------------------------------------------------
+# Settings
+# --------------------------------------------------------------------------------------------------
+
+REDUCER_COUNTS              = [1, 2, 4, 8]
+NUMBER_OF_MAP_DELTAS        = 400
+RECORDS_PER_MAP_DELTA       = 100
+DELTAS_PER_REDUCE_BATCH     = 10
+
+# Simulated DynamoDB latency of one TransactWriteItems call
+TRANSACTION_LATENCY_BASE    = 0.010
+TRANSACTION_LATENCY_ITEM    = 0.0005
+
+# --------------------------------------------------------------------------------------------------
+# Simulated DynamoDB Client: Sleeps instead of writing and records the written keys
+# --------------------------------------------------------------------------------------------------
+
+class SimulatedDynamoDB:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.totals = dict()
+        self.key_owners = dict()
+
+    def transact_write_items(self, TransactItems, ClientRequestToken):
+        time.sleep(TRANSACTION_LATENCY_BASE + TRANSACTION_LATENCY_ITEM * len(TransactItems))
+        with self.lock:
+            for item in TransactItems:
+                key = item['Update']['Key'][constants.AGGREGATE_TABLE_KEY]['S']
+                value = float(item['Update']['ExpressionAttributeValues'][':val']['N'])
+                functions.dict_entry_add(self.totals, key, value)
+                self.key_owners.setdefault(key, set()).add(threading.current_thread().name)
+
+simulated_dynamodb = SimulatedDynamoDB()
+functions.boto3_clients[(constants.DYNAMO_NAME, None)] = simulated_dynamodb
+
+# Load ReduceLambda (after the simulated client was registered)
+spec = importlib.util.spec_from_file_location('reduce_lambda', '../ReduceLambda/lambda_function.py')
+reduce_lambda = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(reduce_lambda)
+
+# --------------------------------------------------------------------------------------------------
+# Simulation
+# --------------------------------------------------------------------------------------------------
+
+# Stream record of the ReduceTable
+def reduce_table_record(partition_delta):
+    return {
+        'eventID': uuid.uuid4().hex,
+        constants.DYNAMO_NAME: {'NewImage': {'Message': {'S': json.dumps(partition_delta)}}}
+    }
+
+# One reducer partition: Invoke ReduceLambda sequentially over its share of the deltas
+def run_reducer(partition_records):
+    for i in range(0, len(partition_records), DELTAS_PER_REDUCE_BATCH):
+        reduce_lambda.lambda_handler({'Records': partition_records[i:i + DELTAS_PER_REDUCE_BATCH]}, None)
+
+def simulate(reducer_count, deltas):
+
+    functions.REDUCER_COUNT = reducer_count
+    simulated_dynamodb.reset()
+
+    # Map stage: Split every delta into its partitions
+    partition_records = [list() for partition in range(reducer_count)]
+    for delta in deltas:
+        for partition, partition_delta in functions.split_delta(dict(delta)).items():
+            partition_records[partition].append(reduce_table_record(partition_delta))
+
+    # Reduce stage: One thread per partition
+    reducers = [threading.Thread(target = run_reducer, args = (partition_records[partition],),
+        name = 'reducer-' + str(partition)) for partition in range(reducer_count)]
+
+    start_time = time.perf_counter()
+    for reducer in reducers:
+        reducer.start()
+    for reducer in reducers:
+        reducer.join()
+    duration = time.perf_counter() - start_time
+
+    message_count = simulated_dynamodb.totals[constants.MESSAGE_COUNT_NAME]
+    disjoint = all(len(owners) == 1 for owners in simulated_dynamodb.key_owners.values())
+    used_partitions = sum(1 for records in partition_records if records)
+    return message_count / duration, used_partitions, disjoint, dict(simulated_dynamodb.totals)
+
+# --------------------------------------------------------------------------------------------------
+# Main
+# --------------------------------------------------------------------------------------------------
+
+print('\nPreparing ' + str(NUMBER_OF_MAP_DELTAS) + ' map deltas of ' + str(RECORDS_PER_MAP_DELTA) +
+    ' records each...')
+deltas = [functions.aggregate_along_tree(functions.aggregate_over_kinesis_records(
+    synthetic_events.kinesis_records(RECORDS_PER_MAP_DELTA))) for i in range(NUMBER_OF_MAP_DELTAS)]
+
+# Silence the Lambda logs during the measurement
+stdout = sys.stdout
+results = dict()
+for reducer_count in REDUCER_COUNTS:
+    sys.stdout = open('/dev/null', 'w')
+    results[reducer_count] = simulate(reducer_count, deltas)
+    sys.stdout.close()
+    sys.stdout = stdout
+
+reference_totals = results[REDUCER_COUNTS[0]][3]
+print('\n{:<10}{:>12}{:>22}{:>10}{:>10}{:>10}'.format('Reducers', 'Partitions',
+    'Throughput [msg/s]', 'Speedup', 'Disjoint', 'Correct'))
+for reducer_count, (throughput, used_partitions, disjoint, totals) in results.items():
+    correct = totals.keys() == reference_totals.keys() and \
+        all(abs(totals[k] - reference_totals[k]) < 1e-6 for k in totals)
+    print('{:<10}{:>12}{:>22.0f}{:>9.2f}x{:>10}{:>10}'.format(reducer_count, used_partitions,
+        throughput, throughput / results[REDUCER_COUNTS[0]][0], str(disjoint), str(correct)))
+print('')
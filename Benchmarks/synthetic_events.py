@@ -0,0 +1,106 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import sys
+import json
+import time
+import uuid
+import random
+import base64
+
+# Project Imports
+sys.path.append('../Common')
+import functions
+import constants
+from hierarchy import HIERARCHY
+
+# --------------------------------------------------------------------------------------------------
+# Synthetic Lambda Events (same layout as the events delivered by the event source mappings)
+# --------------------------------------------------------------------------------------------------
+
+# Random trade message, as generated by the producer
+def random_message(trade_id = None, version = 0):
+    return {
+        constants.ID_COLUMN_NAME:           trade_id or str(uuid.uuid4()),
+        constants.VERSION_COLUMN_NAME:      version,
+        constants.VALUE_COLUMN_NAME:        functions.random_value(),
+        constants.HIERARCHY_COLUMN_NAME:    functions.random_hierarchy(),
+        constants.TIMESTAMP_COLUMN_NAME:    time.time()
+    }
+
+# Kinesis record of one message, as delivered to the Lambda
+def kinesis_record(message, sequence_number, shard_id = 'shardId-000000000000', partition_key = None):
+    return {
+        'kinesis': {
+            'kinesisSchemaVersion': '1.0',
+            'partitionKey': partition_key or message[constants.ID_COLUMN_NAME],
+            'sequenceNumber': str(sequence_number),
+            'data': base64.b64encode(json.dumps(message).encode()).decode(),
+            'approximateArrivalTimestamp': time.time()
+        },
+        'eventSource': 'aws:kinesis',
+        'eventVersion': '1.0',
+        'eventID': shard_id + ':' + str(sequence_number),
+        'eventName': 'aws:kinesis:record',
+        'eventSourceARN': 'arn:aws:kinesis:us-east-1:123456789012:stream/' + \
+            constants.KINESIS_STREAM_NAME
+    }
+
+# Records from a Kinesis Stream
+def kinesis_records(record_count, shard_id = 'shardId-000000000000'):
+    sequence_number = random.randint(10**20, 10**21)
+    return [kinesis_record(random_message(), sequence_number + i + 1, shard_id)
+        for i in range(record_count)]
+
+# DynamoDB image of a trade message in the StateTable (without the leaf key: as written before it)
+def state_image(message, leaf_key = True):
+    image = {
+        constants.STATE_TABLE_KEY:          {'S': message[constants.ID_COLUMN_NAME]},
+        constants.VERSION_COLUMN_NAME:      {'N': str(message[constants.VERSION_COLUMN_NAME])},
+        constants.VALUE_COLUMN_NAME:        {'N': str(message[constants.VALUE_COLUMN_NAME])},
+        constants.HIERARCHY_COLUMN_NAME:    {'S': json.dumps(
+                                                message[constants.HIERARCHY_COLUMN_NAME],
+                                                sort_keys = True)},
+        constants.TIMESTAMP_COLUMN_NAME:    {'N': str(message[constants.TIMESTAMP_COLUMN_NAME])}
+    }
+    if leaf_key:
+        image[constants.LEAF_KEY_COLUMN_NAME] = {'S': functions.hierarchy_to_string(
+            message[constants.HIERARCHY_COLUMN_NAME], constants.AGGREGATION_HIERARCHY)}
+        image[constants.HIERARCHY_SIGNATURE_COLUMN_NAME] = {'N': HIERARCHY.level_signature}
+    return image
+
+# Records from the DynamoDB Stream of the StateTable, a share of them are modifies
+def dynamo_records(record_count, modify_share = 0.2, leaf_key = True):
+    records = list()
+    sequence_number = random.randint(10**20, 10**21)
+    for i in range(record_count):
+        new_message = random_message()
+        sequence_number += 1
+        record = {
+            'eventID': uuid.uuid4().hex,
+            'eventName': 'INSERT',
+            'eventVersion': '1.1',
+            'eventSource': 'aws:dynamodb',
+            'awsRegion': 'us-east-1',
+            'dynamodb': {
+                'ApproximateCreationDateTime': time.time(),
+                'Keys': {constants.STATE_TABLE_KEY: {'S': new_message[constants.ID_COLUMN_NAME]}},
+                'NewImage': state_image(new_message, leaf_key),
+                'SequenceNumber': str(sequence_number),
+                'SizeBytes': 200,
+                'StreamViewType': 'NEW_AND_OLD_IMAGES'
+            },
+            'eventSourceARN': 'arn:aws:dynamodb:us-east-1:123456789012:table/' + \
+                constants.STATE_TABLE_NAME + '/stream/2024-01-01T00:00:00.000'
+        }
+        if random.random() < modify_share:
+            record['eventName'] = 'MODIFY'
+            record['dynamodb']['OldImage'] = state_image(
+                random_message(new_message[constants.ID_COLUMN_NAME]), leaf_key)
+        records.append(record)
+    return records
@@ -0,0 +1,154 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import json
+import operator
+import functools
+
+# Optional Imports: numpy is used for the grouped reduction if it is packaged with the Lambda
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Project Imports
+from constants import *
+from hierarchy import HIERARCHY
+
+# --------------------------------------------------------------------------------------------------
+# Columnar Aggregation Engine
+# --------------------------------------------------------------------------------------------------
+#
+# A batch is decoded into three columns (leaf id, value, timestamp) and reduced in one grouped
+# operation. The result is identical to functions.aggregate_over_*_records: values are added in
+# record order, so the floating point sums match the per-record dictionary updates exactly.
+#
+# All functions return None if a record has a hierarchy that is not part of HIERARCHY_DEFINITION,
+# the caller then falls back to the dictionary engine.
+
+# Raw Hierarchy string (as written by StateLambda) -> leaf id
+hierarchy_string_leaf_ids = dict()
+
+# Leaf id of a JSON encoded hierarchy, parses every distinct string only once
+def leaf_id_from_string(hierarchy_string):
+    leaf_id = hierarchy_string_leaf_ids.get(hierarchy_string)
+    if leaf_id is None:
+        leaf_id = HIERARCHY.leaf_id(json.loads(hierarchy_string))
+        if leaf_id is not None:
+            hierarchy_string_leaf_ids[hierarchy_string] = leaf_id
+    return leaf_id
+
+# Leaf key -> leaf id
+leaf_key_leaf_ids = {leaf_key: leaf_id for leaf_id, leaf_key in enumerate(HIERARCHY.leaf_keys)}
+
+# Leaf id of a StateTable image: From the LeafKey attribute written by StateLambda (for the same levels)
+# or, for items without it, from the JSON encoded hierarchy
+def leaf_id_of_image(image):
+    leaf_key = image.get(LEAF_KEY_COLUMN_NAME)
+    if leaf_key is not None and \
+            image[HIERARCHY_SIGNATURE_COLUMN_NAME]['N'] == HIERARCHY.level_signature:
+        return leaf_key_leaf_ids.get(leaf_key['S'])
+    return leaf_id_from_string(image[HIERARCHY_COLUMN_NAME]['S'])
+
+# Grouped sum over leaf ids, returns (leaf id, sum) for every leaf present in the batch
+def grouped_sum(leaf_ids, values):
+
+    if numpy is not None:
+        leaf_id_array = numpy.array(leaf_ids, dtype = numpy.intp)
+        sums = numpy.bincount(leaf_id_array, weights = numpy.array(values, dtype = numpy.float64),
+            minlength = HIERARCHY.leaf_count)
+        present = numpy.flatnonzero(numpy.bincount(leaf_id_array, minlength = HIERARCHY.leaf_count))
+        return [(leaf_id, sums[leaf_id].item()) for leaf_id in present.tolist()]
+
+    sums = [0.0] * HIERARCHY.leaf_count
+    present = [False] * HIERARCHY.leaf_count
+    for leaf_id, value in zip(leaf_ids, values):
+        sums[leaf_id] += value
+        present[leaf_id] = True
+    return [(leaf_id, sums[leaf_id]) for leaf_id in range(HIERARCHY.leaf_count) if present[leaf_id]]
+
+# Build the delta dictionary from the decoded columns
+def columns_to_delta(leaf_ids, values, times):
+
+    delta = dict()
+    if not times:
+        return delta
+
+    for leaf_id, value in grouped_sum(leaf_ids, values):
+        delta[HIERARCHY.leaf_keys[leaf_id]] = value
+
+    # Sequential sum (not numpy's pairwise sum) to match the dictionary engine
+    message_count = len(times)
+    delta[TIMESTAMP_GENERATOR_MEAN]     = functools.reduce(operator.add, times) / message_count
+    delta[TIMESTAMP_GENERATOR_FIRST]    = min(times)
+    delta[MESSAGE_COUNT_NAME]           = message_count
+
+    return delta
+
+# Aggregate over records from a DynamoDB Stream (Stateful Pipeline)
+def aggregate_over_dynamo_records(records):
+
+    leaf_ids = list()
+    values = list()
+    times = list()
+
+    for record in records:
+
+        # If the record doesn't contain new data: Skip
+        if 'NewImage' not in record[DYNAMO_NAME]:
+            continue
+
+        # Add New Image
+        new_data = record[DYNAMO_NAME]['NewImage']
+        new_leaf_id = leaf_id_of_image(new_data)
+        if new_leaf_id is None:
+            return None
+
+        times.append(float(new_data[TIMESTAMP_COLUMN_NAME]['N']))
+
+        # Unchanged modify (same value and hierarchy): The message counts, the aggregates don't change
+        old_data = record[DYNAMO_NAME].get('OldImage')
+        if old_data is not None and \
+                old_data[VALUE_COLUMN_NAME]['N'] == new_data[VALUE_COLUMN_NAME]['N'] and \
+                old_data[HIERARCHY_COLUMN_NAME]['S'] == new_data[HIERARCHY_COLUMN_NAME]['S']:
+            continue
+
+        leaf_ids.append(new_leaf_id)
+        values.append(float(new_data[VALUE_COLUMN_NAME]['N']))
+
+        # Subtract Old Image
+        if old_data is not None:
+            old_leaf_id = leaf_id_of_image(old_data)
+            if old_leaf_id is None:
+                return None
+
+            leaf_ids.append(old_leaf_id)
+            values.append(- float(old_data[VALUE_COLUMN_NAME]['N']))
+
+    return columns_to_delta(leaf_ids, values, times)
+
+# Aggregate over the decoded messages of records from a Kinesis Stream (Stateless Pipeline)
+def aggregate_over_kinesis_messages(messages):
+
+    leaf_ids = list()
+    values = list()
+    times = list()
+
+    leaf_id_of = HIERARCHY.leaf_id
+
+    for data in messages:
+
+        leaf_id = leaf_id_of(data.hierarchy)
+        if leaf_id is None:
+            return None
+
+        leaf_ids.append(leaf_id)
+        values.append(data.value)
+        times.append(data.timestamp)
+
+    return columns_to_delta(leaf_ids, values, times)
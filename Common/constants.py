@@ -8,6 +8,14 @@ REGION_NAME                     = INSERT_REGION_TOKEN
 # Scenario
 SCENARIO                        = INSERT_SCENARIO_TOKEN
 
+# Boto3 Clients (shared by all Lambdas, see functions.get_client)
+BOTO_MAX_POOL_CONNECTIONS       = 50
+BOTO_TCP_KEEPALIVE              = True
+BOTO_RETRY_MODE                 = 'adaptive'
+BOTO_MAX_ATTEMPTS               = 10
+BOTO_CONNECT_TIMEOUT            = 2
+BOTO_READ_TIMEOUT               = 10
+
 # Kinesis
 KINESIS_NAME                    = 'kinesis'
 KINESIS_STREAM_NAME             = SCENARIO + 'RiskDataStream'
@@ -32,6 +40,12 @@ VALUE_COLUMN_NAME               = 'Value'
 TIMESTAMP_COLUMN_NAME           = 'Timestamp'
 HIERARCHY_COLUMN_NAME           = 'Hierarchy'
 
+# Leaf key of the hierarchy (e.g. 'PV:FXSpot:EMEA') written by StateLambda next to the Hierarchy, with the
+# signature of the AGGREGATION_HIERARCHY it was built for. The map Lambdas use it instead of parsing the
+# Hierarchy, items without it (or built for another AGGREGATION_HIERARCHY) are parsed as before.
+LEAF_KEY_COLUMN_NAME            = 'LeafKey'
+HIERARCHY_SIGNATURE_COLUMN_NAME = 'HierarchySignature'
+
 HIERARCHY_DEFINITION            =  {
                                     'RiskType'  : ['PV', 'Delta'],
                                     'Region'    : ['EMEA', 'APAC', 'AMER'],
@@ -48,6 +62,9 @@ TIMESTAMP_GENERATOR_MEAN        = 'timestamp_generator_mean'
 # General
 GENERATOR_STORAGE_ACTIVE            = True
 
+# Maximum number of trades kept per thread / process for modifies (about 40 bytes each)
+GENERATOR_STATE_MAX_TRADES          = 10000000
+
 # Number of messages per Generator
 THREAD_NUM                          = 4
 NUMBER_OF_BATCHES_PER_THREAD        = 250
@@ -68,8 +85,68 @@ if SPECIAL_TRADES:
     PERCENTAGE_MODIFY               = 1
     PERCENTAGE_OUT_OR_ORDER         = 100
 
+# Producer Engine
+# --> 'threads':   THREAD_NUM threads, one synchronous put_records call per batch of BATCH_SIZE messages
+# --> 'processes': The same number of messages is generated by PROCESS_NUM processes, each packing
+#                  them into put_records calls of PUT_RECORDS_BATCH_SIZE records (Kinesis limit: 500)
+#                  with up to PUT_RECORDS_PIPELINE_DEPTH calls in flight
+PRODUCER_ENGINE                     = 'threads'
+PROCESS_NUM                         = 4
+PUT_RECORDS_BATCH_SIZE              = 500
+PUT_RECORDS_PIPELINE_DEPTH          = 4
+
+# Records rejected by put_records (FailedRecordCount > 0) are resent with exponential backoff
+PUT_RECORDS_MAX_RETRIES             = 10
+PUT_RECORDS_BACKOFF_BASE            = 0.05
+PUT_RECORDS_BACKOFF_MAX             = 2
+
+# Target rate over all threads / processes in messages per second, 0: As fast as possible
+TARGET_RATE                         = 0
+
+# Record Aggregation: Pack up to KINESIS_AGGREGATION_MAX_MESSAGES messages into one Kinesis record (a
+# JSON list of messages), the Lambdas unpack them transparently (functions.kinesis_messages)
+# --> The partition key is one of KINESIS_AGGREGATION_PARTITION_KEYS buckets of the TradeID, so all
+#     versions of a trade go to the same shard in the order they were sent. Concurrent calls
+#     (PUT_RECORDS_PIPELINE_DEPTH > 1) and retries can still reorder them, the version check of the
+#     StateTable resolves that as for any out of order message.
+# --> A put_records call collects KINESIS_AGGREGATION_MAX_MESSAGES times more messages, spread over the
+#     partition keys. Records are packed fuller the more messages a call holds per partition key, keep
+#     KINESIS_AGGREGATION_PARTITION_KEYS at a few times the shard count.
+# --> With a load profile, collected records wait up to KINESIS_AGGREGATION_MAX_BUFFER_TIME seconds
+#     for more messages instead of being sent before every wait (the send delay includes this time)
+KINESIS_AGGREGATION_ACTIVE          = False
+KINESIS_AGGREGATION_MAX_MESSAGES    = 100
+KINESIS_AGGREGATION_PARTITION_KEYS  = 16
+KINESIS_AGGREGATION_MAX_BUFFER_TIME = 0.1
+
+# Load Profile: Open loop arrival rate over all threads / processes (messages per second), replaces
+# TARGET_RATE and NUMBER_OF_BATCHES_PER_THREAD. The producer runs until the profile ends.
+# --> {'type': 'constant', 'rate': 1000, 'duration': 60}
+# --> {'type': 'ramp', 'start_rate': 100, 'end_rate': 5000, 'duration': 120}
+# --> {'type': 'step', 'rates': [500, 1000, 2000, 4000], 'step_duration': 30}
+# --> {'type': 'burst', 'rate': 500, 'burst_rate': 5000, 'period': 30, 'burst_duration': 5,
+#      'duration': 120}
+# --> {'type': 'diurnal', 'rates': [<recorded rate per slot, e.g. 24 hourly values>],
+#      'slot_duration': 10} (replay, linear interpolation between the slots)
+LOAD_PROFILE                        = None
+
+# Seconds between starting the producer and the start of the schedule (time to start the processes)
+LOAD_PROFILE_START_DELAY            = 2
+
+# Rate controlled runs write every send (intended and actual timestamps) and the rate per second
+LOAD_PROFILE_SEND_LOG_FILE          = 'producer_sends.csv'
+LOAD_PROFILE_RATE_LOG_FILE          = 'producer_rates.csv'
+
 # Other
 TIME_INTERVAL_SPEED_CALCULATION     = 3
+
+# clearTables / functions.count_items: Segments of the parallel scans (one thread each, sharing the
+# BOTO_MAX_POOL_CONNECTIONS of the client) and retries of unprocessed deletes (exponential backoff and
+# jitter, in seconds)
+SCAN_SEGMENTS                       = 16
+BATCH_WRITE_MAX_RETRIES             = 10
+BATCH_WRITE_BACKOFF_BASE            = 0.05
+BATCH_WRITE_BACKOFF_MAX             = 2
     
 # --------------------------------------------------------------------------------------------------
 # Aggregation Settings
@@ -78,6 +155,12 @@ TIME_INTERVAL_SPEED_CALCULATION     = 3
 # Definition of the Hierarchy
 AGGREGATION_HIERARCHY = ['RiskType', 'TradeDesk', 'Region']
 
+# Aggregation Engine of the Map Lambdas
+# --> 'dict':     Per-record updates of a dictionary keyed by the hierarchy string
+# --> 'columnar': Batch is decoded into columns and reduced over integer leaf ids (uses numpy if it is
+#                 packaged with the Lambdas, pure Python otherwise). Produces an identical delta.
+AGGREGATION_ENGINE = 'dict'
+
 # --------------------------------------------------------------------------------------------------
 # Lambda Settings
 # --------------------------------------------------------------------------------------------------
@@ -95,10 +178,126 @@ if FAILURES:
     FAILURE_STATELESS_MAP_LAMBDA_PCT    = 0.2
     FAILURE_REDUCE_LAMBDA_PCT           = 2
 
+# Format of the delta messages in the ReduceTable
+# --> 'json':   Sorted JSON text in the string attribute 'Message'
+# --> 'binary': Versioned packed format (hierarchy node ids and float64 values, int64 with
+#               VALUE_FIXED_POINT_DECIMALS) in the binary attribute 'MessageBinary'. Falls back to JSON
+#               for deltas with keys outside of the hierarchy. ReduceLambda reads both formats, deploy
+#               it before switching the map Lambdas.
+DELTA_MESSAGE_FORMAT                    = 'json'
+
+# Fixed-Point Values: With VALUE_FIXED_POINT_DECIMALS = d, the aggregates are integer multiples of 10^-d
+# (2: cents) instead of floats, so they stay exact at any volume. The map Lambdas sum the values of a
+# batch as floats and round the sum of every leaf once, the deltas carry the integers (JSON integers,
+# int64 in the binary format) and ReduceLambda adds them to the AggregateTable as exact decimal strings.
+# --> None: Floats, sums drift by float rounding over long runs
+# --> The rounded sum of a batch is exact while (records per batch) x (sum of |values| of the batch) x
+#     2^-53 stays below half a unit of 10^-d, e.g. for batches of 10000 records of up to 100000 with
+#     d = 2. Values with more than d decimals are rounded to d decimals.
+# --> Every delta records its decimals (FIXED_POINT_DECIMALS_NAME, none: floats), ReduceLambda rescales
+#     deltas written with another setting. Binary fixed-point deltas are version 2, deploy ReduceLambda
+#     before switching the map Lambdas.
+VALUE_FIXED_POINT_DECIMALS              = None
+VALUE_SCALE                             = None if VALUE_FIXED_POINT_DECIMALS is None else \
+                                            10 ** VALUE_FIXED_POINT_DECIMALS
+FIXED_POINT_DECIMALS_NAME               = 'fixed_point_decimals'
+
+# Zero Entries: Map Lambdas drop the entries of a rolled up delta with |value| <= DELTA_ZERO_EPSILON (e.g.
+# a modify within the same leaf that nets to zero), ReduceLambda omits such totals from its transactions.
+# Modifies with an unchanged value and hierarchy (e.g. a new version only) add nothing to a delta.
+# --> 0: Only exact zeros are dropped, the aggregates are exactly the same as with every update written
+# --> > 0: Float residues are dropped as well, every dropped entry changes an aggregate by at most
+#     DELTA_ZERO_EPSILON (with VALUE_FIXED_POINT_DECIMALS = d in units of 10^-d)
+DELTA_ZERO_EPSILON                      = 0
+
+# Decoding of the Kinesis messages into trade records (see trade_record.py)
+# --> 'auto':    Fastest backend packaged with the Lambda (msgspec, orjson, json)
+# --> 'msgspec': Typed decoding straight into slotted records (needs msgspec in the Lambda package)
+# --> 'orjson':  Fast decoding into dictionaries (needs orjson in the Lambda package)
+# --> 'json':    Standard library
+MESSAGE_DECODER                         = 'auto'
+
+# Map Combiner: Combine the deltas of all invocations within a tumbling window of the map event source
+# mapping (set TumblingWindowInSeconds > 0 in the CloudFormation template) into one ReduceTable item.
+# The window is flushed early once it holds MAP_COMBINER_MAX_MESSAGES messages.
+MAP_COMBINER_ACTIVE                     = False
+MAP_COMBINER_MAX_MESSAGES               = 10000
+
+# Sharded Reduce: Number of ReduceLambda partitions. Every aggregate key is owned by exactly one
+# partition, chosen by a stable hash of the top level of the hierarchy. message_count is always reduced
+# by partition 0.
+# --> functions.partition_of_key hashes the top level only: The current hierarchy (RiskType: PV, Delta)
+#     has 2 top level values, so at most 2 partitions receive keys, further partitions stay idle.
+# --> Partition 0 writes to DELTA_TABLE_NAME, partition p > 0 to DELTA_TABLE_NAME + str(p). Deploy the
+#     stack with the parameter ReducerCount equal to REDUCER_COUNT: It creates the additional
+#     ReduceTables with their streams and event source mappings and sets ReservedConcurrentExecutions
+#     of ReduceLambda to the number of partitions.
+REDUCER_COUNT                           = 1
+
+# ReduceLambda: Aggregates are written in transactions of at most this many items (DynamoDB limit: 100),
+# independent transactions are submitted concurrently
+REDUCE_TRANSACTION_MAX_ITEMS            = 100
+REDUCE_TRANSACTION_THREADS              = 4
+
+# Aggregate Snapshot: ReduceLambda also keeps the complete aggregates of its partition as a versioned
+# JSON snapshot in the AggregateTable (see functions.read_snapshot), committed together with the updates
+# --> Readers get a consistent view with one GetItem per reducer partition (TransactGetItems if the
+#     snapshot is split into several items of at most SNAPSHOT_MAX_SHARD_BYTES)
+# --> The snapshot item names start with SNAPSHOT_KEY_PREFIX, readers of the aggregates skip them
+# --> All shards must fit into one transaction (4 MB): SNAPSHOT_MAX_SHARDS * SNAPSHOT_MAX_SHARD_BYTES
+#     stays below it, a larger snapshot fails with an exception (increase REDUCER_COUNT)
+SNAPSHOT_ACTIVE                         = False
+SNAPSHOT_KEY_PREFIX                     = 'snapshot#'
+SNAPSHOT_MAX_SHARD_BYTES                = 300000
+SNAPSHOT_MAX_SHARDS                     = 12
+SNAPSHOT_APPLIED_BATCHES                = 100
+
+# Latency Sketches: The map Lambdas record the latency of every new message since its generation per
+# hierarchy leaf in a mergeable sketch (see latency_sketch.py) carried in the delta messages.
+# ReduceLambda shifts the sketches to the time it reduces them and adds their bucket counts to the items
+# LATENCY_KEY_PREFIX + leaf of the AggregateTable. p50 / p99 / p99.9 of the generator-to-aggregate
+# latency per leaf (or per node, by merging its leafs) follow without storing single messages.
+# --> Deploy ReduceLambda before activating the sketches in the map Lambdas
+LATENCY_SKETCH_ACTIVE                   = False
+LATENCY_SKETCH_NAME                     = 'latency_sketch'
+LATENCY_SKETCH_RELATIVE_ACCURACY        = 0.01
+LATENCY_KEY_PREFIX                      = 'latency#'
+
+# StateLambda: Maximum number of concurrent conditional writes to the StateTable per invocation
+STATE_LAMBDA_WRITE_THREADS              = 10
+
+# Stage Timing: Every handler times its stages (decode, aggregate, rollup, serialize, hash, write, ...)
+# with stage_timer.StageTimer, prints them and reports them as <lambda>_<stage>_ms to the tracker.
+# A share of PROFILING_SAMPLE_RATE (0 to 1) of the invocations is profiled in addition with cProfile and,
+# with PROFILING_TRACE_MEMORY, tracemalloc. The top PROFILING_TOP_ENTRIES entries are printed to the log.
+# --> Profiling slows the sampled invocations down, keep the rate low outside of tests
+PROFILING_SAMPLE_RATE                   = 0
+PROFILING_TRACE_MEMORY                  = True
+PROFILING_TOP_ENTRIES                   = 20
+
+# --------------------------------------------------------------------------------------------------
+# Frontend Settings
+# --------------------------------------------------------------------------------------------------
+
+# Seconds between two refreshes of the frontend
+FRONTEND_REFRESH_INTERVAL               = 0.5
+
+# Source of the changes of the AggregateTable
+# --> 'stream': Keys on the stream of the AggregateTable (StreamViewType KEYS_ONLY), only the changed
+#               items are read (BatchGetItem). Uses 'scan' if the table has no stream.
+# --> 'scan':   Consistent scan of the full table (all pages) on every refresh
+# --> 'snapshot': Snapshots written by ReduceLambda (SNAPSHOT_ACTIVE), one GetItem per reducer partition
+FRONTEND_CHANGE_SOURCE                  = 'stream'
+
 # --------------------------------------------------------------------------------------------------
 # Grafana / InfluxDB / Performance Tracker Settings
 # --------------------------------------------------------------------------------------------------
 
 TRACK_PERFORMANCE                       = False
+
+# Metrics connector (performance_tracker.PerformanceTrackerInitializer), flushed by a background thread
+# --> 'influxdb <port> <database> <measurement>': InfluxDB on GRAFANA_INSTANCE_IP
+# --> 'emf <namespace>': CloudWatch Embedded Metric Format on stdout, no network call from the Lambdas
+# Every sample carries metrics_overhead_ms, the time the tracker took in the previous invocation(s).
 # INFLUX_CONNECTION_STRING                = '<Enter Connection String>'
 # GRAFANA_INSTANCE_IP                      = '<Enter Instance IP>'
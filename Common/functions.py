@@ -9,9 +9,26 @@
 import random
 import json
 import base64
+import binascii
+import zlib
+import time
+import struct
+import hashlib
+import decimal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# AWS Imports
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 # Project Imports
 from constants import *
+from hierarchy import HIERARCHY
+import columnar_aggregation
+import latency_sketch
+import trade_record
 
 # --------------------------------------------------------------------------------------------------
 # Generic Helper Functions
@@ -45,6 +62,38 @@ def print_progress_bar(progress, speed = None):
 # AWS Helper Functions
 # --------------------------------------------------------------------------------------------------
 
+# Clients are cached per service and endpoint for the lifetime of a (warm) container
+# --> Created under a lock: Threads asking for the same client at once share one (boto3 doesn't document
+#     client creation on the default session as thread-safe)
+boto3_clients = dict()
+boto3_clients_lock = threading.Lock()
+
+# Botocore Config for all clients, tuned via constants.py
+def boto3_config():
+    return Config(
+        region_name             = REGION_NAME,
+        max_pool_connections    = BOTO_MAX_POOL_CONNECTIONS,
+        tcp_keepalive           = BOTO_TCP_KEEPALIVE,
+        connect_timeout         = BOTO_CONNECT_TIMEOUT,
+        read_timeout            = BOTO_READ_TIMEOUT,
+        retries                 = {
+                                    'mode':         BOTO_RETRY_MODE,
+                                    'max_attempts': BOTO_MAX_ATTEMPTS
+                                }
+    )
+
+# Get a boto3 client, create it on first use and reuse it afterwards
+def get_client(service_name, endpoint_url = None):
+    key = (service_name, endpoint_url)
+    client = boto3_clients.get(key)
+    if client is None:
+        with boto3_clients_lock:
+            client = boto3_clients.get(key)
+            if client is None:
+                client = boto3.client(service_name, endpoint_url = endpoint_url, config = boto3_config())
+                boto3_clients[key] = client
+    return client
+
 # Get item from a DynamoDB Table, if it exists, return None otherwise
 def get_item_ddb(table, key_name, strong_consistency = False):
     
@@ -62,28 +111,453 @@ def get_item_ddb(table, key_name, strong_consistency = False):
    
     return item
 
-# Count number of items in DynamoDB Table
-def count_items(table):
-    
-    item_count = 0
-    scan_args = dict()
-    done = False
-    start_key = None
-    i = 0
-    
-    while not done:
-        # Scan
-        if start_key:
-            scan_args['ExclusiveStartKey'] = start_key
-        response = table.scan(**scan_args)
-        start_key = response.get('LastEvaluatedKey', None)
-        done = start_key is None
-    
-        # Get Items
-        items = response.get('Items', [])
-        item_count += len(items)
-    
-    return item_count
+# Fingerprint of a batch of stream records, built from the identity of the records only
+# --> Kinesis and DynamoDB stream eventIDs are unique per record (Kinesis: shard id and sequence
+#     number), the source ARN distinguishes streams. Cost is O(records), independent of the payload.
+def batch_fingerprint(records, hash_function = hashlib.sha256):
+    fingerprint = hash_function()
+    if records:
+        fingerprint.update(records[0].get('eventSourceARN', '').encode())
+    for record in records:
+        fingerprint.update(b'|')
+        fingerprint.update(record['eventID'].encode())
+    return fingerprint.hexdigest()
+
+# Name of the ReduceTable of a reducer partition
+def delta_table_name(partition):
+    if partition == 0:
+        return DELTA_TABLE_NAME
+    return DELTA_TABLE_NAME + str(partition)
+
+# Binary Delta Message Format, Version 1 (little endian):
+# --> Header: format version (uint8), flags (uint8, which of the optional fields are present),
+#             hierarchy signature (uint32), message count, first and mean timestamp (float64 each),
+#             number of entries (uint32)
+# --> Body:   node ids of the compiled hierarchy (uint32 each), followed by the values (float64 each)
+# --> Latency sketches (optional, flag bit 3): reference time (float64), number of entries (uint32),
+#     leaf node ids (uint32 each), buckets (uint16 each), counts (uint32 each)
+# Version 2 (fixed-point values, VALUE_FIXED_POINT_DECIMALS): The decimals of the values (uint8) follow
+# the flags, the values are int64. Float deltas are still written as version 1.
+DELTA_BINARY_VERSION        = 1
+DELTA_BINARY_HEADER         = struct.Struct('<BBIdddI')
+DELTA_BINARY_FIXED_VERSION  = 2
+DELTA_BINARY_FIXED_HEADER   = struct.Struct('<BBBIdddI')
+DELTA_BINARY_FIELDS         = [MESSAGE_COUNT_NAME, TIMESTAMP_GENERATOR_FIRST, TIMESTAMP_GENERATOR_MEAN]
+DELTA_BINARY_SKETCH_FLAG    = 1 << len(DELTA_BINARY_FIELDS)
+DELTA_BINARY_SKETCH_HEADER  = struct.Struct('<dI')
+
+# Encode a delta to the binary format, None if it contains keys that are not hierarchy nodes
+def encode_delta(delta):
+
+    node_ids = list()
+    values = list()
+    for key, value in delta.items():
+        node_id = HIERARCHY.node_ids.get(key)
+        if node_id is not None:
+            node_ids.append(node_id)
+            values.append(value)
+        elif key not in DELTA_BINARY_FIELDS and key != LATENCY_SKETCH_NAME:
+            return None
+
+    flags = 0
+    fields = list()
+    for i, key in enumerate(DELTA_BINARY_FIELDS):
+        if key in delta:
+            flags |= 1 << i
+        fields.append(delta.get(key, 0))
+
+    sketch_section = b''
+    if LATENCY_SKETCH_NAME in delta:
+        flags |= DELTA_BINARY_SKETCH_FLAG
+        sketch_section = encode_latency_sketches(delta[LATENCY_SKETCH_NAME])
+        if sketch_section is None:
+            return None
+
+    # Fixed-point values as int64 (version 2)
+    entry_count = len(node_ids)
+    if VALUE_FIXED_POINT_DECIMALS is None:
+        header = DELTA_BINARY_HEADER.pack(DELTA_BINARY_VERSION, flags, HIERARCHY.signature, *fields,
+            entry_count)
+        value_format = 'd'
+    else:
+        header = DELTA_BINARY_FIXED_HEADER.pack(DELTA_BINARY_FIXED_VERSION, flags,
+            VALUE_FIXED_POINT_DECIMALS, HIERARCHY.signature, *fields, entry_count)
+        value_format = 'q'
+
+    return header + struct.pack('<%dI%d%s' % (entry_count, entry_count, value_format), *node_ids,
+        *values) + sketch_section
+
+# Encode the latency sketches of a delta, None if a leaf is not part of the hierarchy
+def encode_latency_sketches(sketches):
+
+    leaf_ids = list()
+    buckets = list()
+    counts = list()
+    for leaf_key, sketch in sketches['Leaves'].items():
+        leaf_id = HIERARCHY.node_ids.get(leaf_key)
+        if leaf_id is None:
+            return None
+        for bucket, count in sketch.items():
+            leaf_ids.append(leaf_id)
+            buckets.append(bucket)
+            counts.append(count)
+
+    entry_count = len(leaf_ids)
+    return DELTA_BINARY_SKETCH_HEADER.pack(sketches['Reference'], entry_count) + \
+        struct.pack('<%dI%dH%dI' % (entry_count, entry_count, entry_count), *leaf_ids, *buckets, *counts)
+
+# Decode a delta from the binary format: (delta, decimals of its values, None for floats)
+def decode_delta(data):
+
+    decimals = None
+    if data[0] == DELTA_BINARY_VERSION:
+        header_size = DELTA_BINARY_HEADER.size
+        version, flags, signature, *fields, entry_count = DELTA_BINARY_HEADER.unpack_from(data)
+    elif data[0] == DELTA_BINARY_FIXED_VERSION:
+        header_size = DELTA_BINARY_FIXED_HEADER.size
+        version, flags, decimals, signature, *fields, entry_count = \
+            DELTA_BINARY_FIXED_HEADER.unpack_from(data)
+    else:
+        raise Exception('Unsupported delta message version ' + str(data[0]) + '.')
+    if signature != HIERARCHY.signature:
+        raise Exception('Delta message was encoded with a different hierarchy definition.')
+
+    entries_format = '<%dI%d%s' % (entry_count, entry_count, 'd' if decimals is None else 'q')
+    entries = struct.unpack_from(entries_format, data, header_size)
+
+    node_keys = HIERARCHY.node_keys
+    delta = {node_keys[node_id]: value
+        for node_id, value in zip(entries[:entry_count], entries[entry_count:])}
+
+    for i, key in enumerate(DELTA_BINARY_FIELDS):
+        if flags & (1 << i):
+            delta[key] = fields[i]
+    if MESSAGE_COUNT_NAME in delta:
+        delta[MESSAGE_COUNT_NAME] = int(delta[MESSAGE_COUNT_NAME])
+
+    if flags & DELTA_BINARY_SKETCH_FLAG:
+        offset = header_size + struct.calcsize(entries_format)
+        reference, sketch_entry_count = DELTA_BINARY_SKETCH_HEADER.unpack_from(data, offset)
+        sketch_entries = struct.unpack_from('<%dI%dH%dI' % ((sketch_entry_count,) * 3), data,
+            offset + DELTA_BINARY_SKETCH_HEADER.size)
+
+        leaves = dict()
+        for i in range(sketch_entry_count):
+            leaf_sketch = leaves.setdefault(node_keys[sketch_entries[i]], dict())
+            leaf_sketch[sketch_entries[sketch_entry_count + i]] = \
+                sketch_entries[2 * sketch_entry_count + i]
+        delta[LATENCY_SKETCH_NAME] = {'Reference': reference, 'Leaves': leaves}
+
+    return delta, decimals
+
+# Load a delta from its JSON text (JSON turns the buckets of the latency sketches into strings)
+def delta_from_json(text):
+    delta = json.loads(text)
+    if LATENCY_SKETCH_NAME in delta:
+        for leaf_key, sketch in delta[LATENCY_SKETCH_NAME]['Leaves'].items():
+            delta[LATENCY_SKETCH_NAME]['Leaves'][leaf_key] = \
+                {int(bucket): count for bucket, count in sketch.items()}
+    return delta
+
+# Load the delta of a ReduceTable item image from a DynamoDB stream, in either format
+# --> The values are rescaled from the decimals the delta was written with to VALUE_FIXED_POINT_DECIMALS
+def delta_from_image(image):
+    if 'MessageBinary' in image:
+        delta, decimals = decode_delta(base64.b64decode(image['MessageBinary']['B']))
+    else:
+        delta = delta_from_json(image['Message']['S'].replace("'",'"'))
+        decimals = delta.pop(FIXED_POINT_DECIMALS_NAME, None)
+    return rescale_values(delta, decimals, VALUE_FIXED_POINT_DECIMALS)
+
+# Write a delta to the ReduceTable(s), one conditional put per reducer partition
+# --> Returns the number of partitions written (0 if the batch had been written before)
+def write_delta(ddb_client, delta, message_hash):
+    return write_delta_messages(ddb_client, delta_messages(delta), message_hash)
+
+# Serialize a delta: Message attribute of the ReduceTable item per reducer partition
+def delta_messages(delta):
+
+    partition_messages = dict()
+
+    for partition, partition_delta in split_delta(delta).items():
+
+        # Create Message (JSON as fallback for deltas that can't be encoded)
+        message = None
+        if DELTA_MESSAGE_FORMAT == 'binary':
+            message = encode_delta(partition_delta)
+
+        # Fixed-point deltas record their decimals
+        if message is not None:
+            partition_messages[partition] = {'MessageBinary': {'B': message}}
+        else:
+            if VALUE_FIXED_POINT_DECIMALS is not None:
+                partition_delta = dict(partition_delta)
+                partition_delta[FIXED_POINT_DECIMALS_NAME] = VALUE_FIXED_POINT_DECIMALS
+            partition_messages[partition] = {'Message': {'S': json.dumps(partition_delta, sort_keys = True)}}
+
+    return partition_messages
+
+# Write serialized deltas (see delta_messages) to the ReduceTable(s)
+# --> We use a conditional put based on the hash of the record list to ensure
+#     we're not accidentally writing one batch twice.
+# --> Returns the number of partitions written (0 if the batch had been written before)
+def write_delta_messages(ddb_client, partition_messages, message_hash):
+
+    written_partition_count = 0
+
+    for partition, message_attribute in partition_messages.items():
+
+        try:
+            ddb_client.put_item(
+                TableName = delta_table_name(partition),
+                Item={
+                    DELTA_TABLE_KEY: {'S': message_hash},
+                    **message_attribute
+                    },
+                ConditionExpression='attribute_not_exists(' + DELTA_TABLE_KEY + ')'
+                )
+            written_partition_count += 1
+        except ClientError as e:
+            if e.response['Error']['Code']=='ConditionalCheckFailedException':
+                print('Conditional Put failed. Item with MessageHash ' + message_hash + \
+                    ' already exists in ' + delta_table_name(partition) + '.')
+                print('Item:', list(message_attribute.values())[0])
+                print('Full Exception: ' + str(e) + '.')
+            else:
+                raise Exception(e)
+
+    return written_partition_count
+
+# Write TransactWriteItems entries in chunks of REDUCE_TRANSACTION_MAX_ITEMS independent transactions
+# --> Every chunk has a deterministic ClientRequestToken derived from the batch fingerprint and the
+#     chunk index. A retry submits exactly the same transactions, which DynamoDB applies only once.
+# --> Returns the number of chunks applied by this call and the total number of chunks
+def transact_write_chunked(ddb_client, transact_items, batch_fingerprint):
+
+    chunks = [transact_items[i:i + REDUCE_TRANSACTION_MAX_ITEMS]
+        for i in range(0, len(transact_items), REDUCE_TRANSACTION_MAX_ITEMS)]
+
+    def write_chunk(chunk_index):
+        token = hashlib.md5((batch_fingerprint + ':' + str(chunk_index)).encode()).hexdigest()
+        try:
+            ddb_client.transact_write_items(
+                TransactItems = chunks[chunk_index],
+                ClientRequestToken = token
+            )
+        except ClientError as e:
+            if e.response['Error']['Code']=='IdempotentParameterMismatchException':
+                print('Transaction ' + str(chunk_index) + ' was already processed. Skipping this one.')
+                return False
+            else:
+                raise Exception(e)
+        return True
+
+    if len(chunks) == 1:
+        results = [write_chunk(0)]
+    else:
+        with ThreadPoolExecutor(max_workers = REDUCE_TRANSACTION_THREADS) as executor:
+            results = list(executor.map(write_chunk, range(len(chunks))))
+
+    return results.count(True), len(chunks)
+
+# Aggregate Snapshot: The complete aggregates of a reducer partition as JSON in the AggregateTable
+# --> Items SNAPSHOT_KEY_PREFIX + '<partition>#<shard>'. Every key is stored in the shard of its hash,
+#     the ShardCount (at most SNAPSHOT_MAX_SHARDS) only grows when a shard would exceed
+#     SNAPSHOT_MAX_SHARD_BYTES, so a batch only rewrites the shards of the keys it changes.
+# --> Shard 0 is written with every version: It carries the Version, the ShardCount and the fingerprints
+#     of the last SNAPSHOT_APPLIED_BATCHES batches, written in the same transaction as their updates.
+#     A batch found there is not applied again.
+def snapshot_key(partition, shard):
+    return SNAPSHOT_KEY_PREFIX + str(partition) + '#' + str(shard)
+
+# Shard of a key in a snapshot of shard_count shards
+def snapshot_shard_of(key, shard_count):
+    return zlib.crc32(key.encode()) % shard_count
+
+# Snapshot and latency sketch items share the AggregateTable with the aggregates
+def is_metadata_key(key):
+    return key.startswith(SNAPSHOT_KEY_PREFIX) or key.startswith(LATENCY_KEY_PREFIX)
+
+# Reducer partition of a batch of records from a ReduceTable stream
+def delta_table_partition(event_source_arn):
+    table_name = event_source_arn.split(':table/', 1)[1].split('/', 1)[0]
+    suffix = table_name[len(DELTA_TABLE_NAME):]
+    return int(suffix) if suffix else 0
+
+# Read the snapshot of a reducer partition: (version, aggregates, applied batches, shard count)
+# --> One GetItem for a single shard, a TransactGetItems of all shards otherwise (all shards as of one
+#     commit, never a mix of two). Version 0: No snapshot written so far.
+def read_snapshot(ddb_client, partition = 0):
+
+    def item_key(shard):
+        return {AGGREGATE_TABLE_KEY: {'S': snapshot_key(partition, shard)}}
+
+    response = ddb_client.get_item(TableName = AGGREGATE_TABLE_NAME, Key = item_key(0),
+        ConsistentRead = True)
+    if 'Item' not in response:
+        return 0, dict(), [], 1
+    items = [response['Item']]
+
+    shard_count = int(items[0]['ShardCount']['N'])
+    if shard_count > 1:
+        response = ddb_client.transact_get_items(TransactItems = [
+            {'Get': {'TableName': AGGREGATE_TABLE_NAME, 'Key': item_key(shard)}}
+            for shard in range(shard_count)])
+        items = [entry['Item'] for entry in response['Responses']]
+        if int(items[0]['ShardCount']['N']) != shard_count:
+            return read_snapshot(ddb_client, partition)
+
+    aggregates = dict()
+    for item in items:
+        aggregates.update(json.loads(item['Data']['S']))
+    applied_batches = [entry['S'] for entry in items[0].get('AppliedBatches', {'L': []})['L']]
+
+    # Values in the type the Lambdas accumulate (snapshots store fixed-point values as integers)
+    stored_decimals = items[0].get('FixedPointDecimals')
+    aggregates = rescale_values(aggregates, stored_decimals and int(stored_decimals['N']),
+        VALUE_FIXED_POINT_DECIMALS)
+
+    return int(items[0][VERSION_COLUMN_NAME]['N']), aggregates, applied_batches, shard_count
+
+# Read the snapshots of all reducer partitions and combine them: (versions, aggregates as floats)
+def read_snapshots(ddb_client):
+    versions = list()
+    aggregates = dict()
+    for partition in range(REDUCER_COUNT):
+        version, partition_aggregates, _, _ = read_snapshot(ddb_client, partition)
+        versions.append(version)
+        aggregates.update(partition_aggregates)
+    return versions, rescale_values(aggregates, VALUE_FIXED_POINT_DECIMALS, None)
+
+# Split the aggregates into shards by the hash of their keys, with at least shard_count shards
+# --> Returns (shards, shard count), raises an exception if SNAPSHOT_MAX_SHARDS are not enough: More
+#     shards would not fit into one transaction (100 items, 4 MB), the stream would be blocked forever
+def snapshot_shards(partition, aggregates, shard_count):
+
+    entry_bytes = {key: len(json.dumps(key)) + len(json.dumps(value)) + 2
+        for key, value in aggregates.items()}
+
+    while shard_count <= SNAPSHOT_MAX_SHARDS:
+        shard_bytes = [0] * shard_count
+        for key, size in entry_bytes.items():
+            shard_bytes[snapshot_shard_of(key, shard_count)] += size
+        if max(shard_bytes) <= SNAPSHOT_MAX_SHARD_BYTES:
+            shards = [dict() for shard in range(shard_count)]
+            for key, value in aggregates.items():
+                shards[snapshot_shard_of(key, shard_count)][key] = value
+            return shards, shard_count
+        shard_count += 1
+
+    raise Exception('Snapshot of reducer partition ' + str(partition) + ' (' +
+        str(sum(entry_bytes.values())) + ' bytes) does not fit into ' + str(SNAPSHOT_MAX_SHARDS) +
+        ' shards of ' + str(SNAPSHOT_MAX_SHARD_BYTES) + ' bytes. Increase REDUCER_COUNT or ' +
+        'deactivate SNAPSHOT_ACTIVE.')
+
+# Put entries of a new snapshot version: Shard 0 and the shards of the changed keys (all shards if
+# the shard count grows), shard 0 is conditioned on the version that was read
+def snapshot_transact_items(partition, version, aggregates, applied_batches, shard_count,
+    changed_keys):
+
+    shards, new_shard_count = snapshot_shards(partition, aggregates, shard_count)
+    if new_shard_count == shard_count and version > 0:
+        written_shards = sorted({0} | {snapshot_shard_of(key, shard_count) for key in changed_keys})
+    else:
+        written_shards = range(new_shard_count)
+
+    transact_items = list()
+    for shard in written_shards:
+        item = {
+            AGGREGATE_TABLE_KEY:    {'S': snapshot_key(partition, shard)},
+            VERSION_COLUMN_NAME:    {'N': str(version + 1)},
+            'ShardCount':           {'N': str(new_shard_count)},
+            'Data':                 {'S': json.dumps(shards[shard], sort_keys = True)}
+        }
+        put = {'TableName': AGGREGATE_TABLE_NAME, 'Item': item}
+
+        if shard == 0:
+            item['AppliedBatches'] = {'L': [{'S': fingerprint}
+                for fingerprint in applied_batches[-SNAPSHOT_APPLIED_BATCHES:]]}
+            if VALUE_FIXED_POINT_DECIMALS is not None:
+                item['FixedPointDecimals'] = {'N': str(VALUE_FIXED_POINT_DECIMALS)}
+            if version == 0:
+                put['ConditionExpression'] = 'attribute_not_exists(#key)'
+                put['ExpressionAttributeNames'] = {'#key': AGGREGATE_TABLE_KEY}
+            else:
+                put['ConditionExpression'] = '#ver = :ver'
+                put['ExpressionAttributeNames'] = {'#ver': VERSION_COLUMN_NAME}
+                put['ExpressionAttributeValues'] = {':ver': {'N': str(version)}}
+
+        transact_items.append({'Put': put})
+
+    return transact_items
+
+# Write the updates of a batch together with the next version of the snapshot of its partition
+# --> If updates and snapshot fit into one transaction, both are committed atomically.
+# --> Otherwise (more than REDUCE_TRANSACTION_MAX_ITEMS items) the commit is NOT atomic: The update
+#     chunks are written first (transact_write_chunked) and the snapshot last. Readers of the snapshot
+#     only ever see completed batches, readers of the aggregate items can see the updates of a batch
+#     before its snapshot. If the snapshot commit fails, the retried batch submits the same chunk
+#     tokens, which DynamoDB only deduplicates within the 10 minutes a ClientRequestToken is valid.
+# --> A concurrent writer fails the version condition, the batch is retried from the start.
+# --> Returns the number of transactions applied by this call and the total number of transactions
+def transact_write_with_snapshot(ddb_client, transact_items, batch_fingerprint, partition, totals):
+
+    version, aggregates, applied_batches, shard_count = read_snapshot(ddb_client, partition)
+    if batch_fingerprint in applied_batches:
+        return 0, 1
+
+    for key, value in totals.items():
+        dict_entry_add(aggregates, key, value)
+    snapshot_items = snapshot_transact_items(partition, version, aggregates,
+        applied_batches + [batch_fingerprint], shard_count, totals.keys())
+
+    if len(transact_items) + len(snapshot_items) <= REDUCE_TRANSACTION_MAX_ITEMS:
+        commit_items = transact_items + snapshot_items
+        applied_chunk_count, chunk_count = 0, 0
+    else:
+        commit_items = snapshot_items
+        applied_chunk_count, chunk_count = \
+            transact_write_chunked(ddb_client, transact_items, batch_fingerprint)
+
+    # The token covers a retry of this exact commit (same fingerprint and version)
+    token = hashlib.md5((batch_fingerprint + ':snapshot:' + str(version)).encode()).hexdigest()
+    try:
+        ddb_client.transact_write_items(TransactItems = commit_items, ClientRequestToken = token)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'IdempotentParameterMismatchException':
+            raise Exception(e)
+        print('Snapshot version ' + str(version + 1) + ' was already written. Skipping this one.')
+        return applied_chunk_count, chunk_count + 1
+
+    return applied_chunk_count + 1, chunk_count + 1
+
+# Parallel scan of a DynamoDB Table: Calls segment_function(segment) for every one of SCAN_SEGMENTS
+# segments in a pool of as many threads and returns the results in order of the segments
+def parallel_scan(segment_function, segments = None):
+    segments = segments or SCAN_SEGMENTS
+    with ThreadPoolExecutor(max_workers = segments) as executor:
+        return list(executor.map(segment_function, range(segments)))
+
+# All pages of one segment of a scan (scan_args are passed to every call)
+def scan_segment_pages(ddb_client, segment, segments, **scan_args):
+    scan_args.update({'Segment': segment, 'TotalSegments': segments})
+    while True:
+        response = ddb_client.scan(**scan_args)
+        yield response
+        if 'LastEvaluatedKey' not in response:
+            return
+        scan_args['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+# Count number of items in DynamoDB Table (boto3 Table resource), parallel scan with Select COUNT
+def count_items(table, segments = None):
+    segments = segments or SCAN_SEGMENTS
+    ddb_client = get_client(DYNAMO_NAME)
+
+    def count_segment(segment):
+        return sum(response['Count'] for response in scan_segment_pages(ddb_client, segment,
+            segments, TableName = table.name, Select = 'COUNT'))
+
+    return sum(parallel_scan(count_segment, segments))
 
 # --------------------------------------------------------------------------------------------------
 # Aggregation & Generator Helper Functions
@@ -114,24 +588,265 @@ def hierarchy_to_string (hierarchy_dictionary, aggregation_hierarchy):
         type_string += hierarchy_dictionary[level]
     return type_string
 
+# Leaf key of a StateTable image
+# --> The LeafKey attribute written by StateLambda if it matches the levels of AGGREGATION_HIERARCHY,
+#     otherwise (items written before, or for other levels) built from the JSON of the Hierarchy
+def leaf_key_of_image(image):
+    leaf_key = image.get(LEAF_KEY_COLUMN_NAME)
+    if leaf_key is not None and \
+            image[HIERARCHY_SIGNATURE_COLUMN_NAME]['N'] == HIERARCHY.level_signature:
+        return leaf_key['S']
+    return hierarchy_to_string(json.loads(image[HIERARCHY_COLUMN_NAME]['S']), AGGREGATION_HIERARCHY)
+
+# Modify of a StateTable item that leaves all aggregates unchanged: Same value and same hierarchy
+# (StateLambda writes the hierarchy as sorted JSON, so equal hierarchies have equal strings)
+def is_unchanged_modify(record):
+    if 'OldImage' not in record[DYNAMO_NAME]:
+        return False
+    new_data = record[DYNAMO_NAME]['NewImage']
+    old_data = record[DYNAMO_NAME]['OldImage']
+    return new_data[VALUE_COLUMN_NAME]['N'] == old_data[VALUE_COLUMN_NAME]['N'] and \
+        new_data[HIERARCHY_COLUMN_NAME]['S'] == old_data[HIERARCHY_COLUMN_NAME]['S']
+
+# Entries of a delta that aren't values of a hierarchy node
+DELTA_METADATA_KEYS = (MESSAGE_COUNT_NAME, TIMESTAMP_GENERATOR_FIRST, TIMESTAMP_GENERATOR_MEAN,
+    LATENCY_SKETCH_NAME)
+
+# Remove the entries of a delta that don't change any aggregate: |value| <= DELTA_ZERO_EPSILON
+# --> Message count, timestamps and latency sketches are kept
+# --> Returns the number of removed entries
+def drop_zero_entries(delta):
+    zero_keys = [key for key, value in delta.items() if key not in DELTA_METADATA_KEYS and \
+        abs(value) <= DELTA_ZERO_EPSILON]
+    for key in zero_keys:
+        del delta[key]
+    return len(zero_keys)
+
+# Fixed-point values of the delta of a batch: The map Lambdas sum the values of a batch as floats and
+# round the sum of every leaf once (see VALUE_FIXED_POINT_DECIMALS)
+def fixed_point_leaves(delta):
+    if VALUE_SCALE is not None:
+        for key, value in delta.items():
+            if key not in DELTA_METADATA_KEYS:
+                delta[key] = round(value * VALUE_SCALE)
+    return delta
+
+# Rescale the values of aggregates or of a delta between two settings of VALUE_FIXED_POINT_DECIMALS
+# (None: floats)
+# --> Message count, timestamps and latency sketches aren't scaled
+# --> Between two fixed-point settings the integers are rescaled exactly (half to even when decimals
+#     are dropped)
+def rescale_values(aggregates, from_decimals, to_decimals):
+    if from_decimals == to_decimals:
+        return aggregates
+    for key, value in aggregates.items():
+        if key in DELTA_METADATA_KEYS:
+            continue
+        if from_decimals is None:
+            value = round(value * 10 ** to_decimals)
+        elif to_decimals is None:
+            value = value / 10 ** from_decimals
+        else:
+            value = int(decimal.Decimal(value).scaleb(to_decimals - from_decimals).to_integral_value())
+        aggregates[key] = value
+    return aggregates
+
+# DynamoDB number of an aggregate: Fixed-point values as exact decimal strings
+def aggregate_number_string(key, value):
+    if VALUE_SCALE is None or key == MESSAGE_COUNT_NAME:
+        return str(value)
+    return str(decimal.Decimal(value).scaleb(- VALUE_FIXED_POINT_DECIMALS))
+
+# Merge a delta into another one (message counts and values are added, timestamps are combined)
+def merge_deltas(target, delta):
+
+    # Mean timestamp, weighted by the number of messages of both deltas
+    if TIMESTAMP_GENERATOR_MEAN in target and TIMESTAMP_GENERATOR_MEAN in delta:
+        target_count = target.get(MESSAGE_COUNT_NAME, 0)
+        delta_count = delta.get(MESSAGE_COUNT_NAME, 0)
+        target[TIMESTAMP_GENERATOR_MEAN] = (target[TIMESTAMP_GENERATOR_MEAN] * target_count + \
+            delta[TIMESTAMP_GENERATOR_MEAN] * delta_count) / max(1, target_count + delta_count)
+    elif TIMESTAMP_GENERATOR_MEAN in delta:
+        target[TIMESTAMP_GENERATOR_MEAN] = delta[TIMESTAMP_GENERATOR_MEAN]
+
+    for key, value in delta.items():
+        if key == TIMESTAMP_GENERATOR_FIRST:
+            dict_entry_min(target, key, value)
+        elif key == LATENCY_SKETCH_NAME:
+            target[key] = merge_latency_sketches(target.get(key), value)
+        elif key != TIMESTAMP_GENERATOR_MEAN:
+            dict_entry_add(target, key, value)
+
+    return target
+
+# Merge the latency sketches of two deltas
+# --> The sketches hold the latencies up to their reference time. The merged sketches refer to the
+#     later of both, the sketches of the earlier one are shifted by the difference.
+def merge_latency_sketches(target, sketches):
+
+    if target is None:
+        target = {'Reference': sketches['Reference'], 'Leaves': dict()}
+
+    reference = max(target['Reference'], sketches['Reference'])
+    leaves = dict()
+    for source in (target, sketches):
+        offset_ms = (reference - source['Reference']) * 1000
+        for leaf_key, sketch in source['Leaves'].items():
+            latency_sketch.merge(leaves.setdefault(leaf_key, dict()),
+                latency_sketch.shift(sketch, offset_ms))
+
+    return {'Reference': reference, 'Leaves': leaves}
+
+# Add the latency sketches of a batch to its delta (LATENCY_SKETCH_ACTIVE)
+# --> leaf_times: (leaf key, generator timestamp) of every new message, consumed only if active
+def add_latency_sketches(delta, leaf_times):
+
+    if not LATENCY_SKETCH_ACTIVE or not delta:
+        return delta
+
+    reference = time.time()
+    leaves = dict()
+    for leaf_key, generated_time in leaf_times:
+        latency_sketch.add(leaves.setdefault(leaf_key, dict()), (reference - generated_time) * 1000)
+
+    delta[LATENCY_SKETCH_NAME] = {'Reference': reference, 'Leaves': leaves}
+    return delta
+
+# Updates of the latency sketch items of the AggregateTable: One ADD per bucket (attribute b<bucket>)
+def latency_transact_items(leaves):
+    transact_items = list()
+    for leaf_key in sorted(leaves):
+        buckets = sorted(leaves[leaf_key])
+        transact_items.append({'Update': {
+            'TableName': AGGREGATE_TABLE_NAME,
+            'Key': {AGGREGATE_TABLE_KEY: {'S': LATENCY_KEY_PREFIX + leaf_key}},
+            'UpdateExpression': 'ADD ' + ', '.join('#b{0} :b{0}'.format(b) for b in buckets),
+            'ExpressionAttributeNames': {'#b' + str(b): 'b' + str(b) for b in buckets},
+            'ExpressionAttributeValues': {':b' + str(b): {'N': str(leaves[leaf_key][b])}
+                for b in buckets}
+        }})
+    return transact_items
+
+# Latency sketch of a latency sketch item of the AggregateTable
+def latency_sketch_of_item(item):
+    return {int(name[1:]): int(value['N']) for name, value in item.items()
+        if name[0] == 'b' and name[1:].isdigit()}
+
+# Map Combiner: Merge the delta of this invocation into the state of the tumbling window
+# --> Returns the delta to write (None while the window stays open), its message hash and the state
+#     that Lambda hands to the next invocation of the window
+# --> The message hash chains the hashes of all batches of the window. A retried invocation gets the
+#     same state and records, hence the same hash, and the conditional put still deduplicates.
+def combine_window_delta(event, delta, batch_hash):
+
+    state = event.get('state') or dict()
+    window_delta = delta_from_json(state.get('Delta', '{}'))
+    window_hash = state.get('Hash', '')
+
+    if delta:
+        merge_deltas(window_delta, delta)
+        window_hash = hashlib.sha256((window_hash + batch_hash).encode()).hexdigest()
+
+    # Flush at the end of the window, when it is full or if no tumbling window is configured
+    if ('window' not in event) or event.get('isFinalInvokeForWindow') or \
+        event.get('isWindowTerminatedEarly') or \
+        window_delta.get(MESSAGE_COUNT_NAME, 0) >= MAP_COMBINER_MAX_MESSAGES:
+        return window_delta, window_hash, {'Hash': window_hash, 'Delta': '{}'}
+
+    return None, window_hash, {'Hash': window_hash, 'Delta': json.dumps(window_delta)}
+
+# Reducer partition of an aggregate key: Stable hash of the top level of the hierarchy
+def partition_of_key(key):
+    return zlib.crc32(key.split(':', 1)[0].encode()) % REDUCER_COUNT
+
+# Split a (rolled up) delta into one delta per reducer partition
+# --> message_count goes to partition 0 only, so it is counted exactly once
+# --> The timestamps are copied to every partition, each reducer tracks its own latency
+def split_delta(delta):
+
+    if REDUCER_COUNT == 1:
+        return {0: delta}
+
+    partition_deltas = {0: dict()}
+    for key, value in delta.items():
+        if key == MESSAGE_COUNT_NAME:
+            partition_deltas[0][key] = value
+        elif key not in (TIMESTAMP_GENERATOR_FIRST, TIMESTAMP_GENERATOR_MEAN, LATENCY_SKETCH_NAME):
+            partition_deltas.setdefault(partition_of_key(key), dict())[key] = value
+
+    # Latency sketches go to the partition of their leaf
+    if LATENCY_SKETCH_NAME in delta:
+        for leaf_key, sketch in delta[LATENCY_SKETCH_NAME]['Leaves'].items():
+            partition_delta = partition_deltas.setdefault(partition_of_key(leaf_key), dict())
+            partition_delta.setdefault(LATENCY_SKETCH_NAME, {
+                'Reference': delta[LATENCY_SKETCH_NAME]['Reference'], 'Leaves': dict()
+            })['Leaves'][leaf_key] = sketch
+
+    for partition_delta in partition_deltas.values():
+        for key in (TIMESTAMP_GENERATOR_FIRST, TIMESTAMP_GENERATOR_MEAN):
+            if key in delta:
+                partition_delta[key] = delta[key]
+
+    return partition_deltas
+
+# Keep only the most recent version per ID within a batch of messages
+# --> Returns the surviving messages (in order of first appearance) together with the number of
+#     dropped duplicates (same version seen before) and dropped stale versions (lower version)
+def collapse_versions(messages):
+
+    latest_messages = dict()
+    duplicate_count = 0
+    stale_count = 0
+
+    for message in messages:
+        record_id = message.id
+
+        if record_id not in latest_messages:
+            latest_messages[record_id] = message
+            continue
+
+        current_version = latest_messages[record_id].version
+        if message.version > current_version:
+            latest_messages[record_id] = message
+            stale_count += 1
+        elif message.version == current_version:
+            duplicate_count += 1
+        else:
+            stale_count += 1
+
+    return list(latest_messages.values()), duplicate_count, stale_count
+
 # Aggregate along tree
 def aggregate_along_tree(data):
-    
-    # Determine aggregation depth
-    aggregation_depth = max([key.count(':') for key in data.keys()])
-    
-    # Start at max depth and go higher 
-    for depth in range(aggregation_depth, 0, -1):
-        children = [key for key in data.keys() if key.count(':') == depth]
-        for child in children:
+
+    # Compiled hierarchy: One pass over the nodes present in the data
+    if HIERARCHY.aggregate_along_tree(data) is not None:
+        return data
+
+    # Keys outside of the hierarchy definition (e.g. the generator counts): Group keys by depth once
+    keys_by_depth = dict()
+    for key in data.keys():
+        keys_by_depth.setdefault(key.count(':'), list()).append(key)
+
+    # Start at max depth and go higher, newly created parents are rolled up one level later
+    for depth in range(max(keys_by_depth, default = 0), 0, -1):
+        for child in keys_by_depth.get(depth, list()):
             parent = child[:child.rfind(':')]
+            if parent not in data:
+                keys_by_depth.setdefault(depth - 1, list()).append(parent)
             dict_entry_add(data, parent, data[child])
-                
+
     return data
 
 # Aggregate over records from a DynamoDB Stream (Stateful Pipeline)
 def aggregate_over_dynamo_records(records):
 
+    # Columnar Engine (returns None for hierarchies outside of the definition)
+    if AGGREGATION_ENGINE == 'columnar':
+        delta = columnar_aggregation.aggregate_over_dynamo_records(records)
+        if delta is not None:
+            return add_latency_sketches(fixed_point_leaves(delta), dynamo_leaf_times(records))
+
     # Initialize Delta Dict
     delta = dict()
 
@@ -142,56 +857,84 @@ def aggregate_over_dynamo_records(records):
         if 'NewImage' not in record[DYNAMO_NAME]:
             continue
 
-        # Add New Image to Aggregate
+        # Times
         new_data = record[DYNAMO_NAME]['NewImage']
+        new_generated_time  = float(        new_data[TIMESTAMP_COLUMN_NAME]['N'] )
 
-        new_hierarchy       = json.loads(   new_data[HIERARCHY_COLUMN_NAME]['S'] )
+        dict_entry_add(delta, TIMESTAMP_GENERATOR_MEAN, new_generated_time)
+        dict_entry_min(delta, TIMESTAMP_GENERATOR_FIRST, new_generated_time)
+
+        # Increment mesage count
+        dict_entry_add(delta, MESSAGE_COUNT_NAME, 1)
+
+        # Unchanged modify (e.g. only a new version): The message counts, the aggregates don't change
+        if is_unchanged_modify(record):
+            continue
+
+        # Add New Image to Aggregate
+        new_type            = leaf_key_of_image(new_data)
         new_value           = float(        new_data[VALUE_COLUMN_NAME]['N']     )
-        new_generated_time  = float(        new_data[TIMESTAMP_COLUMN_NAME]['N'] )
         
         # Add to Value for the New Type
-        new_type = hierarchy_to_string(new_hierarchy, AGGREGATION_HIERARCHY)
         dict_entry_add(delta, new_type, new_value)
-        
-        # Times
-        dict_entry_add(delta, TIMESTAMP_GENERATOR_MEAN, new_generated_time)
-        dict_entry_min(delta, TIMESTAMP_GENERATOR_FIRST, new_generated_time)
             
         # If the record contains old data: Delete from Aggregate
         if 'OldImage' in record[DYNAMO_NAME]:
             old_data = record[DYNAMO_NAME]['OldImage']
 
-            old_hierarchy   = json.loads(   old_data[HIERARCHY_COLUMN_NAME]['S'] )
+            old_type        = leaf_key_of_image(old_data)
             old_value       = float(        old_data[VALUE_COLUMN_NAME]['N']     )
 
             # Subtract from Value for the Old Type
-            old_type = hierarchy_to_string(old_hierarchy, AGGREGATION_HIERARCHY)
             dict_entry_add(delta, old_type, - old_value)
-
-        # Increment mesage count
-        dict_entry_add(delta, MESSAGE_COUNT_NAME, 1)
         
     # Adjust timestamp mean by number of messages
     if delta:
         delta[TIMESTAMP_GENERATOR_MEAN] /= delta[MESSAGE_COUNT_NAME]
 
-    return delta
+    return add_latency_sketches(fixed_point_leaves(delta), dynamo_leaf_times(records))
+
+# (Leaf key, generator timestamp) of the new images of StateTable stream records
+def dynamo_leaf_times(records):
+    for record in records:
+        if 'NewImage' in record[DYNAMO_NAME]:
+            new_data = record[DYNAMO_NAME]['NewImage']
+            yield leaf_key_of_image(new_data), float(new_data[TIMESTAMP_COLUMN_NAME]['N'])
+
+# Messages of a batch of Kinesis records (trade records, see trade_record.py)
+# --> An aggregated record (KINESIS_AGGREGATION_ACTIVE in the producer) holds a JSON list of messages
+def kinesis_messages(records):
+    decode = trade_record.decode
+    messages = list()
+    for record in records:
+        messages.extend(decode(binascii.a2b_base64(record[KINESIS_NAME]['data'])))
+    return messages
 
 # Aggregate over records from a Kinesis Stream (Stateless Pipeline)
 def aggregate_over_kinesis_records(records):
 
+    # Decode Messages (unpacks aggregated records)
+    return aggregate_over_kinesis_messages(kinesis_messages(records))
+
+# Aggregate over decoded Kinesis messages
+def aggregate_over_kinesis_messages(messages):
+
+    # Columnar Engine (returns None for hierarchies outside of the definition)
+    if AGGREGATION_ENGINE == 'columnar':
+        delta = columnar_aggregation.aggregate_over_kinesis_messages(messages)
+        if delta is not None:
+            return add_latency_sketches(fixed_point_leaves(delta), kinesis_leaf_times(messages))
+
     # Initialize Delta Dict
     delta = dict()
 
      # Iterate over Messages
-    for record in records:
-
-        data = json.loads(base64.b64decode(record[KINESIS_NAME]['data']).decode('utf-8'))
+    for data in messages:
 
         # Get Relevant Data
-        record_hierarchy    = data[HIERARCHY_COLUMN_NAME]
-        record_value        = data[VALUE_COLUMN_NAME]
-        record_time         = data[TIMESTAMP_COLUMN_NAME]
+        record_hierarchy    = data.hierarchy
+        record_value        = data.value
+        record_time         = data.timestamp
         
         # Add to Value for the New Type
         record_type = hierarchy_to_string(record_hierarchy, AGGREGATION_HIERARCHY)
@@ -208,4 +951,9 @@ def aggregate_over_kinesis_records(records):
     if delta:
         delta[TIMESTAMP_GENERATOR_MEAN] /= delta[MESSAGE_COUNT_NAME]
 
-    return delta
\ No newline at end of file
+    return add_latency_sketches(fixed_point_leaves(delta), kinesis_leaf_times(messages))
+
+# (Leaf key, generator timestamp) of decoded Kinesis messages
+def kinesis_leaf_times(messages):
+    for data in messages:
+        yield hierarchy_to_string(data.hierarchy, AGGREGATION_HIERARCHY), data.timestamp
@@ -0,0 +1,111 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import zlib
+import operator
+import itertools
+
+# Project Imports
+from constants import *
+
+# --------------------------------------------------------------------------------------------------
+# Compiled Hierarchy: Integer ids and parent pointers for all nodes of the aggregation hierarchy
+# --------------------------------------------------------------------------------------------------
+#
+# Node ids are assigned bottom-up: first all leafs (node id == leaf id), then the next higher level
+# and so on up to the top level. Every parent therefore has a higher id than its children, i.e.
+# ascending node ids are a topological order of the tree.
+
+class CompiledHierarchy:
+
+    def __init__(self, aggregation_hierarchy, hierarchy_definition):
+
+        self.levels = list(aggregation_hierarchy)
+        level_values = [hierarchy_definition[level] for level in self.levels]
+
+        # Every combination of level values is one leaf, e.g. ('PV', 'FXSpot', 'EMEA')
+        leaf_values = list(itertools.product(*level_values))
+
+        self.leaf_count = len(leaf_values)
+        self.leaf_keys  = [':'.join(values) for values in leaf_values]
+        self.leaf_ids   = {values: leaf_id for leaf_id, values in enumerate(leaf_values)}
+
+        # Fetches the tuple of level values from a hierarchy dictionary in one call
+        if len(self.levels) == 1:
+            self.leaf_ids = {values[0]: leaf_id for values, leaf_id in self.leaf_ids.items()}
+        self.level_values_getter = operator.itemgetter(*self.levels)
+
+        # All nodes, from the leafs up to the top level
+        self.node_keys = list()
+        self.node_depths = list()
+        for depth in range(len(self.levels), 0, -1):
+            for values in itertools.product(*level_values[:depth]):
+                self.node_keys.append(':'.join(values))
+                self.node_depths.append(depth - 1)
+
+        self.node_count = len(self.node_keys)
+        self.node_ids = {key: node_id for node_id, key in enumerate(self.node_keys)}
+
+        # Signature of the node list, node ids are only meaningful between identical hierarchies
+        self.signature = zlib.crc32('\n'.join(self.node_keys).encode())
+
+        # Signature of the levels, leaf keys are only meaningful between identical level orders
+        self.level_signature = str(zlib.crc32(':'.join(self.levels).encode()))
+
+        # Parent pointers, -1 for the top level
+        self.parents = [
+            self.node_ids[key[:key.rfind(':')]] if ':' in key else -1 for key in self.node_keys]
+
+    # Leaf id of a hierarchy dictionary, None if the combination is not part of the definition
+    def leaf_id(self, hierarchy_dictionary):
+        return self.leaf_ids.get(self.level_values_getter(hierarchy_dictionary))
+
+    # Aggregate along tree: Add every node of the dictionary to all its ancestors
+    # --> Leafs are added to their parents while the dictionary is read, the nodes above the leafs are
+    #     rolled up in a list indexed by node id (ascending ids are a topological order)
+    # --> Leaf values never change, only the nodes above them are converted to keys and written back
+    # --> Returns None (and leaves data untouched) if it contains a hierarchy key that is not a node
+    def aggregate_along_tree(self, data):
+
+        node_ids = self.node_ids
+        parents = self.parents
+        leaf_count = self.leaf_count
+        values = [None] * (self.node_count - leaf_count)
+
+        for key, value in data.items():
+            node_id = node_ids.get(key)
+            if node_id is None:
+                if ':' in key:
+                    return None
+                continue
+            if node_id < leaf_count:
+                node_id = parents[node_id]
+                if node_id < 0:
+                    continue
+            index = node_id - leaf_count
+            node_value = values[index]
+            values[index] = value if node_value is None else node_value + value
+
+        # Children have lower ids than their parents, so every node is complete when it is visited
+        for index, value in enumerate(values):
+            if value is not None:
+                parent_id = parents[leaf_count + index]
+                if parent_id >= 0:
+                    parent_index = parent_id - leaf_count
+                    parent_value = values[parent_index]
+                    values[parent_index] = value if parent_value is None else parent_value + value
+
+        node_keys = self.node_keys
+        for index, value in enumerate(values):
+            if value is not None:
+                data[node_keys[leaf_count + index]] = value
+
+        return data
+
+# Compiled once per container
+HIERARCHY = CompiledHierarchy(AGGREGATION_HIERARCHY, HIERARCHY_DEFINITION)
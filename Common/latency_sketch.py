@@ -0,0 +1,76 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import math
+
+# Project Imports
+from constants import *
+
+# --------------------------------------------------------------------------------------------------
+# Latency Sketch: Mergeable histogram with logarithmic buckets (DDSketch)
+# --------------------------------------------------------------------------------------------------
+#
+# A sketch is a dictionary bucket -> count. Bucket i holds the latencies (in milliseconds) in
+# (GAMMA^(i-1), GAMMA^i], so every quantile is returned with a relative error of at most
+# LATENCY_SKETCH_RELATIVE_ACCURACY. Sketches are merged by adding the counts of their buckets, their
+# size only depends on the range of the latencies, not on the number of messages.
+# --> Latencies below 1 ms are counted in bucket 0.
+
+GAMMA       = (1 + LATENCY_SKETCH_RELATIVE_ACCURACY) / (1 - LATENCY_SKETCH_RELATIVE_ACCURACY)
+LOG_GAMMA   = math.log(GAMMA)
+
+# Bucket of a latency
+def bucket_of(latency_ms):
+    if latency_ms <= 1:
+        return 0
+    return math.ceil(math.log(latency_ms) / LOG_GAMMA)
+
+# Latency represented by a bucket (the value with the lowest relative error to both bucket bounds)
+def bucket_value(bucket):
+    if bucket == 0:
+        return 1.0
+    return 2 * GAMMA ** bucket / (GAMMA + 1)
+
+# Add a latency to a sketch
+def add(sketch, latency_ms, count = 1):
+    bucket = bucket_of(latency_ms)
+    sketch[bucket] = sketch.get(bucket, 0) + count
+
+# Add all counts of a sketch to another one
+def merge(target, sketch):
+    for bucket, count in sketch.items():
+        target[bucket] = target.get(bucket, 0) + count
+    return target
+
+# Sketch of the same latencies, each one increased by offset_ms
+# --> The bucket values are shifted and bucketed again, which adds up to
+#     LATENCY_SKETCH_RELATIVE_ACCURACY relative error per shift: shift each sketch as rarely as possible
+def shift(sketch, offset_ms):
+    if offset_ms == 0:
+        return dict(sketch)
+    shifted_sketch = dict()
+    for bucket, count in sketch.items():
+        add(shifted_sketch, bucket_value(bucket) + offset_ms, count)
+    return shifted_sketch
+
+# Number of latencies in a sketch
+def count(sketch):
+    return sum(sketch.values())
+
+# Latency at a quantile (0 <= quantile <= 1), None for an empty sketch
+def quantile(sketch, q):
+    total_count = count(sketch)
+    if total_count == 0:
+        return None
+    rank = q * (total_count - 1)
+    running_count = 0
+    for bucket in sorted(sketch):
+        running_count += sketch[bucket]
+        if running_count > rank:
+            return bucket_value(bucket)
+    return bucket_value(max(sketch))
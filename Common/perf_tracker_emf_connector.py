@@ -0,0 +1,77 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+import os
+import json
+import time
+import threading
+
+# CloudWatch Embedded Metric Format: Metrics are printed to stdout as structured log lines and
+# extracted by CloudWatch Logs, so no network call is made from the Lambda.
+# --> Samples are not buffered: Every metric has fixed counters (count, sum, min, max) that a sample
+#     updates in place, so the memory does not grow with the number of invocations between flushes.
+# --> A flush prints the counters as the metrics <name>_count, _sum, _min and _max, at most
+#     EMF_MAX_METRICS metrics per line (EMF limit: 100 metrics per line).
+EMF_MAX_METRICS = 100
+EMF_STATISTICS = ('count', 'sum', 'min', 'max')
+
+class PerfTrackerEMFConnector:
+
+    def __init__(self, connector_string):
+
+        tokens = connector_string.split(" ")
+        self.namespace = tokens[0]
+        self.function_name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'local')
+
+        # Metric name -> [count, sum, min, max] since the last flush
+        self.counters = {}
+        self.counters_lock = threading.Lock()
+
+
+    def add_sample(self, json_data_sample):
+        with self.counters_lock:
+            for k,v in json_data_sample.items():
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    counter = self.counters.get(k)
+                    if counter is None:
+                        self.counters[k] = [1, v, v, v]
+                    else:
+                        counter[0] += 1
+                        counter[1] += v
+                        if v < counter[2]:
+                            counter[2] = v
+                        if v > counter[3]:
+                            counter[3] = v
+
+
+    def submit_measurements(self):
+
+        with self.counters_lock:
+            counters, self.counters = self.counters, {}
+        timestamp_ms = int(time.time() * 1000)
+
+        metrics = {}
+        for name in sorted(counters.keys()):
+            for statistic, value in zip(EMF_STATISTICS, counters[name]):
+                metrics[name + "_" + statistic] = value
+        names = list(metrics.keys())
+
+        for i in range(0, len(names), EMF_MAX_METRICS):
+            metric_names = names[i:i + EMF_MAX_METRICS]
+            document = {
+                "_aws": {
+                    "Timestamp": timestamp_ms,
+                    "CloudWatchMetrics": [{
+                        "Namespace": self.namespace,
+                        "Dimensions": [["FunctionName"]],
+                        "Metrics": [{"Name": name, "Unit": "None"} for name in metric_names]
+                    }]
+                },
+                "FunctionName": self.function_name
+            }
+            for name in metric_names:
+                document[name] = metrics[name]
+
+            print(json.dumps(document))
+
+        return True
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: MIT-0
 
 import boto3
+import threading
 from influxdb import InfluxDBClient
 
 class PerfTrackerInfluxDBConnector:
@@ -23,6 +24,7 @@ class PerfTrackerInfluxDBConnector:
         self.influxdb_client.switch_database(self.database)
 
         self.samples_buffer = []
+        self.samples_lock = threading.Lock()
 
 
     def add_sample(self, json_data_sample):
@@ -38,12 +40,15 @@ class PerfTrackerInfluxDBConnector:
         }
 
 
-        self.samples_buffer.append(sample)
+        with self.samples_lock:
+            self.samples_buffer.append(sample)
 
 
     def submit_measurements(self):
 
-        res = self.influxdb_client.write_points(self.samples_buffer)
-        self.samples_buffer = []
+        # Swap the buffer first, samples added while writing go to the next submission
+        with self.samples_lock:
+            samples, self.samples_buffer = self.samples_buffer, []
+        res = self.influxdb_client.write_points(samples)
 
         return res
@@ -3,24 +3,38 @@
 
 import datetime
 import time
-
-from perf_tracker_influxdb_connector import PerfTrackerInfluxDBConnector
+from concurrent.futures import ThreadPoolExecutor
 
 def get_time_now_ms():
     return int(round(time.time() * 1000))
 
-def PerformanceTrackerInitializer(metrics_are_enabled, connection_string, influxdb_ip):
+# Connection strings:
+# --> "influxdb <port> <database> <measurement>": InfluxDB on influxdb_ip
+# --> "emf <namespace>": CloudWatch Embedded Metric Format on stdout, no network call
+# The connector modules are imported on demand, so the influxdb package is only needed for "influxdb".
+# With asynchronous_flush, submissions run on a background thread and never block the handler.
+# --> "emf" always flushes synchronously: It prints a few lines from fixed counters, a thread would
+#     cost more than the flush itself.
+def PerformanceTrackerInitializer(metrics_are_enabled, connection_string, influxdb_ip,
+    asynchronous_flush = True):
     metrics_are_enabled = bool(int(metrics_are_enabled))
     if metrics_are_enabled:
         tokens = connection_string.split(" ", 1) # Pick up first word in the string
         connector_type = tokens[0]
         if connector_type == "influxdb":
+            from perf_tracker_influxdb_connector import PerfTrackerInfluxDBConnector
             influxdb_connector = PerfTrackerInfluxDBConnector(connector_string=tokens[1], influxdb_ip=influxdb_ip)
-            perf_tracker = PerformanceTracker(influxdb_connector)
+            perf_tracker = PerformanceTracker(influxdb_connector, asynchronous_flush)
+            return perf_tracker
+        elif connector_type == "emf":
+            from perf_tracker_emf_connector import PerfTrackerEMFConnector
+            emf_connector = PerfTrackerEMFConnector(connector_string=tokens[1])
+            perf_tracker = PerformanceTracker(emf_connector, False)
             return perf_tracker
         else:
-            print("ERROR Undefined metrics connector type, no metrics will be collected: {} [{}]".format(connector_type))
-            return __CreateEmptyPerformanceTracker
+            print("ERROR Undefined metrics connector type, no metrics will be collected: {} [{}]".format(
+                connector_type, connection_string))
+            return __CreateEmptyPerformanceTracker()
     else:
         return __CreateEmptyPerformanceTracker()
 
@@ -37,7 +51,7 @@ class EventsCounter:
         if event_name in self.evcounter:
             self.evcounter[event_name] += value
         else:
-            self.evcounter[event_name] = 1
+            self.evcounter[event_name] = value
 
     def set(self, event_name, value):
         self.evcounter[event_name] = value
@@ -66,15 +80,26 @@ class EventsCounter:
 
 class PerformanceTracker():
 
-    def __init__(self, buffered_storage_connector):
+    def __init__(self, buffered_storage_connector, asynchronous_flush = False):
         self.buffered_storage_connector = buffered_storage_connector
         self.stats_batch = []
         self.last_batch_submission_delay_ms = 0
         self.last_batch_submission_timestamp_ms = 0
         self.max_batching_delay_ms = 5*1000
 
+        # Background flush: One submission at a time, a frozen container continues it when thawed
+        self.flush_executor = None
+        self.flush_future = None
+        if buffered_storage_connector and asynchronous_flush:
+            self.flush_executor = ThreadPoolExecutor(max_workers=1)
+
+        # Time spent in the tracker on the calling thread, reported with the next sample
+        self.overhead_ms = 0
+
     def add_metric_sample(self, stats_dic, event_counter, from_event, to_event, event_time=None):
 
+        time_start = time.perf_counter()
+
         if not event_time:
             event_time = datetime.datetime.now().isoformat()
 
@@ -98,20 +123,42 @@ class PerformanceTracker():
 
             event_counter.reset()
 
-        # Self profiling on the batch submission delays
+        # Self profiling on the batch submission delays and the overhead on the calling thread
         data["last_batch_submission_delay_ms"] = self.last_batch_submission_delay_ms
+        data["metrics_overhead_ms"] = self.overhead_ms
+        self.overhead_ms = 0
 
         if self.buffered_storage_connector:
             self.buffered_storage_connector.add_sample(data)
 
+        self.overhead_ms += (time.perf_counter() - time_start) * 1000
+
 
     def submit_measurements(self):
 
+        time_start = time.perf_counter()
+
         if self.buffered_storage_connector:
             if self.max_batching_delay_ms < get_time_now_ms() - self.last_batch_submission_timestamp_ms:
 
-                time_start_ms = get_time_now_ms()
-                self.buffered_storage_connector.submit_measurements()
-                self.last_batch_submission_delay_ms = get_time_now_ms() - time_start_ms
-                self.last_batch_submission_timestamp_ms = get_time_now_ms()
+                if self.flush_executor is None:
+                    self.__flush()
+                elif self.flush_future is None or self.flush_future.done():
+                    self.last_batch_submission_timestamp_ms = get_time_now_ms()
+                    self.flush_future = self.flush_executor.submit(self.__flush_in_background)
+
+        self.overhead_ms += (time.perf_counter() - time_start) * 1000
+
+    def __flush(self):
+
+        time_start_ms = get_time_now_ms()
+        self.buffered_storage_connector.submit_measurements()
+        self.last_batch_submission_delay_ms = get_time_now_ms() - time_start_ms
+        self.last_batch_submission_timestamp_ms = get_time_now_ms()
+
+    def __flush_in_background(self):
+        try:
+            self.__flush()
+        except Exception as e:
+            print("ERROR Submission of metrics failed: {}".format(e))
 
@@ -0,0 +1,118 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import io
+import time
+import random
+import pstats
+import threading
+import cProfile
+import tracemalloc
+
+# Project Imports
+from constants import *
+
+# --------------------------------------------------------------------------------------------------
+# Stage Timer: Durations of the consecutive stages of a Lambda invocation
+# --------------------------------------------------------------------------------------------------
+#
+# mark(stage) ends the stage that ran since the previous mark. stats_dic holds the labelled timestamps
+# in the format of PerformanceTracker.add_metric_sample, which reports every stage as
+# <prefix>_<stage>_ms.
+#
+# A share of PROFILING_SAMPLE_RATE of the invocations is profiled in addition: cProfile (calling
+# thread only) and, with PROFILING_TRACE_MEMORY, tracemalloc. finish() prints the top
+# PROFILING_TOP_ENTRIES entries of both to the log.
+# --> A profile left running by an invocation that raised before finish() is stopped by the next
+#     invocation on the same thread
+
+running_profile = threading.local()
+
+class StageTimer:
+
+    def __init__(self, prefix):
+
+        self.prefix = prefix
+        self.stats_dic = dict()
+
+        if getattr(running_profile, 'timer', None) is not None:
+            running_profile.timer.stop_profile()
+
+        self.profiler = None
+        self.traces_memory = False
+        if PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE:
+            if PROFILING_TRACE_MEMORY and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.traces_memory = True
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+            running_profile.timer = self
+
+        self.mark('start')
+
+    # End the current stage
+    def mark(self, stage):
+        self.stats_dic['%03d' % len(self.stats_dic)] = {
+            'label': self.prefix + '_' + stage + '_ms',
+            'tstmp': time.perf_counter() * 1000
+        }
+
+    # Keys of the first and the last timestamp (from_event and to_event of add_metric_sample)
+    def first_event(self):
+        return '%03d' % 0
+
+    def last_event(self):
+        return '%03d' % (len(self.stats_dic) - 1)
+
+    # (Stage, duration in ms) of all stages
+    def durations(self):
+        stats = [self.stats_dic[key] for key in sorted(self.stats_dic)]
+        return [(stats[i]['label'][len(self.prefix) + 1:-3], stats[i]['tstmp'] - stats[i - 1]['tstmp'])
+            for i in range(1, len(stats))]
+
+    # Print the stage durations and the profile of a sampled invocation
+    def finish(self):
+
+        if self.profiler is not None:
+            memory_statistics = self.stop_profile()
+            self.print_profile(memory_statistics)
+
+        print('Stage durations [ms]: ' + ', '.join('{} {:.2f}'.format(stage, duration)
+            for stage, duration in self.durations()) + '.')
+
+    # Stop profiling, returns the memory statistics (None without tracemalloc)
+    def stop_profile(self):
+
+        self.profiler.disable()
+        running_profile.timer = None
+
+        memory_statistics = None
+        if self.traces_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current_size, peak_size = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.traces_memory = False
+            memory_statistics = (current_size, peak_size,
+                snapshot.statistics('lineno')[:PROFILING_TOP_ENTRIES])
+
+        return memory_statistics
+
+    def print_profile(self, memory_statistics):
+
+        output = io.StringIO()
+        pstats.Stats(self.profiler, stream = output).sort_stats('cumulative').print_stats(
+            PROFILING_TOP_ENTRIES)
+        print('Profile of this invocation (cProfile, sorted by cumulative time):\n' + output.getvalue())
+        self.profiler = None
+
+        if memory_statistics is not None:
+            current_size, peak_size, statistics = memory_statistics
+            print('Memory of this invocation (tracemalloc): {:.1f} KiB allocated, peak {:.1f} KiB'.format(
+                current_size / 1024, peak_size / 1024))
+            for statistic in statistics:
+                print('  ' + str(statistic))
@@ -0,0 +1,128 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import json
+from typing import List, Union
+
+# Project Imports
+from constants import *
+
+# Optional Imports: Faster JSON backends are used if they are packaged with the Lambda
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# --------------------------------------------------------------------------------------------------
+# Trade Record: Decoded message of the Kinesis stream
+# --------------------------------------------------------------------------------------------------
+#
+# The fields are attributes instead of dictionary entries (no hashing of the column names per access,
+# no dictionary per message). The JSON names of the fields are the *_COLUMN_NAME constants.
+
+class TradeRecord:
+
+    __slots__ = ('id', 'hierarchy', 'value', 'version', 'timestamp')
+
+    def __init__(self, id, hierarchy, value, version, timestamp):
+        self.id         = id
+        self.hierarchy  = hierarchy
+        self.value      = value
+        self.version    = version
+        self.timestamp  = timestamp
+
+    # Record of a decoded JSON object
+    @classmethod
+    def from_dict(cls, message):
+        return cls(message[ID_COLUMN_NAME], message[HIERARCHY_COLUMN_NAME],
+            message[VALUE_COLUMN_NAME], message[VERSION_COLUMN_NAME], message[TIMESTAMP_COLUMN_NAME])
+
+    # JSON object of the record
+    def to_dict(self):
+        return {
+            ID_COLUMN_NAME:         self.id,
+            HIERARCHY_COLUMN_NAME:  self.hierarchy,
+            VALUE_COLUMN_NAME:      self.value,
+            VERSION_COLUMN_NAME:    self.version,
+            TIMESTAMP_COLUMN_NAME:  self.timestamp
+        }
+
+# --------------------------------------------------------------------------------------------------
+# Decoders: JSON bytes of a Kinesis record -> list of records
+# --------------------------------------------------------------------------------------------------
+#
+# A Kinesis record holds one message or, with record aggregation, a JSON list of messages. msgspec and
+# orjson parse the bytes directly (no intermediate UTF-8 string).
+# --> 'msgspec': Validates and decodes straight into slotted structs with the fields of TradeRecord
+# --> 'orjson':  Decodes into dictionaries, converted to TradeRecords
+# --> 'json':    Standard library, converted to TradeRecords
+
+def records_of_objects(data):
+    if not isinstance(data, list):
+        data = [data]
+    return [TradeRecord(message[ID_COLUMN_NAME], message[HIERARCHY_COLUMN_NAME],
+        message[VALUE_COLUMN_NAME], message[VERSION_COLUMN_NAME], message[TIMESTAMP_COLUMN_NAME])
+        for message in data]
+
+# The standard library parses text: raw_decode skips the whitespace handling of json.loads, anything
+# but a single JSON document without surrounding whitespace is left to json.loads
+json_decoder = json.JSONDecoder()
+
+def decode_json(data):
+    text = data.decode('utf-8')
+    try:
+        data, end = json_decoder.raw_decode(text)
+    except ValueError:
+        end = None
+    if end != len(text):
+        data = json.loads(text)
+    return records_of_objects(data)
+
+def decode_orjson(data):
+    return records_of_objects(orjson.loads(data))
+
+if msgspec is not None:
+
+    # Same attributes as TradeRecord, named by the column names in JSON
+    TradeStruct = msgspec.defstruct('TradeStruct',
+        [('id', str), ('hierarchy', dict), ('value', float), ('version', int), ('timestamp', float)],
+        rename = {'id': ID_COLUMN_NAME, 'hierarchy': HIERARCHY_COLUMN_NAME, 'value': VALUE_COLUMN_NAME,
+            'version': VERSION_COLUMN_NAME, 'timestamp': TIMESTAMP_COLUMN_NAME},
+        gc = False)
+
+    msgspec_decoder = msgspec.json.Decoder(Union[TradeStruct, List[TradeStruct]])
+
+    def decode_msgspec(data):
+        data = msgspec_decoder.decode(data)
+        if isinstance(data, list):
+            return data
+        return [data]
+
+# Backends in the order of preference of 'auto'
+DECODERS = dict()
+if msgspec is not None:
+    DECODERS['msgspec'] = decode_msgspec
+if orjson is not None:
+    DECODERS['orjson'] = decode_orjson
+DECODERS['json'] = decode_json
+
+# Decoder of the Lambdas (MESSAGE_DECODER, 'json' if the backend isn't packaged)
+def get_decoder(name = MESSAGE_DECODER):
+    if name == 'auto':
+        return next(iter(DECODERS.values()))
+    if name not in DECODERS:
+        print('JSON backend ' + name + ' is not available, using json.')
+        return decode_json
+    return DECODERS[name]
+
+decode = get_decoder()
@@ -0,0 +1,225 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import sys
+import time
+import random
+
+# AWS Imports
+from botocore.exceptions import ClientError
+
+# Project Imports
+sys.path.append('../Common')
+import functions
+import constants
+import latency_sketch
+
+# --------------------------------------------------------------------------------------------------
+# Aggregate Source - Current content of the AggregateTable, updated incrementally
+# --------------------------------------------------------------------------------------------------
+#
+# The table is read once with a paginated, consistent scan. Afterwards only the keys that appear on the
+# stream of the AggregateTable (StreamViewType KEYS_ONLY) are read again, with BatchGetItem. The shard
+# iterators are requested before the initial scan, so no change between the two is lost. Without a
+# stream (or with FRONTEND_CHANGE_SOURCE = 'scan') every refresh is a full paginated scan.
+# With FRONTEND_CHANGE_SOURCE = 'snapshot', every refresh reads the snapshots written by ReduceLambda.
+# Latency sketch items (LATENCY_SKETCH_ACTIVE) are kept per leaf, snapshot items are skipped.
+
+STREAMS_NAME            = 'dynamodbstreams'
+BATCH_GET_MAX_KEYS      = 100
+BATCH_GET_MAX_RETRIES   = 10
+
+class AggregateSource:
+
+    def __init__(self, ddb_client = None, streams_client = None):
+
+        self.ddb_client = ddb_client or functions.get_client(constants.DYNAMO_NAME)
+        self.streams_client = streams_client
+
+        # Identifier -> Value, and leaf -> latency sketch (LATENCY_SKETCH_ACTIVE)
+        self.data = dict()
+        self.latency_sketches = dict()
+
+        # Items read by the last refresh
+        self.items_read = 0
+
+        # Open shards -> shard iterator, and the shards that were read to their end
+        self.shard_iterators = dict()
+        self.finished_shards = set()
+
+        # Versions of the snapshots of all reducer partitions (snapshot source only)
+        self.snapshot_versions = None
+
+        self.stream_arn = None
+        if constants.FRONTEND_CHANGE_SOURCE == 'stream':
+            table = self.ddb_client.describe_table(TableName = constants.AGGREGATE_TABLE_NAME)['Table']
+            self.stream_arn = table.get('LatestStreamArn')
+        if self.stream_arn is not None:
+            self.streams_client = self.streams_client or functions.get_client(STREAMS_NAME)
+
+        self.reload()
+
+    # Subscribe to the open shards and read the full table
+    def reload(self):
+        if constants.FRONTEND_CHANGE_SOURCE == 'snapshot':
+            self.snapshot_versions, self.data = functions.read_snapshots(self.ddb_client)
+            self.items_read = len(self.snapshot_versions)
+            return
+        if self.stream_arn is not None:
+            self.shard_iterators = dict()
+            self.finished_shards = set()
+            self.discover_shards('LATEST')
+        self.data = dict()
+        self.latency_sketches = dict()
+        self.items_read = 0
+        for item in self.scan():
+            self.store(item)
+
+    def source_name(self):
+        if self.snapshot_versions is not None:
+            return 'snapshot (version ' + '/'.join(str(v) for v in self.snapshot_versions) + ')'
+        if self.stream_arn is None:
+            return 'scan'
+        return 'stream (' + str(len(self.shard_iterators)) + ' open shard(s))'
+
+    # Refresh the data, returns the set of keys that changed
+    def refresh(self):
+
+        if self.stream_arn is None:
+            previous_data = self.data
+            self.reload()
+            return {key for key in set(previous_data) | set(self.data)
+                if previous_data.get(key) != self.data.get(key)}
+
+        try:
+            changed_keys = self.changed_keys()
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('ExpiredIteratorException', 'TrimmedDataAccessException'):
+                raise
+            # The frontend fell behind the stream: Start over
+            previous_keys = set(self.data)
+            self.reload()
+            return previous_keys | set(self.data)
+
+        self.items_read = 0
+        for key in changed_keys:
+            if key.startswith(constants.LATENCY_KEY_PREFIX):
+                self.latency_sketches.pop(key[len(constants.LATENCY_KEY_PREFIX):], None)
+            else:
+                self.data.pop(key, None)
+        for item in self.batch_get(changed_keys):
+            self.store(item)
+
+        return changed_keys
+
+    # Latency quantiles (ms) of a leaf or node (merged sketches of its leafs), None without data
+    def latency_quantiles(self, key, quantiles = (0.5, 0.99, 0.999)):
+        sketch = dict()
+        for leaf_key, leaf_sketch in self.latency_sketches.items():
+            if leaf_key == key or leaf_key.startswith(key + ':'):
+                latency_sketch.merge(sketch, leaf_sketch)
+        if not sketch:
+            return None
+        return [latency_sketch.quantile(sketch, q) for q in quantiles]
+
+    # --- Stream ------------------------------------------------------------------------------------
+
+    # Add shards that are not tracked yet: New shards at start from LATEST, later from TRIM_HORIZON
+    def discover_shards(self, iterator_type):
+
+        describe_arguments = {'StreamArn': self.stream_arn}
+        while True:
+            description = self.streams_client.describe_stream(**describe_arguments)['StreamDescription']
+            for shard in description['Shards']:
+                shard_id = shard['ShardId']
+                if shard_id in self.shard_iterators or shard_id in self.finished_shards:
+                    continue
+                if iterator_type == 'LATEST' and \
+                    'EndingSequenceNumber' in shard['SequenceNumberRange']:
+                    self.finished_shards.add(shard_id)
+                    continue
+                self.shard_iterators[shard_id] = self.streams_client.get_shard_iterator(
+                    StreamArn = self.stream_arn, ShardId = shard_id,
+                    ShardIteratorType = iterator_type)['ShardIterator']
+
+            if 'LastEvaluatedShardId' not in description:
+                return
+            describe_arguments['ExclusiveStartShardId'] = description['LastEvaluatedShardId']
+
+    # Keys of all records on the stream since the last call
+    def changed_keys(self):
+
+        changed_keys = set()
+        shard_closed = False
+
+        for shard_id, shard_iterator in list(self.shard_iterators.items()):
+            response = self.streams_client.get_records(ShardIterator = shard_iterator)
+            for record in response['Records']:
+                key = record[constants.DYNAMO_NAME]['Keys'][constants.AGGREGATE_TABLE_KEY]['S']
+                if not key.startswith(constants.SNAPSHOT_KEY_PREFIX):
+                    changed_keys.add(key)
+
+            # A closed shard is replaced by child shards
+            if response.get('NextShardIterator'):
+                self.shard_iterators[shard_id] = response['NextShardIterator']
+            else:
+                del self.shard_iterators[shard_id]
+                self.finished_shards.add(shard_id)
+                shard_closed = True
+
+        if shard_closed:
+            self.discover_shards('TRIM_HORIZON')
+
+        return changed_keys
+
+    # --- Reads -------------------------------------------------------------------------------------
+
+    # Keep an item that was read: Aggregate or latency sketch (snapshots are skipped)
+    def store(self, item):
+        key = item[constants.AGGREGATE_TABLE_KEY]['S']
+        self.items_read += 1
+        if key.startswith(constants.LATENCY_KEY_PREFIX):
+            self.latency_sketches[key[len(constants.LATENCY_KEY_PREFIX):]] = \
+                functions.latency_sketch_of_item(item)
+        elif not key.startswith(constants.SNAPSHOT_KEY_PREFIX):
+            self.data[key] = float(item[constants.VALUE_COLUMN_NAME]['N'])
+
+    # Consistent scan over all pages of the table
+    def scan(self):
+        scan_arguments = {'TableName': constants.AGGREGATE_TABLE_NAME, 'ConsistentRead': True}
+        while True:
+            response = self.ddb_client.scan(**scan_arguments)
+            for item in response.get('Items', []):
+                yield item
+            if 'LastEvaluatedKey' not in response:
+                return
+            scan_arguments['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    # Consistent BatchGetItem in chunks of 100 keys, unprocessed keys are retried with backoff
+    def batch_get(self, keys):
+
+        keys = sorted(keys)
+        for i in range(0, len(keys), BATCH_GET_MAX_KEYS):
+            request_items = {constants.AGGREGATE_TABLE_NAME: {
+                'Keys': [{constants.AGGREGATE_TABLE_KEY: {'S': key}}
+                    for key in keys[i:i + BATCH_GET_MAX_KEYS]],
+                'ConsistentRead': True
+            }}
+
+            for attempt in range(BATCH_GET_MAX_RETRIES + 1):
+                if attempt > 0:
+                    time.sleep(random.uniform(0, min(1, 0.05 * 2 ** attempt)))
+                response = self.ddb_client.batch_get_item(RequestItems = request_items)
+                for item in response['Responses'].get(constants.AGGREGATE_TABLE_NAME, []):
+                    yield item
+                request_items = response.get('UnprocessedKeys')
+                if not request_items:
+                    break
+            else:
+                raise Exception('BatchGetItem left keys unprocessed after ' +
+                    str(BATCH_GET_MAX_RETRIES) + ' retries.')
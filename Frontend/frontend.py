@@ -12,20 +12,17 @@ import curses
 import collections
 from datetime import datetime
 
-# AWS Imports
-import boto3
-
 # Project Imports
 sys.path.append('../Common')
 import constants
+from aggregate_source import AggregateSource
 
 # --------------------------------------------------------------------------------------------------
 # Preparation
 # --------------------------------------------------------------------------------------------------
 
-# Connect to DynamoDB
-ddb_ressource = boto3.resource(constants.DYNAMO_NAME, region_name=constants.REGION_NAME)
-table = ddb_ressource.Table(constants.AGGREGATE_TABLE_NAME)
+# Connect to DynamoDB (initial read of the AggregateTable, afterwards only changed items are read)
+source = AggregateSource()
 
 # Prepare Terminal
 stdscr = curses.initscr()
@@ -41,23 +38,13 @@ speed = None
 try:
     while True:
         
-        data = dict()
-        message_count = 0
-
-        # Read from DDB
-        table_contents = table.scan(ConsistentRead = True)
+        # Read changes from DDB
+        source.refresh()
         
         # Arrange for displaying
-        if 'Items' in table_contents:
-            for item in table_contents['Items']:
-                identifier = item[constants.AGGREGATE_TABLE_KEY]
-                data[identifier] = item[constants.VALUE_COLUMN_NAME]
-                    
-        if data:
-            message_count = data[constants.MESSAGE_COUNT_NAME]
-            del data[constants.MESSAGE_COUNT_NAME]
-            
-            ordered_data = collections.OrderedDict(sorted(data.items()))
+        data = dict(source.data)
+        message_count = data.pop(constants.MESSAGE_COUNT_NAME, 0)
+        ordered_data = collections.OrderedDict(sorted(data.items()))
         
         # Init Speed
         if speed is None:
@@ -69,33 +56,42 @@ try:
         time_now = time.time()
         time_diff = time_now - speed_measure_start_time
         if time_now - speed_measure_start_time > 5:
-            speed = max(0, int(message_count - speed_measure_start_count) / time_diff)
+            speed = max(0, (message_count - speed_measure_start_count) / time_diff)
             speed_measure_start_count = message_count
             speed_measure_start_time = time_now
         
         # Header
         stdscr.addstr(0 ,0, 'Current Time: ' + datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3])
-        stdscr.addstr(1, 0, 'Total number of messages received: {}'.format(message_count))
+        stdscr.addstr(1, 0, 'Total number of messages received: {}'.format(int(message_count)))
         stdscr.addstr(2, 0, 'Current Message influx: {:.1f} Messages / Second'.format(speed))
+        stdscr.addstr(3, 0, 'Source: {}, items read: {}'.format(source.source_name(), source.items_read))
 
         # Data
         if message_count == 0:
-            stdscr.addstr(4 ,0, 'No data to be displayed so far...')
+            stdscr.addstr(5 ,0, 'No data to be displayed so far...')
         else:
-            row = 4
+            row = 5
             for k,v in ordered_data.items():
                 if k[:10] == "timestamp_":
                     continue
                 level = k.count(':') 
                 try:
-                    stdscr.addstr(row, 0, '{:<35}'.format(k) + (' ' * level) + '{:10.2f}'.format(v))
+                    line = '{:<35}'.format(k) + (' ' * level) + '{:10.2f}'.format(v)
+
+                    # Latency quantiles (LATENCY_SKETCH_ACTIVE)
+                    quantiles = source.latency_quantiles(k)
+                    if quantiles is not None:
+                        line += (' ' * (2 - level)) + \
+                            '   p50 {:8.0f} ms   p99 {:8.0f} ms   p99.9 {:8.0f} ms'.format(*quantiles)
+
+                    stdscr.addstr(row, 0, line)
                     row +=1
                 except:
                     pass
                 
         stdscr.refresh()
-        time.sleep(0.5)
-        stdscr.clear()
+        time.sleep(constants.FRONTEND_REFRESH_INTERVAL)
+        stdscr.erase()
     
 finally:
     # Clean terminal up
@@ -6,17 +6,12 @@
 # --------------------------------------------------------------------------------------------------
 
 # General Imports
-import json
-import hashlib
 import random
 
-# AWS Imports
-import boto3
-from botocore.exceptions import ClientError
-
 # Project Imports
 import functions
 import constants
+from stage_timer import StageTimer
 
 if constants.TRACK_PERFORMANCE:
     from performance_tracker import EventsCounter, PerformanceTrackerInitializer
@@ -29,7 +24,14 @@ if constants.TRACK_PERFORMANCE:
     perf_tracker = PerformanceTrackerInitializer(
             True, constants.INFLUX_CONNECTION_STRING, constants.GRAFANA_INSTANCE_IP
         )
-    event_counter = EventsCounter(['map_lambda_batch_size', 'map_lambda_random_failures'])
+    event_counter = EventsCounter(['map_lambda_batch_size', 'map_lambda_random_failures',
+        'map_lambda_dropped_zero_entries'])
+
+# --------------------------------------------------------------------------------------------------
+# Initialize AWS Clients (reused across invocations of a warm container)
+# --------------------------------------------------------------------------------------------------
+
+ddb_client = functions.get_client(constants.DYNAMO_NAME)
 
 # --------------------------------------------------------------------------------------------------
 # Lambda Function
@@ -41,65 +43,73 @@ def lambda_handler(event, context):
     records = event['Records']
     print('Invoked MapLambda with ' + str(len(records)) + ' record(s).')
 
+    # Time the stages of this invocation
+    timer = StageTimer('map_lambda')
+
     # Aggregate incoming messages (only over the leafs)
     delta = functions.aggregate_over_dynamo_records(records)
-    
+    timer.mark('aggregate')
+
+    # Compute hash over the identities of all records
+    message_hash = functions.batch_fingerprint(records)
+    timer.mark('hash')
+
+    # Combiner: Accumulate the deltas of a tumbling window and write them once per window
+    response = {'statusCode': 200}
+    if constants.MAP_COMBINER_ACTIVE:
+        delta, message_hash, response['state'] = \
+            functions.combine_window_delta(event, delta, message_hash)
+        timer.mark('combine')
+        if delta is None:
+            print('Combined batch into window state. Window hash: ' + message_hash + '.')
+            timer.finish()
+            return response
+
     # If the batch contains only deletes: Done.
     if not delta:
         print('Skipped batch - no new entries.')
-        return {'statusCode': 200}
+        timer.finish()
+        return response
 
     # Aggregate along the tree
     delta = functions.aggregate_along_tree(delta)
 
-    # Create Message
-    message = json.dumps(delta, sort_keys = True)
-    
-    # Compute hash over all records
-    message_hash = hashlib.sha256(str(records).encode()).hexdigest()
-
-    # Write to DynamoDB
-    ddb_ressource = boto3.resource(constants.DYNAMO_NAME)
-    table = ddb_ressource.Table(constants.DELTA_TABLE_NAME)
-
-    # We use a conditional put based on the hash of the record list to ensure
-    # we're not accidentally writing one batch twice.
-    try: 
-        table.put_item(
-            Item={
-                'MessageHash': message_hash,
-                'Message': message
-                },
-            ConditionExpression='attribute_not_exists(MessageHash)'
-            )
-    except ClientError as e:
-        if e.response['Error']['Code']=='ConditionalCheckFailedException':   
-            print('Conditional Put failed. Item with MessageHash ' + message_hash + \
-                ' already exists.')
-            print('Item:', message)
-            print('Full Exception: ' + str(e) + '.')
-        else:
-            raise Exception(e)       
-    
+    # Drop the nodes without change (e.g. modifies that net to zero)
+    zero_entry_count = functions.drop_zero_entries(delta)
+    timer.mark('rollup')
+
+    # Serialize the delta (one message per reducer partition)
+    partition_messages = functions.delta_messages(delta)
+    timer.mark('serialize')
+
+    # Write to DynamoDB (one item per reducer partition)
+    functions.write_delta_messages(ddb_client, partition_messages, message_hash)
+    timer.mark('write')
+    timer.finish()
+
     # Manually Introduced Random Failure
     if random.uniform(0,100) < constants.FAILURE_MAP_LAMBDA_PCT:
         
         # Submit measurements
         if constants.TRACK_PERFORMANCE:
             event_counter.increment('map_lambda_random_failures', 1)
-            perf_tracker.add_metric_sample(None, event_counter, None, None)
+            perf_tracker.add_metric_sample(timer.stats_dic, event_counter, timer.first_event(),
+                timer.last_event())
             perf_tracker.submit_measurements()
             
         # Raise exception
         raise Exception('Manually Introduced Random Failure!')
 
     print('MapLambda finished. Aggregated ' + str(delta[constants.MESSAGE_COUNT_NAME]) + \
-        ' message(s) and written to DeltaTable. MessageHash: ' + message_hash + '.')
+        ' message(s) and written to DeltaTable, dropped ' + str(zero_entry_count) + \
+        ' unchanged node(s). MessageHash: ' + message_hash + '.')
     
     # Performance Tracker
     if constants.TRACK_PERFORMANCE:
         event_counter.increment('map_lambda_batch_size', len(records))
-        perf_tracker.add_metric_sample(None, event_counter, None, None)
+        event_counter.increment('map_lambda_dropped_zero_entries', zero_entry_count)
+        perf_tracker.add_metric_sample(timer.stats_dic, event_counter, timer.first_event(),
+            timer.last_event())
         perf_tracker.submit_measurements()
 
-    return {'statusCode': 200}
+    return response
\ No newline at end of file
@@ -7,6 +7,9 @@
 
 # General Imports
 import sys
+import time
+import random
+import threading
 
 # AWS Imports
 import boto3
@@ -19,72 +22,66 @@ import constants
 # --------------------------------------------------------------------------------------------------
 # Clear Table: Delete all items of a DDB Table
 # --------------------------------------------------------------------------------------------------
+#
+# Every segment of a parallel scan (constants.SCAN_SEGMENTS) reads only the key attributes and deletes
+# them in batches of 25 (the limit of batch_write_item). Unprocessed deletes are retried with backoff.
+
+BATCH_WRITE_MAX_ITEMS = 25
+
+# Delete a batch of keys, retry unprocessed items with exponential backoff and jitter
+def delete_keys(ddb_client, table_name, keys):
+
+    request_items = {table_name: [{'DeleteRequest': {'Key': key}} for key in keys]}
+
+    for attempt in range(constants.BATCH_WRITE_MAX_RETRIES + 1):
+        if attempt > 0:
+            time.sleep(random.uniform(0, min(constants.BATCH_WRITE_BACKOFF_MAX,
+                constants.BATCH_WRITE_BACKOFF_BASE * 2 ** attempt)))
+        request_items = ddb_client.batch_write_item(RequestItems = request_items).get(
+            'UnprocessedItems')
+        if not request_items:
+            return
+
+    raise Exception('batch_write_item left ' + str(len(request_items[table_name])) +
+        ' item(s) unprocessed after ' + str(constants.BATCH_WRITE_MAX_RETRIES) + ' retries.')
 
 def clear_table(table_name, primary_key_name, secondary_key_name = None):
-    
-    scan_args = dict()
-    done = False
-    start_key = None
 
+    # Shared client with BOTO_MAX_POOL_CONNECTIONS (one connection per scan segment)
     dynamodb = boto3.resource(constants.DYNAMO_NAME, region_name = constants.REGION_NAME)
     table = dynamodb.Table(table_name)
-    
+    ddb_client = functions.get_client(constants.DYNAMO_NAME)
+
     # Count number of items in table
     total_item_count = functions.count_items(table)
-    count = 0
-    
+
     print('Deleting all ' + str(total_item_count) + ' items from ' + str(table_name) + '...')
-    
-    while not done:
-        
-        # Scan
-        if start_key:
-            scan_args['ExclusiveStartKey'] = start_key
-        response = table.scan(**scan_args)
-        start_key = response.get('LastEvaluatedKey', None)
-        done = start_key is None
-        
-        # Get Items
-        items = response.get('Items', [])
-        
-        # Delete
-        batch_key_list = list()
-    
-        for i in range(len(items)):
-            
-            # Get ittem
-            item = items[i]
-            
-            # Add to key list
-            if secondary_key_name is None:
-                key = {
-                    primary_key_name: item[primary_key_name]
-                }
-            else:
-                key = {
-                        primary_key_name: item[primary_key_name], 
-                        secondary_key_name: item[secondary_key_name]
-                    }
-            batch_key_list.append(key)
-            
-            # If batch_size is 25 or last item- delete all items:
-            if len(batch_key_list) == 25 or i == (len(items) - 1):
-                
-                request_items = {
-                    table.name : [{'DeleteRequest' : {'Key' : key}} for key in batch_key_list]
-                }
-                
-                dynamodb.batch_write_item(RequestItems = request_items)
-                
-                # Reset list
-                batch_key_list = list()
-                
-                 # Print Progress
-                functions.print_progress_bar(int ((count + 1) / total_item_count) * 100)
-            
-            # Increment Count    
-            count += 1
-            
+
+    # Project the key attributes only
+    key_names = [primary_key_name] if secondary_key_name is None else \
+        [primary_key_name, secondary_key_name]
+    projection_names = {'#key' + str(i): key_name for i, key_name in enumerate(key_names)}
+
+    progress = {'count': 0}
+    progress_lock = threading.Lock()
+
+    def clear_segment(segment):
+        for response in functions.scan_segment_pages(ddb_client, segment, constants.SCAN_SEGMENTS,
+            TableName = table_name, ProjectionExpression = ', '.join(projection_names),
+            ExpressionAttributeNames = projection_names):
+
+            keys = response.get('Items', [])
+            for i in range(0, len(keys), BATCH_WRITE_MAX_ITEMS):
+                delete_keys(ddb_client, table_name, keys[i:i + BATCH_WRITE_MAX_ITEMS])
+
+                # Print Progress (items written meanwhile can make the count exceed the total)
+                with progress_lock:
+                    progress['count'] += len(keys[i:i + BATCH_WRITE_MAX_ITEMS])
+                    functions.print_progress_bar(
+                        min(100, 100 * progress['count'] / max(1, total_item_count)))
+
+    functions.parallel_scan(clear_segment)
+
     print('')
     return True
 
@@ -9,214 +9,587 @@
 import random
 import json
 import hashlib
+import zlib
 import time
 import collections
+import array
 import uuid
 import sys
 
-# Multithreading Imports
-import threading
-
-# AWS Imports
-import boto3
+# Multithreading / Multiprocessing Imports
+import multiprocessing
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
 # Project Imports
 sys.path.append('../Common')
 import functions
 import constants
+from hierarchy import HIERARCHY
+
+# --------------------------------------------------------------------------------------------------
+# Generator State - Latest version of every trade of a thread / process
+# --------------------------------------------------------------------------------------------------
+#
+# Array backed: 16 bytes of TradeID, version, value (in cents) and leaf id per trade, instead of a
+# dictionary with the full message. Trades are picked for modifies by index in O(1) and the totals per
+# leaf are maintained with every change, so there is nothing left to aggregate at the end of a run.
+# Once GENERATOR_STATE_MAX_TRADES trades are stored, a new trade replaces a random one: The replaced
+# trade stays in the totals, it is only no longer picked for modifies (bounded memory for soak tests).
+
+class GeneratorState:
+
+    def __init__(self):
+        self.trade_ids = bytearray()
+        self.versions = array.array('q')
+        self.values = array.array('q')
+        self.leaf_ids = array.array('l')
+        self.leaf_totals = [0] * HIERARCHY.leaf_count
+
+    def __len__(self):
+        return len(self.versions)
+
+    def random_index(self):
+        return random.randrange(len(self.versions))
+
+    def trade_id(self, index):
+        return str(uuid.UUID(bytes = bytes(self.trade_ids[16 * index:16 * (index + 1)])))
+
+    # Store a new trade
+    def add(self, trade_uuid, version, value_cents, leaf_id):
+        self.leaf_totals[leaf_id] += value_cents
+        if len(self.versions) < constants.GENERATOR_STATE_MAX_TRADES:
+            self.trade_ids += trade_uuid.bytes
+            self.versions.append(version)
+            self.values.append(value_cents)
+            self.leaf_ids.append(leaf_id)
+        else:
+            index = self.random_index()
+            self.trade_ids[16 * index:16 * (index + 1)] = trade_uuid.bytes
+            self.versions[index] = version
+            self.values[index] = value_cents
+            self.leaf_ids[index] = leaf_id
+
+    # Replace the latest version of a stored trade
+    def update(self, index, version, value_cents, leaf_id):
+        self.leaf_totals[self.leaf_ids[index]] -= self.values[index]
+        self.leaf_totals[leaf_id] += value_cents
+        self.versions[index] = version
+        self.values[index] = value_cents
+        self.leaf_ids[index] = leaf_id
+
+    # Totals per leaf key over the latest version of all trades
+    def totals(self):
+        return {HIERARCHY.leaf_keys[leaf_id]: total / 100
+            for leaf_id, total in enumerate(self.leaf_totals) if total != 0}
+
+# --------------------------------------------------------------------------------------------------
+# Generate Batch - One batch of BATCH_SIZE messages, including duplicates
+# --------------------------------------------------------------------------------------------------
+
+def generate_batch(thread_state, thread_totals):
+
+    # Initialize record list for this batch
+    records = []
+
+    # Calculate number of duplicates that are added at the end
+    if constants.DUPLICATES_PER_BATCH < constants.BATCH_SIZE:
+        number_of_duplicate_messages = constants.DUPLICATES_PER_BATCH
+    else:
+        number_of_duplicate_messages = max(0, constants.BATCH_SIZE - 1)
+
+    # Create Batch
+    for j in range(constants.BATCH_SIZE - number_of_duplicate_messages):
+
+        # Initialize Empty Message
+        message = {}
+
+        # Random decision: Modify or New Entry
+        if len(thread_state) == 0 or \
+            random.uniform(0,100) < (100 - constants.PERCENTAGE_MODIFY):
+
+            # -> New Entry
+            state_index = None
+
+            # Generate ID
+            trade_uuid = uuid.uuid4()
+            message[constants.ID_COLUMN_NAME] = str(trade_uuid)
+
+            # Add Version
+            message[constants.VERSION_COLUMN_NAME] = 0
+
+            # Count
+            functions.dict_entry_add(thread_totals, 'count:add', 1)
+
+        else:
+
+            # -> Modify
+
+            # Pick existing ID
+            state_index = thread_state.random_index()
+            message[constants.ID_COLUMN_NAME] = thread_state.trade_id(state_index)
+
+            # Get New Version
+            state_version = thread_state.versions[state_index]
+            if state_version == 0 or \
+                random.uniform(1,100) < (100 - constants.PERCENTAGE_OUT_OR_ORDER):
+                # Iterate Version
+                message[constants.VERSION_COLUMN_NAME] = state_version + 1
+                functions.dict_entry_add(thread_totals, 'count:modify:in_order', 1)
+            else:
+                # Insert Older Version
+                message[constants.VERSION_COLUMN_NAME] = state_version - 1
+                functions.dict_entry_add(thread_totals, 'count:modify:out_of_order', 1)
+
+        # Add Random Value
+        message[constants.VALUE_COLUMN_NAME] = functions.random_value()
+
+        # Add Random Hierarchy
+        message[constants.HIERARCHY_COLUMN_NAME] = functions.random_hierarchy()
+
+        # Add Timestamp
+        message[constants.TIMESTAMP_COLUMN_NAME] = time.time()
+
+        # Dump to String
+        message_string = json.dumps(message)
+
+        # Append to Record List (aggregated records: one partition key per bucket of TradeIDs)
+        if constants.KINESIS_AGGREGATION_ACTIVE:
+            partition_key = str(zlib.crc32(message[constants.ID_COLUMN_NAME].encode()) % \
+                constants.KINESIS_AGGREGATION_PARTITION_KEYS)
+        else:
+            partition_key = hashlib.sha256(message_string.encode()).hexdigest()
+        record = {'Data' : message_string, 'PartitionKey' : partition_key}
+        records.append(record)
+
+        # Append to Internal Storage - if message was sent in order
+        if constants.GENERATOR_STORAGE_ACTIVE:
+            value_cents = round(message[constants.VALUE_COLUMN_NAME] * 100)
+            leaf_id = HIERARCHY.leaf_id(message[constants.HIERARCHY_COLUMN_NAME])
+            if state_index is None:
+                thread_state.add(trade_uuid, message[constants.VERSION_COLUMN_NAME], value_cents, leaf_id)
+            elif thread_state.versions[state_index] < message[constants.VERSION_COLUMN_NAME]:
+                thread_state.update(state_index, message[constants.VERSION_COLUMN_NAME], value_cents,
+                    leaf_id)
+
+    # Add Duplicates
+    for k in range(number_of_duplicate_messages):
+        duplicate_index = random.randint(0, constants.BATCH_SIZE - number_of_duplicate_messages - 1)
+        records.append(records[duplicate_index])
+
+    functions.dict_entry_add(thread_totals, 'count:duplicates', number_of_duplicate_messages)
+
+    return records
+
+# --------------------------------------------------------------------------------------------------
+# Send Records - put_records, records rejected by Kinesis are resent with exponential backoff
+# --------------------------------------------------------------------------------------------------
+
+# Kinesis Limits
+KINESIS_RECORD_MAX_BYTES    = 1024 * 1024
+PUT_RECORDS_MAX_RECORDS     = 500
+PUT_RECORDS_MAX_BYTES       = 5 * 1024 * 1024
+
+# Messages accepted by Kinesis, shared by all threads / processes (set by init_worker)
+sent_counter = None
+
+def init_worker(counter):
+    global sent_counter
+    sent_counter = counter
+
+def record_size(record):
+    return len(record['Data']) + len(record['PartitionKey'])
+
+# Kinesis records as (record, number of messages)
+# --> Record Aggregation: The messages of a partition key are packed into JSON lists, in order
+def kinesis_entries(records):
+
+    if not constants.KINESIS_AGGREGATION_ACTIVE:
+        return [(record, 1) for record in records]
+
+    messages_by_partition_key = collections.defaultdict(list)
+    for record in records:
+        messages_by_partition_key[record['PartitionKey']].append(record['Data'])
+
+    entries = []
+    for partition_key, messages in messages_by_partition_key.items():
+        packed_messages = []
+        packed_size = len(partition_key) + 2
+        for message in messages + [None]:
+            if packed_messages and (message is None or \
+                len(packed_messages) == constants.KINESIS_AGGREGATION_MAX_MESSAGES or \
+                packed_size + len(message) + 1 > KINESIS_RECORD_MAX_BYTES):
+                entries.append(({'Data': '[' + ','.join(packed_messages) + ']',
+                    'PartitionKey': partition_key}, len(packed_messages)))
+                packed_messages = []
+                packed_size = len(partition_key) + 2
+            if message is not None:
+                packed_messages.append(message)
+                packed_size += len(message) + 1
+
+    return entries
+
+# Split the entries into put_records calls within the Kinesis limits
+def put_records_calls(entries):
+    call_entries = []
+    call_size = 0
+    for entry in entries:
+        size = record_size(entry[0])
+        if call_entries and (len(call_entries) == PUT_RECORDS_MAX_RECORDS or \
+            call_size + size > PUT_RECORDS_MAX_BYTES):
+            yield call_entries
+            call_entries = []
+            call_size = 0
+        call_entries.append(entry)
+        call_size += size
+    if call_entries:
+        yield call_entries
+
+# Returns the number of messages that were still rejected after the last retry
+def send_records(kinesis_client, entries):
+
+    for attempt in range(constants.PUT_RECORDS_MAX_RETRIES + 1):
+
+        if attempt > 0:
+            time.sleep(random.uniform(0, min(constants.PUT_RECORDS_BACKOFF_MAX,
+                constants.PUT_RECORDS_BACKOFF_BASE * 2 ** attempt)))
+
+        response = kinesis_client.put_records(StreamName=constants.KINESIS_STREAM_NAME,
+            Records=[record for record, message_count in entries])
+
+        # Keep only the rejected records (e.g. ProvisionedThroughputExceededException)
+        failed_entries = [entry for entry, result in zip(entries, response['Records']) if 'ErrorCode' in result]
+
+        with sent_counter.get_lock():
+            sent_counter.value += sum(message_count for record, message_count in entries) - \
+                sum(message_count for record, message_count in failed_entries)
+
+        if not failed_entries:
+            return 0
+        entries = failed_entries
+
+    return sum(message_count for record, message_count in entries)
 
 # --------------------------------------------------------------------------------------------------
-# Generate Message - This function in invoked by every thread
+# Load Profiles and Token Bucket Scheduler
 # --------------------------------------------------------------------------------------------------
 
-def generate_messages(totals, print_to_console):
+# Active profile: LOAD_PROFILE, a constant TARGET_RATE without end or None (as fast as possible)
+def load_profile():
+    if constants.LOAD_PROFILE is not None:
+        return constants.LOAD_PROFILE
+    if constants.TARGET_RATE > 0:
+        return {'type': 'constant', 'rate': constants.TARGET_RATE}
+    return None
+
+# Length of a profile in seconds, None if it has no end
+def profile_duration(profile):
+    if profile['type'] == 'step':
+        return len(profile['rates']) * profile['step_duration']
+    if profile['type'] == 'diurnal':
+        return (len(profile['rates']) - 1) * profile['slot_duration']
+    return profile.get('duration')
 
-    thread_state = dict()
+# Rate of a profile t seconds after its start, None after its end
+def profile_rate(profile, t):
+
+    duration = profile_duration(profile)
+    if duration is not None and t >= duration:
+        return None
+
+    if profile['type'] == 'constant':
+        return profile['rate']
+    if profile['type'] == 'ramp':
+        return profile['start_rate'] + (profile['end_rate'] - profile['start_rate']) * t / duration
+    if profile['type'] == 'step':
+        return profile['rates'][int(t // profile['step_duration'])]
+    if profile['type'] == 'burst':
+        if t % profile['period'] < profile['burst_duration']:
+            return profile['burst_rate']
+        return profile['rate']
+    if profile['type'] == 'diurnal':
+        slot, position = divmod(t / profile['slot_duration'], 1)
+        rates = profile['rates']
+        return rates[int(slot)] + (rates[int(slot) + 1] - rates[int(slot)]) * position
+
+    raise ValueError('Unknown load profile type: ' + profile['type'])
+
+# Token Bucket in virtual time: Tokens accrue at this worker's share of the profile rate, every batch
+# takes one token per message. The intended send time of a batch follows from the profile alone and
+# never from how long earlier sends took (open loop), so a slow stream shows up as send delay instead
+# of silently lowering the arrival rate (no coordinated omission).
+class TokenBucket:
+
+    # Granularity of the integration over the profile in seconds
+    RESOLUTION = 0.01
+
+    def __init__(self, profile, share, start_time):
+        self.profile = profile
+        self.share = share
+        self.start_time = start_time
+        self.time = 0.0
+        self.tokens = 0.0
+
+    # Intended send time (epoch seconds) of the next count messages, None if the profile ends before
+    def take(self, count):
+        while self.tokens < count - 1e-9:
+            rate = profile_rate(self.profile, self.time)
+            if rate is None:
+                return None
+            rate *= self.share
+            step = self.RESOLUTION if rate <= 0 else min(self.RESOLUTION, (count - self.tokens) / rate)
+            self.tokens += rate * step
+            self.time += step
+        self.tokens -= count
+        return self.start_time + self.time
+
+# --------------------------------------------------------------------------------------------------
+# Produce - This function is invoked by every thread / process
+# --------------------------------------------------------------------------------------------------
+
+def timed_send_records(kinesis_client, records):
+    send_time = time.time()
+    failed_records = 0
+    for entries in put_records_calls(kinesis_entries(records)):
+        failed_records += send_records(kinesis_client, entries)
+    return failed_records, send_time, time.time()
+
+# Without a profile: number_of_batches as fast as possible. With a profile: Batches at their intended
+# times until the profile ends (or after number_of_batches if the profile has no end).
+def produce(number_of_batches, put_records_size, pipeline_depth, profile, share, schedule_start):
+
+    kinesis_client = functions.get_client(constants.KINESIS_NAME)
+
+    thread_state = GeneratorState()
     thread_totals = dict()
-    
-    
-    # Only designated thread prints
-    if print_to_console:
+    failed_records = 0
+
+    # Send log: (intended time, send time, ack time, number of messages) per batch
+    send_log = list()
+
+    bucket = TokenBucket(profile, share, schedule_start) if profile is not None else None
+    if bucket is not None and profile_duration(profile) is not None:
+        number_of_batches = None
+
+    in_flight = collections.deque()
+    records = []
+    intended_times = []
+
+    # Maximum time records wait for more messages to pack (rate-controlled runs only)
+    linger_time = constants.KINESIS_AGGREGATION_MAX_BUFFER_TIME if constants.KINESIS_AGGREGATION_ACTIVE \
+        else 0
+
+    with ThreadPoolExecutor(max_workers = pipeline_depth) as executor:
+
+        # Pipeline: Keep at most pipeline_depth put_records calls in flight
+        def submit(records, intended_times):
+            nonlocal failed_records
+            if len(in_flight) == pipeline_depth:
+                failed_records += log_send(*in_flight.popleft())
+            in_flight.append((executor.submit(timed_send_records, kinesis_client, records),
+                intended_times))
+
+        def log_send(future, intended_times):
+            chunk_failed_records, send_time, ack_time = future.result()
+            for intended_time, message_count in intended_times:
+                send_log.append((intended_time or send_time, send_time, ack_time, message_count))
+            return chunk_failed_records
+
+        batch_index = 0
+        while number_of_batches is None or batch_index < number_of_batches:
+
+            intended_time = None
+            if bucket is not None:
+                intended_time = bucket.take(constants.BATCH_SIZE)
+                if intended_time is None:
+                    break
+
+                # Send what was collected so far before waiting for a later batch. With record
+                # aggregation the records linger until linger_time after the first one was intended.
+                if intended_time > time.time():
+                    if records and intended_time > intended_times[0][0] + linger_time:
+                        time.sleep(max(0, intended_times[0][0] + linger_time - time.time()))
+                        submit(records, intended_times)
+                        records, intended_times = [], []
+                    time.sleep(max(0, intended_time - time.time()))
+
+            batch = generate_batch(thread_state, thread_totals)
+            records.extend(batch)
+            intended_times.append((intended_time, len(batch)))
+            if len(records) >= put_records_size:
+                submit(records, intended_times)
+                records, intended_times = [], []
+            batch_index += 1
+
+        if records:
+            submit(records, intended_times)
+        for future, intended_times in in_flight:
+            failed_records += log_send(future, intended_times)
+
+    # Add the running totals of the final state
+    if constants.GENERATOR_STORAGE_ACTIVE:
+        for k,v in thread_state.totals().items():
+            functions.dict_entry_add(thread_totals, k, v)
+
+    return thread_totals, failed_records, send_log if bucket is not None else []
+
+# --------------------------------------------------------------------------------------------------
+# Send Log: Every batch and the achieved rate per second, relative to the start of the schedule
+# --------------------------------------------------------------------------------------------------
+
+def write_send_log(send_log, profile, schedule_start):
+
+    send_log.sort()
+    with open(constants.LOAD_PROFILE_SEND_LOG_FILE, 'w') as f:
+        f.write('intended_time,send_time,ack_time,messages,send_delay_ms\n')
+        for intended_time, send_time, ack_time, message_count in send_log:
+            f.write('{:.6f},{:.6f},{:.6f},{},{:.3f}\n'.format(intended_time - schedule_start,
+                send_time - schedule_start, ack_time - schedule_start, message_count,
+                (send_time - intended_time) * 1000))
+
+    # Messages per second: Intended by the profile (scheduled) and acknowledged by Kinesis (achieved)
+    scheduled = collections.Counter()
+    achieved = collections.Counter()
+    send_delays = collections.defaultdict(list)
+    for intended_time, send_time, ack_time, message_count in send_log:
+        second = int(intended_time - schedule_start)
+        scheduled[second] += message_count
+        achieved[int(ack_time - schedule_start)] += message_count
+        send_delays[second].append((send_time - intended_time) * 1000)
+
+    last_second = max(list(scheduled.keys()) + list(achieved.keys()), default = -1)
+    with open(constants.LOAD_PROFILE_RATE_LOG_FILE, 'w') as f:
+        f.write('second,profile_rate,scheduled_rate,achieved_rate,send_delay_max_ms\n')
+        for second in range(last_second + 1):
+            profile_rate_value = profile_rate(profile, second + 0.5)
+            f.write('{},{},{},{},{:.3f}\n'.format(second,
+                '' if profile_rate_value is None else '{:.1f}'.format(profile_rate_value),
+                scheduled[second], achieved[second], max(send_delays[second], default = 0)))
+
+    send_delays = sorted(d for delays in send_delays.values() for d in delays)
+    if send_delays:
+        print('Send delay behind schedule: p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms.'.format(
+            send_delays[len(send_delays) // 2], send_delays[int(len(send_delays) * 0.99)],
+            send_delays[-1]))
+    print('Send log written to ' + constants.LOAD_PROFILE_SEND_LOG_FILE + ', rates per second to ' +
+        constants.LOAD_PROFILE_RATE_LOG_FILE + '.')
+
+# --------------------------------------------------------------------------------------------------
+# Main: Invoke Threads / Processes and Generate Messages
+# --------------------------------------------------------------------------------------------------
+
+def main():
+
+    # Take start time
+    start_time = time.time()
+
+    # Print general info
+    print('\nGenerating items and writing to Kinesis...\n')
+    print("Example message: \n{\n" +
+        "   " + constants.ID_COLUMN_NAME          + ": '0d957288-2913-4dbb-b359-5ec5ff732cac',\n" +
+        "   " + constants.VERSION_COLUMN_NAME     + ": 0,\n" +
+        "   " + constants.VALUE_COLUMN_NAME       + ": " + str(functions.random_value()) + ",\n" +
+        "   " + constants.TIMESTAMP_COLUMN_NAME   + ": " + str(time.time())  + ",\n" +
+        "   " + constants.HIERARCHY_COLUMN_NAME   + ": " + str(functions.random_hierarchy())+ "\n}\n"
+        )
+
+    # Threads: One synchronous put_records call per batch
+    # Processes: Same number of batches spread over the processes, packed and pipelined put_records
+    sent_counter = multiprocessing.get_context('spawn').Value('q', 0)
+    if constants.PRODUCER_ENGINE == 'processes':
+        worker_num = constants.PROCESS_NUM
+        executor = ProcessPoolExecutor(max_workers = worker_num,
+            mp_context = multiprocessing.get_context('spawn'),
+            initializer = init_worker, initargs = (sent_counter,))
+        put_records_size = constants.PUT_RECORDS_BATCH_SIZE
+        pipeline_depth = constants.PUT_RECORDS_PIPELINE_DEPTH
+    else:
+        worker_num = constants.THREAD_NUM
+        executor = ThreadPoolExecutor(max_workers = worker_num,
+            initializer = init_worker, initargs = (sent_counter,))
+        put_records_size = constants.BATCH_SIZE
+        pipeline_depth = 1
+
+    # Record Aggregation: Collect enough messages to fill the put_records calls with packed records
+    if constants.KINESIS_AGGREGATION_ACTIVE:
+        put_records_size *= constants.KINESIS_AGGREGATION_MAX_MESSAGES
+
+    total_batch_count = constants.NUMBER_OF_BATCHES_PER_THREAD * constants.THREAD_NUM
+    batch_counts = [total_batch_count // worker_num + (1 if index < total_batch_count % worker_num else 0)
+        for index in range(worker_num)]
+
+    # Rate control: All workers follow the same schedule, each with an equal share of the rate
+    profile = load_profile()
+    duration = profile_duration(profile) if profile is not None else None
+    schedule_start = time.time() + (constants.LOAD_PROFILE_START_DELAY if profile is not None else 0)
+
+    print('Invoking ' + str(worker_num) + ' ' + constants.PRODUCER_ENGINE + '...\n')
+    with executor:
+        futures = [executor.submit(produce, batch_count, put_records_size, pipeline_depth,
+            profile, 1 / worker_num, schedule_start) for batch_count in batch_counts]
+
+        # Print progress and speed until all workers finished
         print_interval_start_time = time.time()
-        print_interval_start_batch = 0
+        print_interval_start_count = 0
         speed = 0
-    
-    for i in range(constants.NUMBER_OF_BATCHES_PER_THREAD):
-        
-        # Only designated thread prints
-        if print_to_console:
-
-            # Print Speed
+        while concurrent.futures.wait(futures, timeout = 0.5).not_done:
             current_time = time.time()
             time_diff = current_time - print_interval_start_time
             if time_diff > constants.TIME_INTERVAL_SPEED_CALCULATION:
-                speed = (i - print_interval_start_batch) * \
-                    constants.THREAD_NUM * constants.BATCH_SIZE / time_diff
+                speed = (sent_counter.value - print_interval_start_count) / time_diff
                 print_interval_start_time = current_time
-                print_interval_start_batch = i
-
-            # Print Progress
-            progress = (i / constants.NUMBER_OF_BATCHES_PER_THREAD) * 100
-            functions.print_progress_bar(progress, speed)
-            
-    
-        # Initialize record list for this batch
-        records = []
-        
-        # Calculate number of duplicates that are added at the end
-        if constants.DUPLICATES_PER_BATCH < constants.BATCH_SIZE:
-            number_of_duplicate_messages = constants.DUPLICATES_PER_BATCH
-        else:
-            number_of_duplicate_messages = max(0, constants.BATCH_SIZE - 1)
-        
-        # Create Batch
-        for j in range(constants.BATCH_SIZE - number_of_duplicate_messages):
-            
-            # Initialize Empty Message
-            message = {}
-            
-            # Random decision: Modify or New Entry
-            if len(thread_state) == 0 or \
-                random.uniform(0,100) < (100 - constants.PERCENTAGE_MODIFY):
-
-                # -> New Entry
-
-                # Generate ID
-                message[constants.ID_COLUMN_NAME] = str(uuid.uuid4())
-                
-                # Add Version
-                message[constants.VERSION_COLUMN_NAME] = 0
-                
-                # Count
-                functions.dict_entry_add(thread_totals, 'count:add', 1)
-                
+                print_interval_start_count = sent_counter.value
+            if duration is not None:
+                progress = min(100, max(0, current_time - schedule_start) / duration * 100)
             else:
+                progress = sent_counter.value / (total_batch_count * constants.BATCH_SIZE) * 100
+            functions.print_progress_bar(progress, speed)
 
-                # -> Modify
-
-                # Pick existing ID
-                message[constants.ID_COLUMN_NAME] = random.choice(list(thread_state.keys()))
-                
-                # Get New Version
-                if thread_state[message[constants.ID_COLUMN_NAME]][constants.VERSION_COLUMN_NAME] == 0 or \
-                    random.uniform(1,100) < (100 - constants.PERCENTAGE_OUT_OR_ORDER):
-                    # Iterate Version
-                    message[constants.VERSION_COLUMN_NAME] = \
-                        thread_state[message[constants.ID_COLUMN_NAME]][constants.VERSION_COLUMN_NAME] + 1
-                    functions.dict_entry_add(thread_totals, 'count:modify:in_order', 1)
-                else:
-                    # Insert Older Version
-                    message[constants.VERSION_COLUMN_NAME] = \
-                        thread_state[message[constants.ID_COLUMN_NAME]][constants.VERSION_COLUMN_NAME] - 1
-                    functions.dict_entry_add(thread_totals, 'count:modify:out_of_order', 1)
-                
-            # Add Random Value 
-            message[constants.VALUE_COLUMN_NAME] = functions.random_value()
-            
-            # Add Random Hierarchy
-            message[constants.HIERARCHY_COLUMN_NAME] = functions.random_hierarchy()
-            
-            # Add Timestamp
-            message[constants.TIMESTAMP_COLUMN_NAME] = time.time()
-            
-            # Dump to String
-            message_string = json.dumps(message)
-            
-            # Append to Record List
-            record = {'Data' : message_string, 'PartitionKey' : 
-                hashlib.sha256(message_string.encode()).hexdigest()}
-            records.append(record)
-            
-            # Append to Internal Storage - if message was sent in order
-            if constants.GENERATOR_STORAGE_ACTIVE:
-                if (message[constants.ID_COLUMN_NAME] not in thread_state) or \
-                    (thread_state[message[constants.ID_COLUMN_NAME]][constants.VERSION_COLUMN_NAME] \
-                    < message[constants.VERSION_COLUMN_NAME]):
-                    thread_state[message[constants.ID_COLUMN_NAME]] = message
-    
-        # Add Duplicates
-        for k in range(number_of_duplicate_messages):
-            duplicate_index = random.randint(0, constants.BATCH_SIZE - number_of_duplicate_messages - 1)
-            records.append(records[duplicate_index])
-        
-        functions.dict_entry_add(thread_totals, 'count:duplicates', number_of_duplicate_messages)
-
-        # Send Batch to Kinesis Stream
-        response = kinesis_client.put_records(StreamName=constants.KINESIS_STREAM_NAME,Records=records)
+        # Add to Totals
+        totals = dict()
+        failed_records = 0
+        send_log = list()
+        for future in futures:
+            worker_totals, worker_failed_records, worker_send_log = future.result()
+            failed_records += worker_failed_records
+            send_log.extend(worker_send_log)
+            for k,v in worker_totals.items():
+                functions.dict_entry_add(totals, k, v)
+
+    print('\n\nAll ' + constants.PRODUCER_ENGINE + ' finished.\n')
+
+    # Print to Console
+    end_time = time.time()
+    ingestion_time = end_time - start_time
+    total_message_count = sent_counter.value + failed_records
+    print(f'\nSimple Data producer finished!')
+    print(f'Total number of messages: {total_message_count}.')
+    print(f'Messages rejected by Kinesis after {constants.PUT_RECORDS_MAX_RETRIES} retries: {failed_records}.')
+    print(f'Total ingestion time: {ingestion_time:.1f} seconds.')
+    print(f'Average ingestion rate: {total_message_count / ingestion_time:.1f} messages / second.')
+    if profile is not None:
+        write_send_log(send_log, profile, schedule_start)
+
+    # ----------------------------------------------------------------------------------------------
+    # Print Totals to check consistency of pipeline
+    # ----------------------------------------------------------------------------------------------
 
     if constants.GENERATOR_STORAGE_ACTIVE:
-        # Aggregate over Final State
-        for entry in thread_state.values():
-            k = functions.hierarchy_to_string(entry[constants.HIERARCHY_COLUMN_NAME], constants.AGGREGATION_HIERARCHY)
-            v = entry[constants.VALUE_COLUMN_NAME]
-            functions.dict_entry_add(thread_totals, k, v)
 
-        # Add to Totals
-        for k,v in thread_totals.items():
-            functions.dict_entry_add(totals, k, v)
-
-# --------------------------------------------------------------------------------------------------
-# Main: Invoke Threads and Generate Messages
-# --------------------------------------------------------------------------------------------------
-
-# Initialize Kinesis Consumer
-kinesis_client = boto3.client(constants.KINESIS_NAME, region_name=constants.REGION_NAME)
-
-# Take start time
-start_time = time.time()
-
-# Print general info
-print('\nGenerating items and writing to Kinesis...\n')
-print("Example message: \n{\n" +
-    "   " + constants.ID_COLUMN_NAME          + ": '0d957288-2913-4dbb-b359-5ec5ff732cac',\n" +
-    "   " + constants.VERSION_COLUMN_NAME     + ": 0,\n" + 
-    "   " + constants.VALUE_COLUMN_NAME       + ": " + str(functions.random_value()) + ",\n" + 
-    "   " + constants.TIMESTAMP_COLUMN_NAME   + ": " + str(time.time())  + ",\n" + 
-    "   " + constants.HIERARCHY_COLUMN_NAME   + ": " + str(functions.random_hierarchy())+ "\n}\n"
-    )
-
-# Invoke Threads
-totals = dict()
-threads = list()
-
-print('Invoking ' + str(constants.THREAD_NUM) + ' threads...\n')
-for index in range(constants.THREAD_NUM):
-    x = threading.Thread(target=generate_messages, args=(totals, index == (constants.THREAD_NUM - 1),))
-    threads.append(x)
-    x.start()
-
-for index, thread in enumerate(threads):
-    thread.join()
-    
-print('\n\nAll threads finished.\n')
-    
-# Print to Console
-end_time = time.time()
-total_message_count = \
-    constants.BATCH_SIZE * constants.NUMBER_OF_BATCHES_PER_THREAD * constants.THREAD_NUM
-ingestion_time = end_time - start_time
-print(f'\nSimple Data producer finished!')
-print(f'Total number of messages: {total_message_count}.')
-print(f'Total ingestion time: {ingestion_time:.1f} seconds.')
-print(f'Average ingestion rate: {total_message_count / ingestion_time:.1f} messages / second.')
-
-# --------------------------------------------------------------------------------------------------
-# Print Totals to check consistency of pipeline
-# --------------------------------------------------------------------------------------------------
-
-if constants.GENERATOR_STORAGE_ACTIVE:
-
-    totals = functions.aggregate_along_tree(totals)
-    ordered_totals = collections.OrderedDict(sorted(totals.items()))
-    print('\nMessage Counts:\n')
-    for k,v in ordered_totals.items():
-        if k[:5] == 'count':
-            level = k.count(':') 
-            print('{:<25}'.format(k) + (' ' * level) + '{:>10}'.format(v))
-
-    print('\nTotals:\n')
-    for k,v in ordered_totals.items():
-        if k[:5] != 'count':
-            level = k.count(':') 
-            print('{:<35}'.format(k) + (' ' * level) + '{:10.2f}'.format(v))
-    print('\n')
\ No newline at end of file
+        totals = functions.aggregate_along_tree(totals)
+        ordered_totals = collections.OrderedDict(sorted(totals.items()))
+        print('\nMessage Counts:\n')
+        for k,v in ordered_totals.items():
+            if k[:5] == 'count':
+                level = k.count(':')
+                print('{:<25}'.format(k) + (' ' * level) + '{:>10}'.format(v))
+
+        print('\nTotals:\n')
+        for k,v in ordered_totals.items():
+            if k[:5] != 'count':
+                level = k.count(':')
+                print('{:<35}'.format(k) + (' ' * level) + '{:10.2f}'.format(v))
+        print('\n')
+
+if __name__ == '__main__':
+    main()
@@ -6,18 +6,15 @@
 # --------------------------------------------------------------------------------------------------
 
 # General Imports
-import json
 import hashlib
 import random
 import time
 
-# AWS Imports
-import boto3
-from botocore.exceptions import ClientError
-
 # Project Imports
 import functions
 import constants
+import latency_sketch
+from stage_timer import StageTimer
 
 if constants.TRACK_PERFORMANCE:
     from performance_tracker import EventsCounter, PerformanceTrackerInitializer
@@ -31,7 +28,15 @@ if constants.TRACK_PERFORMANCE:
             True, constants.INFLUX_CONNECTION_STRING, constants.GRAFANA_INSTANCE_IP
         )
     event_counter = EventsCounter(['reduce_lambda_batch_size', 'reduce_lambda_message_count',
-        'reduce_lambda_random_failures', 'end_to_end_latency_max', 'end_to_end_latency_mean'])
+        'reduce_lambda_random_failures', 'end_to_end_latency_max', 'end_to_end_latency_mean',
+        'end_to_end_latency_p50_ms', 'end_to_end_latency_p99_ms', 'end_to_end_latency_p999_ms',
+        'reduce_lambda_omitted_updates'])
+
+# --------------------------------------------------------------------------------------------------
+# Initialize AWS Clients (reused across invocations of a warm container)
+# --------------------------------------------------------------------------------------------------
+
+ddb_client = functions.get_client(constants.DYNAMO_NAME)
 
 # --------------------------------------------------------------------------------------------------
 # Lambda Function
@@ -43,17 +48,24 @@ def lambda_handler(event, context):
     records = event['Records']
     print('Invoked ReduceLambda with ' + str(len(records)) + ' Delta message(s).')
 
+    # Time the stages of this invocation
+    timer = StageTimer('reduce_lambda')
+
     # Initialize Dict for Total Delta
     totals = dict()
 
-    # Initialize DDB Ressource
-    ddb_ressource = boto3.resource(constants.DYNAMO_NAME, region_name=constants.REGION_NAME)
-
     # Calculate hash to ensure this batch hasn't been processed already:
-    record_list_hash = hashlib.md5(str(records).encode()).hexdigest()
+    record_list_hash = functions.batch_fingerprint(records, hashlib.md5)
+    timer.mark('hash')
 
     # Keep track of number of batches for timestamp mean
     batch_count = 0
+
+    # Latency sketches of all deltas, shifted to the newest record of this batch
+    # --> Taken from the batch (not the clock) so that a retry builds exactly the same transactions
+    # --> Deltas are written before their stream record, so most sketches are shifted only once
+    latency_sketches = {'Reference': max(record[constants.DYNAMO_NAME]['ApproximateCreationDateTime']
+        for record in records), 'Leaves': dict()}
     
     # Iterate over Messages
     for record in event['Records']:
@@ -61,9 +73,8 @@ def lambda_handler(event, context):
         # Aggregate over Batch of Messages the Lambda was invoked with
         if 'NewImage' in record[constants.DYNAMO_NAME]:
 
-            # Load Message to Dict
-            message = record[constants.DYNAMO_NAME]['NewImage']['Message']['S'].replace("'",'"')
-            data = json.loads(message)
+            # Load Message to Dict (binary or JSON format)
+            data = functions.delta_from_image(record[constants.DYNAMO_NAME]['NewImage'])
 
             # Get Batch Count (To Calculate Mean of Timestamp)
             batch_count += 1
@@ -72,28 +83,30 @@ def lambda_handler(event, context):
             for entry in data:
                 if entry == constants.TIMESTAMP_GENERATOR_FIRST:
                     functions.dict_entry_min(totals, entry, data[entry])
+                elif entry == constants.LATENCY_SKETCH_NAME:
+                    latency_sketches = functions.merge_latency_sketches(latency_sketches, data[entry])
                 else:
                     functions.dict_entry_add(totals, entry, data[entry])
 
+    timer.mark('decode')
+
     # If this batch contains only deletes: Done
     if not totals:
         print('Skipped batch - no new entries.')
+        timer.finish()
         return {'statusCode': 200}
 
-    # Get Timestamps
-    if constants.TRACK_PERFORMANCE:
-        timestamp_generator_first = totals[constants.TIMESTAMP_GENERATOR_FIRST]
-        del totals[constants.TIMESTAMP_GENERATOR_FIRST]
-        timestamp_generator_mean = totals[constants.TIMESTAMP_GENERATOR_MEAN] / batch_count
-        del totals[constants.TIMESTAMP_GENERATOR_MEAN]
+    # Get Timestamps (not written to the AggregateTable, every reducer partition receives them)
+    timestamp_generator_first = totals.pop(constants.TIMESTAMP_GENERATOR_FIRST)
+    timestamp_generator_mean = totals.pop(constants.TIMESTAMP_GENERATOR_MEAN) / batch_count
 
-    # Total Count of New Messages (for Printing)
-    total_new_message_count = totals[constants.MESSAGE_COUNT_NAME]
-    
-    # Update all Values within one single transaction
-    ddb_client = boto3.client(constants.DYNAMO_NAME, region_name=constants.REGION_NAME)
+    # Total Count of New Messages (for Printing, only reduced by partition 0)
+    total_new_message_count = totals.get(constants.MESSAGE_COUNT_NAME, 0)
+
+    # Omit totals without change (ADD 0 would still cost a write per aggregate)
+    unchanged_total_count = functions.drop_zero_entries(totals)
     
-    # Batch of Items
+    # Batch of Items, sorted by key so that a retry builds exactly the same transactions
     batch = [ 
         { 'Update': 
             {
@@ -101,42 +114,68 @@ def lambda_handler(event, context):
                 'Key' : {constants.AGGREGATE_TABLE_KEY : {'S' : entry}},
                 'UpdateExpression' : "ADD #val :val ",
                 'ExpressionAttributeValues' : {
-                    ':val': {'N' : str(totals[entry])}
+                    ':val': {'N' : functions.aggregate_number_string(entry, totals[entry])}
                 },
                 'ExpressionAttributeNames': { 
                     "#val" : "Value" 
                 }
             }
-        } for entry in totals.keys()]
+        } for entry in sorted(totals.keys())]
+
+    # Bucket counts of the latency sketches per leaf
+    batch += functions.latency_transact_items(latency_sketches['Leaves'])
+    timer.mark('serialize')
+
+    # If the deltas cancel out completely: Nothing to write
+    if not batch:
+        print('Skipped batch - ' + str(unchanged_total_count) + ' aggregate(s) without change.')
+        timer.finish()
+        return {'statusCode': 200}
+
+    # Update all Values in transactions of at most REDUCE_TRANSACTION_MAX_ITEMS items each
+    # --> The chunks touch disjoint keys and are written concurrently
+    # --> With SNAPSHOT_ACTIVE, the snapshot of the partition is committed with the updates
+    if constants.SNAPSHOT_ACTIVE:
+        partition = functions.delta_table_partition(records[0]['eventSourceARN'])
+        applied_chunk_count, chunk_count = functions.transact_write_with_snapshot(
+            ddb_client, batch, record_list_hash, partition, totals)
+    else:
+        applied_chunk_count, chunk_count = \
+            functions.transact_write_chunked(ddb_client, batch, record_list_hash)
+    timer.mark('write')
+    timer.finish()
+
+    if applied_chunk_count == 0:
+        print('Batch was already processed. Skipping this one.')
+        return {'statusCode': 200}
 
-    try:
-        response = ddb_client.transact_write_items(
-            TransactItems = batch,
-            ClientRequestToken = record_list_hash
-        )
-    except ClientError as e:
-        if e.response['Error']['Code']=='IdempotentParameterMismatchException':  
-            print('Batch was already processed. Skipping this one.')
-            return {'statusCode': 200}
-        else:
-            raise Exception(e)
-        
     # Performance Tracker
     if constants.TRACK_PERFORMANCE:
         event_counter.increment('reduce_lambda_batch_size', len(records))
         event_counter.increment('reduce_lambda_message_count', total_new_message_count)
-        event_counter.increment('end_to_end_latency_max', 
+        event_counter.increment('reduce_lambda_omitted_updates', unchanged_total_count)
+        event_counter.set('end_to_end_latency_max', 
             float(time.time() - timestamp_generator_first))
-        event_counter.increment('end_to_end_latency_mean', 
+        event_counter.set('end_to_end_latency_mean', 
             float(time.time() - timestamp_generator_mean))
 
+        # Quantiles over all leafs of this batch
+        if latency_sketches['Leaves']:
+            batch_sketch = dict()
+            for sketch in latency_sketches['Leaves'].values():
+                latency_sketch.merge(batch_sketch, sketch)
+            event_counter.set('end_to_end_latency_p50_ms', latency_sketch.quantile(batch_sketch, 0.5))
+            event_counter.set('end_to_end_latency_p99_ms', latency_sketch.quantile(batch_sketch, 0.99))
+            event_counter.set('end_to_end_latency_p999_ms', latency_sketch.quantile(batch_sketch, 0.999))
+
     # Manually Introduced Random Failure    
     if random.uniform(0,100) < constants.FAILURE_REDUCE_LAMBDA_PCT:
 
         # Submit Performance Measurements
         if constants.TRACK_PERFORMANCE:
             event_counter.increment('reduce_lambda_random_failures', 1)
-            perf_tracker.add_metric_sample(None, event_counter, None, None)
+            perf_tracker.add_metric_sample(timer.stats_dic, event_counter, timer.first_event(),
+                timer.last_event())
             perf_tracker.submit_measurements()
         
         # Raise Exception
@@ -144,10 +183,14 @@ def lambda_handler(event, context):
 
     # Submit Performance Measurements
     if constants.TRACK_PERFORMANCE:
-        perf_tracker.add_metric_sample(None, event_counter, None, None)
+        perf_tracker.add_metric_sample(timer.stats_dic, event_counter, timer.first_event(),
+            timer.last_event())
         perf_tracker.submit_measurements()
 
     # Print Status at End
-    print('ReduceLambda finished. Updates aggregates with ' + str(total_new_message_count) + ' new message(s) in total.')
+    print('ReduceLambda finished. Updates aggregates with ' + str(total_new_message_count) + \
+        ' new message(s) in total, written in ' + str(chunk_count) + ' transaction(s), ' + \
+        str(chunk_count - applied_chunk_count) + ' skipped as already processed, ' + \
+        str(unchanged_total_count) + ' aggregate(s) without change omitted.')
 
     return {'statusCode': 200}
\ No newline at end of file
@@ -0,0 +1,339 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import re
+import copy
+import json
+import time
+import uuid
+import base64
+import threading
+import collections
+from decimal import Decimal
+
+# AWS Imports
+from botocore.exceptions import ClientError
+
+# --------------------------------------------------------------------------------------------------
+# In-process DynamoDB Stand-In
+# --------------------------------------------------------------------------------------------------
+#
+# Implements the subset of the low-level DynamoDB client API used by the Lambdas of this project:
+# get_item, put_item, update_item, transact_write_items, batch_get_item and scan, with condition
+# expressions (comparisons, AND / OR / NOT, attribute_exists / attribute_not_exists), SET and ADD
+# update expressions and ClientRequestToken idempotency for transactions. Every write is appended to
+# the stream of its table, in the format Lambda delivers DynamoDB stream records.
+
+STREAM_ARN_SUFFIX = '/stream/2024-01-01T00:00:00.000'
+
+# Typed DynamoDB value -> comparable Python value
+def plain_value(typed_value):
+    if typed_value is None:
+        return None
+    (value_type, value), = typed_value.items()
+    if value_type == 'N':
+        return Decimal(value)
+    return value
+
+# Stream images carry binary attributes base64 encoded, like the events Lambda receives
+def stream_image(item):
+    image = dict()
+    for name, typed_value in item.items():
+        if 'B' in typed_value:
+            image[name] = {'B': base64.b64encode(typed_value['B']).decode()}
+        else:
+            image[name] = copy.deepcopy(typed_value)
+    return image
+
+# --------------------------------------------------------------------------------------------------
+# Expressions
+# --------------------------------------------------------------------------------------------------
+
+EXPRESSION_TOKEN = re.compile(r'\s*(<>|<=|>=|[=<>(),]|[#:]?[A-Za-z0-9_.\-]+)')
+
+def tokenize(expression):
+    tokens = EXPRESSION_TOKEN.findall(expression)
+    if ''.join(tokens) != re.sub(r'\s+', '', expression):
+        raise ValueError('Unsupported expression: ' + expression)
+    return tokens
+
+class Condition:
+
+    def __init__(self, expression, names, values):
+        self.tokens = tokenize(expression)
+        self.names = names or dict()
+        self.values = values or dict()
+
+    def evaluate(self, item):
+        self.item = item or dict()
+        self.position = 0
+        result = self.parse_or()
+        if self.position != len(self.tokens):
+            raise ValueError('Unsupported condition: ' + ' '.join(self.tokens))
+        return result
+
+    def peek(self):
+        return self.tokens[self.position].upper() if self.position < len(self.tokens) else None
+
+    def take(self):
+        self.position += 1
+        return self.tokens[self.position - 1]
+
+    def parse_or(self):
+        result = self.parse_and()
+        while self.peek() == 'OR':
+            self.take()
+            result = self.parse_and() or result
+        return result
+
+    def parse_and(self):
+        result = self.parse_unary()
+        while self.peek() == 'AND':
+            self.take()
+            result = self.parse_unary() and result
+        return result
+
+    def parse_unary(self):
+        if self.peek() == 'NOT':
+            self.take()
+            return not self.parse_unary()
+        if self.peek() == '(':
+            self.take()
+            result = self.parse_or()
+            self.take()
+            return result
+        if self.peek() in ('ATTRIBUTE_EXISTS', 'ATTRIBUTE_NOT_EXISTS'):
+            function = self.take().lower()
+            self.take()
+            exists = self.resolve_name(self.take()) in self.item
+            self.take()
+            return exists if function == 'attribute_exists' else not exists
+        left = self.operand(self.take())
+        operator = self.take()
+        right = self.operand(self.take())
+        if left is None or right is None:
+            return operator == '<>'
+        return {
+            '=': left == right, '<>': left != right, '<': left < right,
+            '<=': left <= right, '>': left > right, '>=': left >= right
+        }[operator]
+
+    def resolve_name(self, token):
+        return self.names.get(token, token)
+
+    def operand(self, token):
+        if token.startswith(':'):
+            return plain_value(self.values[token])
+        return plain_value(self.item.get(self.resolve_name(token)))
+
+# Apply SET and ADD clauses of an update expression to an item
+def apply_update(item, expression, names, values):
+
+    names = names or dict()
+    for clause, body in re.findall(r'(SET|ADD)\s+(.*?)(?=\s+(?:SET|ADD)\s+|$)', expression.strip(),
+        flags = re.IGNORECASE | re.DOTALL):
+
+        for action in body.split(','):
+            if clause.upper() == 'SET':
+                name, value = [part.strip() for part in action.split('=')]
+                item[names.get(name, name)] = copy.deepcopy(values[value])
+            else:
+                name, value = action.split()
+                name = names.get(name, name)
+                if name in item:
+                    item[name] = {'N': str(Decimal(item[name]['N']) + Decimal(values[value]['N']))}
+                else:
+                    item[name] = copy.deepcopy(values[value])
+
+# --------------------------------------------------------------------------------------------------
+# Client
+# --------------------------------------------------------------------------------------------------
+
+class LocalDynamoDB:
+
+    def __init__(self, key_names, region_name = 'us-east-1', account_id = '123456789012'):
+
+        # Table Name -> Name of the hash key, tables are created on first use
+        self.key_names = key_names
+        self.arn_prefix = 'arn:aws:dynamodb:' + region_name + ':' + account_id + ':table/'
+
+        self.lock = threading.RLock()
+        self.tables = collections.defaultdict(dict)
+        self.streams = collections.defaultdict(list)
+        self.transaction_tokens = dict()
+        self.call_counts = collections.Counter()
+        self.sequence_number = 0
+
+    # Hash key of an item
+    def key_of(self, table_name, item):
+        key_name = self.key_names[table_name]
+        return key_name, json.dumps(item[key_name], sort_keys = True)
+
+    def client_error(self, code, operation, message = '', **extra):
+        return ClientError({'Error': {'Code': code, 'Message': message}, **extra}, operation)
+
+    # Write an item and append the change to the stream of the table
+    def write(self, table_name, new_item):
+        key_name, key = self.key_of(table_name, new_item)
+        old_item = self.tables[table_name].get(key)
+        self.tables[table_name][key] = new_item
+
+        self.sequence_number += 1
+        record = {
+            'eventID': uuid.uuid4().hex,
+            'eventName': 'INSERT' if old_item is None else 'MODIFY',
+            'eventVersion': '1.1',
+            'eventSource': 'aws:dynamodb',
+            'dynamodb': {
+                'ApproximateCreationDateTime': time.time(),
+                'Keys': {key_name: copy.deepcopy(new_item[key_name])},
+                'NewImage': stream_image(new_item),
+                'SequenceNumber': str(self.sequence_number),
+                'SizeBytes': len(json.dumps(stream_image(new_item))),
+                'StreamViewType': 'NEW_AND_OLD_IMAGES'
+            },
+            'eventSourceARN': self.arn_prefix + table_name + STREAM_ARN_SUFFIX
+        }
+        if old_item is not None:
+            record['dynamodb']['OldImage'] = stream_image(old_item)
+        self.streams[table_name].append(record)
+
+    def check(self, table_name, key_item, expression, names, values, operation):
+        if expression is None:
+            return
+        current_item = self.tables[table_name].get(self.key_of(table_name, key_item)[1])
+        if not Condition(expression, names, values).evaluate(current_item):
+            raise self.client_error('ConditionalCheckFailedException', operation,
+                'The conditional request failed')
+
+    def updated_item(self, table_name, Key, UpdateExpression, ExpressionAttributeNames = None,
+        ExpressionAttributeValues = None):
+        item = copy.deepcopy(self.tables[table_name].get(self.key_of(table_name, Key)[1], Key))
+        apply_update(item, UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues)
+        return item
+
+    # --- API ---------------------------------------------------------------------------------------
+
+    def get_item(self, TableName, Key, ConsistentRead = False, **kwargs):
+        with self.lock:
+            self.call_counts['GetItem'] += 1
+            item = self.tables[TableName].get(self.key_of(TableName, Key)[1])
+            return {'Item': copy.deepcopy(item)} if item is not None else dict()
+
+    def put_item(self, TableName, Item, ConditionExpression = None, ExpressionAttributeNames = None,
+        ExpressionAttributeValues = None, **kwargs):
+        with self.lock:
+            self.call_counts['PutItem'] += 1
+            self.check(TableName, Item, ConditionExpression, ExpressionAttributeNames,
+                ExpressionAttributeValues, 'PutItem')
+            self.write(TableName, copy.deepcopy(Item))
+            return dict()
+
+    def update_item(self, TableName, Key, UpdateExpression, ConditionExpression = None,
+        ExpressionAttributeNames = None, ExpressionAttributeValues = None, **kwargs):
+        with self.lock:
+            self.call_counts['UpdateItem'] += 1
+            self.check(TableName, Key, ConditionExpression, ExpressionAttributeNames,
+                ExpressionAttributeValues, 'UpdateItem')
+            self.write(TableName, self.updated_item(TableName, Key, UpdateExpression,
+                ExpressionAttributeNames, ExpressionAttributeValues))
+            return dict()
+
+    def transact_write_items(self, TransactItems, ClientRequestToken = None, **kwargs):
+        with self.lock:
+            self.call_counts['TransactWriteItems'] += 1
+
+            # Idempotency: Same token and parameters -> success without applying again
+            if ClientRequestToken is not None:
+                parameters = json.dumps(TransactItems, sort_keys = True, default = str)
+                if ClientRequestToken in self.transaction_tokens:
+                    if self.transaction_tokens[ClientRequestToken] != parameters:
+                        raise self.client_error('IdempotentParameterMismatchException',
+                            'TransactWriteItems')
+                    return dict()
+
+            # Check all conditions first, the transaction is applied completely or not at all
+            reasons = list()
+            writes = list()
+            for transact_item in TransactItems:
+                (action, request), = transact_item.items()
+                table_name = request['TableName']
+                key_item = request['Item'] if action == 'Put' else request['Key']
+                try:
+                    self.check(table_name, key_item, request.get('ConditionExpression'),
+                        request.get('ExpressionAttributeNames'),
+                        request.get('ExpressionAttributeValues'), 'TransactWriteItems')
+                    reasons.append({'Code': 'None'})
+                except ClientError:
+                    reasons.append({'Code': 'ConditionalCheckFailed'})
+                if action == 'Put':
+                    writes.append((table_name, copy.deepcopy(request['Item'])))
+                elif action == 'Update':
+                    writes.append((table_name, self.updated_item(table_name, request['Key'],
+                        request['UpdateExpression'], request.get('ExpressionAttributeNames'),
+                        request.get('ExpressionAttributeValues'))))
+
+            if any(reason['Code'] != 'None' for reason in reasons):
+                raise self.client_error('TransactionCanceledException', 'TransactWriteItems',
+                    'Transaction cancelled', CancellationReasons = reasons)
+
+            for table_name, item in writes:
+                self.write(table_name, item)
+            if ClientRequestToken is not None:
+                self.transaction_tokens[ClientRequestToken] = parameters
+            return dict()
+
+    def transact_get_items(self, TransactItems, **kwargs):
+        with self.lock:
+            self.call_counts['TransactGetItems'] += 1
+            responses = list()
+            for transact_item in TransactItems:
+                request = transact_item['Get']
+                item = self.tables[request['TableName']].get(
+                    self.key_of(request['TableName'], request['Key'])[1])
+                responses.append({'Item': copy.deepcopy(item)} if item is not None else dict())
+            return {'Responses': responses}
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        with self.lock:
+            self.call_counts['BatchGetItem'] += 1
+            responses = dict()
+            for table_name, request in RequestItems.items():
+                responses[table_name] = [copy.deepcopy(self.tables[table_name][key])
+                    for key in [self.key_of(table_name, k)[1] for k in request['Keys']]
+                    if key in self.tables[table_name]]
+            return {'Responses': responses, 'UnprocessedKeys': dict()}
+
+    def scan(self, TableName, Segment = 0, TotalSegments = 1, Select = None, Limit = None,
+        ExclusiveStartKey = None, **kwargs):
+        with self.lock:
+            self.call_counts['Scan'] += 1
+            keys = sorted(key for key in self.tables[TableName]
+                if hash(key) % TotalSegments == Segment)
+            if ExclusiveStartKey is not None:
+                start_key = self.key_of(TableName, ExclusiveStartKey)[1]
+                keys = [key for key in keys if key > start_key]
+            response = dict()
+            if Limit is not None and len(keys) > Limit:
+                keys = keys[:Limit]
+                last_item = self.tables[TableName][keys[-1]]
+                key_name = self.key_names[TableName]
+                response['LastEvaluatedKey'] = {key_name: copy.deepcopy(last_item[key_name])}
+            response['Count'] = len(keys)
+            if Select != 'COUNT':
+                response['Items'] = [copy.deepcopy(self.tables[TableName][key]) for key in keys]
+            return response
+
+    # --- Streams -----------------------------------------------------------------------------------
+
+    # Take all stream records of a table written since the last call
+    def read_stream(self, table_name):
+        with self.lock:
+            records = self.streams[table_name]
+            self.streams[table_name] = list()
+            return records
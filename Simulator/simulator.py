@@ -0,0 +1,458 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+# --------------------------------------------------------------------------------------------------
+# Imports
+# --------------------------------------------------------------------------------------------------
+
+# General Imports
+import os
+import sys
+import zlib
+import json
+import time
+import random
+import hashlib
+import decimal
+import datetime
+import contextlib
+import collections
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+# Project Imports
+sys.path.append('../Common')
+sys.path.append('../Benchmarks')
+import functions
+import constants
+import latency_sketch
+import synthetic_events
+from local_dynamodb import LocalDynamoDB
+
+# --------------------------------------------------------------------------------------------------
+# Settings
+# --------------------------------------------------------------------------------------------------
+#
+# Runs the real Lambda handlers of the scenario in constants.SCENARIO end to end on this machine:
+# Kinesis and the DynamoDB Streams are emulated by in-memory event source mappings, DynamoDB by
+# LocalDynamoDB. All messages are written to Kinesis at the start, the simulator then measures how
+# fast the pipeline drains them.
+
+NUMBER_OF_MESSAGES                  = 20000
+PERCENTAGE_MODIFY                   = 20
+PERCENTAGE_DUPLICATE                = 0
+
+# Share of the modifies that only increment the version (same value and hierarchy)
+PERCENTAGE_UNCHANGED_MODIFY         = 0
+
+# Shards of the Kinesis stream (an on-demand stream starts with 4) and of every DynamoDB stream
+KINESIS_SHARD_COUNT                 = 4
+DYNAMO_STREAM_SHARD_COUNT           = 1
+
+# Event source mappings, defaults as in the CloudFormation templates
+EVENT_SOURCE_MAPPINGS = {
+    'StateLambda': {
+        'BatchSize': 100,   'ParallelizationFactor': 10,
+        'MaximumBatchingWindowInSeconds': 0, 'TumblingWindowInSeconds': 0
+    },
+    'MapLambda': {
+        'BatchSize': 10000, 'ParallelizationFactor': 1,
+        'MaximumBatchingWindowInSeconds': 3, 'TumblingWindowInSeconds': 0
+    },
+    'StatelessMapLambda': {
+        'BatchSize': 10000, 'ParallelizationFactor': 1,
+        'MaximumBatchingWindowInSeconds': 0, 'TumblingWindowInSeconds': 0
+    },
+    'ReduceLambda': {
+        'BatchSize': 1000,  'ParallelizationFactor': 1,
+        'MaximumBatchingWindowInSeconds': 0, 'TumblingWindowInSeconds': 0
+    }
+}
+
+# Seconds between two polls of the event source mappings when no batch was ready
+POLL_INTERVAL                       = 0.01
+
+# Print the output of the Lambdas
+LAMBDA_LOGS                         = False
+
+# --------------------------------------------------------------------------------------------------
+# Local DynamoDB and Lambdas
+# --------------------------------------------------------------------------------------------------
+
+key_names = {
+    constants.STATE_TABLE_NAME:     constants.STATE_TABLE_KEY,
+    constants.AGGREGATE_TABLE_NAME: constants.AGGREGATE_TABLE_KEY
+}
+for partition in range(constants.REDUCER_COUNT):
+    key_names[functions.delta_table_name(partition)] = constants.DELTA_TABLE_KEY
+
+local_dynamodb = LocalDynamoDB(key_names, constants.REGION_NAME)
+functions.boto3_clients[(constants.DYNAMO_NAME, None)] = local_dynamodb
+
+# Load a Lambda (after the local client was registered, so the module level client is the local one)
+def load_lambda(name):
+    spec = importlib.util.spec_from_file_location(name, '../' + name + '/lambda_function.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.lambda_handler
+
+# --------------------------------------------------------------------------------------------------
+# Event Source Mapping
+# --------------------------------------------------------------------------------------------------
+#
+# Every shard is split into ParallelizationFactor lanes by the hash of the partition key, so records
+# with the same key are processed in order. A lane is invoked once it holds BatchSize records or its
+# oldest record waited MaximumBatchingWindowInSeconds, or immediately if the upstream is drained.
+# Failed batches are retried until they succeed (MaximumRetryAttempts: -1).
+
+def key_hash(partition_key):
+    return int(hashlib.md5(partition_key.encode()).hexdigest(), 16)
+
+# Kinesis maps the 128 bit MD5 hash space evenly onto the shards
+def shard_of(partition_key, shard_count):
+    return (key_hash(partition_key) * shard_count) >> 128
+
+def iso_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc).strftime(
+        '%Y-%m-%dT%H:%M:%S.%fZ')
+
+class EventSourceMapping:
+
+    def __init__(self, name, handler, settings, shard_count, partition_key):
+
+        self.name = name
+        self.handler = handler
+        self.batch_size = settings['BatchSize']
+        self.parallelization_factor = settings['ParallelizationFactor']
+        self.batching_window = settings['MaximumBatchingWindowInSeconds']
+        self.tumbling_window = settings['TumblingWindowInSeconds']
+        self.shard_count = shard_count
+        self.partition_key = partition_key
+
+        # Lane -> (arrival time, record), the open tumbling window and the failed batch of every lane
+        self.lanes = [collections.deque() for i in range(shard_count * self.parallelization_factor)]
+        self.windows = [None] * len(self.lanes)
+        self.failed_batches = [None] * len(self.lanes)
+
+        self.durations = list()
+        self.cpu_times = list()
+        self.waiting_times = list()
+        self.invocations = 0
+        self.retries = 0
+        self.record_count = 0
+
+    def put(self, records):
+        arrival_time = time.perf_counter()
+        for record in records:
+            partition_key = self.partition_key(record)
+            shard = shard_of(partition_key, self.shard_count)
+            lane = shard * self.parallelization_factor + \
+                key_hash(partition_key) % self.parallelization_factor
+            self.lanes[lane].append((arrival_time, record))
+
+    def idle(self):
+        return not any(self.lanes) and not any(self.windows) and not any(self.failed_batches)
+
+    # At most one batch per lane: (lane, records, event)
+    def ready_batches(self, upstream_drained):
+
+        now = time.perf_counter()
+        batches = list()
+        for lane_index, lane in enumerate(self.lanes):
+
+            # A failed batch is retried unchanged (same records, same window state)
+            if self.failed_batches[lane_index] is not None:
+                batches.append((lane_index, *self.failed_batches[lane_index]))
+                self.failed_batches[lane_index] = None
+                continue
+
+            window = self.windows[lane_index]
+            window_expired = window is not None and now - window['start'] >= self.tumbling_window
+
+            if not lane and not (window_expired or (window and upstream_drained)):
+                continue
+            if lane and len(lane) < self.batch_size and not upstream_drained and \
+                not window_expired and now - lane[0][0] < self.batching_window:
+                continue
+
+            entries = [lane.popleft() for i in range(min(self.batch_size, len(lane)))]
+            event = {'Records': [record for arrival_time, record in entries]}
+
+            if self.tumbling_window > 0:
+                if window is None:
+                    window = self.windows[lane_index] = {'start': now, 'wall_start': time.time(),
+                        'state': dict()}
+                event['window'] = {
+                    'start': iso_time(window['wall_start']),
+                    'end': iso_time(window['wall_start'] + self.tumbling_window)
+                }
+                event['state'] = window['state']
+                event['isFinalInvokeForWindow'] = window_expired or (upstream_drained and not lane)
+                event['isWindowTerminatedEarly'] = False
+
+            batches.append((lane_index, entries, event))
+
+        return batches
+
+    # Invoke the handler for one batch, a failed batch blocks its lane until it succeeds
+    # --> Returns the wall time and the CPU time of the invoking thread (time.thread_time), the lanes
+    #     run concurrently in one process, so the wall time includes waiting for the GIL
+    def invoke(self, lane_index, entries, event):
+
+        start_time = time.perf_counter()
+        start_cpu_time = time.thread_time()
+        try:
+            response = self.handler(event, None)
+        except Exception:
+            self.failed_batches[lane_index] = (entries, event)
+            return start_time, None, None, entries, False
+        cpu_time = time.thread_time() - start_cpu_time
+
+        if 'window' in event:
+            if event['isFinalInvokeForWindow']:
+                self.windows[lane_index] = None
+            else:
+                self.windows[lane_index]['state'] = (response or dict()).get('state', dict())
+        return start_time, time.perf_counter(), cpu_time, entries, True
+
+    # Invoke all ready lanes concurrently, returns True if anything was invoked
+    def poll(self, executor, upstream_drained):
+
+        batches = self.ready_batches(upstream_drained)
+        results = executor.map(lambda batch: self.invoke(*batch), batches)
+
+        for start_time, end_time, cpu_time, entries, success in results:
+            self.invocations += 1
+            if not success:
+                self.retries += 1
+                continue
+            self.durations.append((end_time - start_time) * 1000)
+            self.cpu_times.append(cpu_time * 1000)
+            self.waiting_times.extend((start_time - arrival_time) * 1000
+                for arrival_time, record in entries)
+            self.record_count += len(entries)
+
+        return bool(batches)
+
+# --------------------------------------------------------------------------------------------------
+# Producer: Trade messages with modifies and duplicates, and the totals the pipeline must reach
+# --------------------------------------------------------------------------------------------------
+
+def generate_messages():
+
+    messages = list()
+    latest_messages = dict()
+
+    for i in range(NUMBER_OF_MESSAGES):
+        if latest_messages and random.uniform(0, 100) < PERCENTAGE_DUPLICATE:
+            messages.append(random.choice(messages))
+            continue
+        if latest_messages and random.uniform(0, 100) < PERCENTAGE_MODIFY:
+            trade_id = random.choice(list(latest_messages.keys()))
+            message = synthetic_events.random_message(trade_id,
+                latest_messages[trade_id][constants.VERSION_COLUMN_NAME] + 1)
+            if random.uniform(0, 100) < PERCENTAGE_UNCHANGED_MODIFY:
+                message[constants.VALUE_COLUMN_NAME] = \
+                    latest_messages[trade_id][constants.VALUE_COLUMN_NAME]
+                message[constants.HIERARCHY_COLUMN_NAME] = \
+                    latest_messages[trade_id][constants.HIERARCHY_COLUMN_NAME]
+        else:
+            message = synthetic_events.random_message()
+        latest_messages[message[constants.ID_COLUMN_NAME]] = message
+        messages.append(message)
+
+    # Stateful: Only the latest version of every trade counts. Stateless: Every message is added.
+    if constants.SCENARIO == 'Stateful':
+        counted_messages = latest_messages.values()
+    else:
+        counted_messages = messages
+
+    # Exact decimal totals (the values have two decimals)
+    expected_totals = dict()
+    for message in counted_messages:
+        functions.dict_entry_add(expected_totals, functions.hierarchy_to_string(
+            message[constants.HIERARCHY_COLUMN_NAME], constants.AGGREGATION_HIERARCHY),
+            decimal.Decimal(repr(message[constants.VALUE_COLUMN_NAME])))
+
+    return messages, functions.aggregate_along_tree(expected_totals)
+
+# Kinesis records, the partition key is the hash of the message (as in the producer)
+# --> Record Aggregation: Messages are packed into JSON lists per bucket of TradeIDs
+def kinesis_records(messages):
+
+    if constants.KINESIS_AGGREGATION_ACTIVE:
+        messages_by_partition_key = collections.defaultdict(list)
+        for message in messages:
+            messages_by_partition_key[str(zlib.crc32(message[constants.ID_COLUMN_NAME].encode()) %
+                constants.KINESIS_AGGREGATION_PARTITION_KEYS)].append(message)
+        payloads = [(partition_key, packed_messages[i:i + constants.KINESIS_AGGREGATION_MAX_MESSAGES])
+            for partition_key, packed_messages in messages_by_partition_key.items()
+            for i in range(0, len(packed_messages), constants.KINESIS_AGGREGATION_MAX_MESSAGES)]
+    else:
+        payloads = [(hashlib.sha256(json.dumps(message).encode()).hexdigest(), message)
+            for message in messages]
+
+    records = list()
+    for sequence_number, (partition_key, payload) in enumerate(payloads):
+        shard_id = 'shardId-' + str(shard_of(partition_key, KINESIS_SHARD_COUNT)).zfill(12)
+        records.append(synthetic_events.kinesis_record(payload, sequence_number, shard_id,
+            partition_key))
+    return records
+
+# --------------------------------------------------------------------------------------------------
+# Pipeline
+# --------------------------------------------------------------------------------------------------
+
+def kinesis_partition_key(record):
+    return record[constants.KINESIS_NAME]['partitionKey']
+
+def dynamo_partition_key(record):
+    return json.dumps(record[constants.DYNAMO_NAME]['Keys'], sort_keys = True)
+
+def event_source_mapping(name, shard_count, partition_key):
+    return EventSourceMapping(name, load_lambda(name), EVENT_SOURCE_MAPPINGS[name], shard_count,
+        partition_key)
+
+# Stages in pipeline order: (event source mappings, table whose stream feeds each mapping)
+def build_pipeline():
+
+    if constants.SCENARIO == 'Stateful':
+        stages = [
+            [(event_source_mapping('StateLambda', KINESIS_SHARD_COUNT, kinesis_partition_key), None)],
+            [(event_source_mapping('MapLambda', DYNAMO_STREAM_SHARD_COUNT, dynamo_partition_key),
+                constants.STATE_TABLE_NAME)]
+        ]
+    else:
+        stages = [
+            [(event_source_mapping('StatelessMapLambda', KINESIS_SHARD_COUNT,
+                kinesis_partition_key), None)]
+        ]
+
+    # One ReduceTable stream and event source mapping per reducer partition
+    reduce_handler = load_lambda('ReduceLambda')
+    stages.append([(EventSourceMapping('ReduceLambda', reduce_handler,
+        EVENT_SOURCE_MAPPINGS['ReduceLambda'], DYNAMO_STREAM_SHARD_COUNT, dynamo_partition_key),
+        functions.delta_table_name(partition)) for partition in range(constants.REDUCER_COUNT)])
+
+    return stages
+
+def run_pipeline(stages, records):
+
+    stages[0][0][0].put(records)
+    lane_count = sum(len(mapping.lanes) for stage in stages for mapping, table_name in stage)
+
+    with ThreadPoolExecutor(max_workers = lane_count) as executor:
+        while True:
+
+            invoked = False
+            upstream_drained = True
+            for stage in stages:
+
+                for mapping, table_name in stage:
+                    if table_name is not None:
+                        mapping.put(local_dynamodb.read_stream(table_name))
+                    invoked = mapping.poll(executor, upstream_drained) or invoked
+
+                upstream_drained = upstream_drained and \
+                    all(mapping.idle() for mapping, table_name in stage)
+
+            if upstream_drained:
+                return
+            if not invoked:
+                time.sleep(POLL_INTERVAL)
+
+# --------------------------------------------------------------------------------------------------
+# Report
+# --------------------------------------------------------------------------------------------------
+
+def percentile(sorted_values, share):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * share))]
+
+def print_report(stages, duration, expected_totals):
+
+    print('\nScenario: {}, {} messages in {:.2f} s --> {:.0f} messages / second.\n'.format(
+        constants.SCENARIO, NUMBER_OF_MESSAGES, duration, NUMBER_OF_MESSAGES / duration))
+
+    # wall: Duration of an invocation, the lanes run concurrently in one process, so it includes
+    #       waiting for the GIL (contention) and is not the duration on a Lambda of its own
+    # cpu:  CPU time of the invoking thread, independent of the other lanes
+    # wait: Time of a record from its arrival in the stream to the start of its invocation
+    print('{:<20}{:>8}{:>9}{:>9}{:>11}{:>11}{:>11}{:>11}{:>11}{:>11}{:>11}'.format('Stage', 'Calls',
+        'Retries', 'Records', 'wall p50', 'wall p99', 'wall max', 'cpu p50', 'cpu p99', 'wait p50',
+        'wait p99'))
+
+    for stage in stages:
+        mappings = [mapping for mapping, table_name in stage]
+        durations = sorted(d for mapping in mappings for d in mapping.durations)
+        cpu_times = sorted(c for mapping in mappings for c in mapping.cpu_times)
+        waiting_times = sorted(w for mapping in mappings for w in mapping.waiting_times)
+        print('{:<20}{:>8}{:>9}{:>9}{:>11.2f}{:>11.2f}{:>11.2f}{:>11.2f}{:>11.2f}{:>11.1f}{:>11.1f}'.format(
+            mappings[0].name, sum(m.invocations for m in mappings), sum(m.retries for m in mappings),
+            sum(m.record_count for m in mappings), percentile(durations, 0.5),
+            percentile(durations, 0.99), percentile(durations, 1), percentile(cpu_times, 0.5),
+            percentile(cpu_times, 0.99), percentile(waiting_times, 0.5),
+            percentile(waiting_times, 0.99)))
+    print('All times in ms. wall: under contention of the concurrent lanes (GIL), cpu: thread CPU time.')
+
+    print('\nDynamoDB calls:')
+    for operation, count in sorted(local_dynamodb.call_counts.items()):
+        print('  {:<22}{:>8}'.format(operation, count))
+
+    # Consistency: AggregateTable against the totals of the generated messages
+    aggregates = {item[constants.AGGREGATE_TABLE_KEY]['S']: float(item['Value']['N'])
+        for item in local_dynamodb.tables[constants.AGGREGATE_TABLE_NAME].values()
+        if not functions.is_metadata_key(item[constants.AGGREGATE_TABLE_KEY]['S'])}
+    deviations = [abs(aggregates.get(k, 0.0) - float(v)) / max(1.0, abs(float(v)))
+        for k, v in expected_totals.items()]
+    correct = sum(1 for deviation in deviations if deviation < 1e-9)
+    print('\nAggregated messages: {:.0f}'.format(aggregates.get(constants.MESSAGE_COUNT_NAME, 0)))
+    print('Consistent aggregates: {} / {} (max relative deviation {:.2e})'.format(correct,
+        len(expected_totals), max(deviations) if deviations else 0.0))
+
+    # Exact decimal comparison (only VALUE_FIXED_POINT_DECIMALS guarantees it)
+    exact_aggregates = {item[constants.AGGREGATE_TABLE_KEY]['S']: decimal.Decimal(item['Value']['N'])
+        for item in local_dynamodb.tables[constants.AGGREGATE_TABLE_NAME].values()
+        if not functions.is_metadata_key(item[constants.AGGREGATE_TABLE_KEY]['S'])}
+    print('Exact aggregates: {} / {}'.format(sum(1 for k, v in expected_totals.items()
+        if exact_aggregates.get(k) == v), len(expected_totals)))
+
+    # Snapshots of the reducer partitions against the AggregateTable
+    if constants.SNAPSHOT_ACTIVE:
+        versions, snapshot = functions.read_snapshots(local_dynamodb)
+        deviations = [abs(snapshot.get(k, 0.0) - v) / max(1.0, abs(v)) for k, v in aggregates.items()]
+        print('Snapshot versions {}: {} / {} aggregates consistent'.format('/'.join(map(str, versions)),
+            sum(1 for deviation in deviations if deviation < 1e-9), len(aggregates)))
+
+    # Generator-to-aggregate latency per leaf, every aggregated message is counted exactly once
+    if constants.LATENCY_SKETCH_ACTIVE:
+        sketches = {key[len(constants.LATENCY_KEY_PREFIX):]: functions.latency_sketch_of_item(item)
+            for key, item in ((item[constants.AGGREGATE_TABLE_KEY]['S'], item)
+            for item in local_dynamodb.tables[constants.AGGREGATE_TABLE_NAME].values())
+            if key.startswith(constants.LATENCY_KEY_PREFIX)}
+        print('\nLatency sketches: {} message(s)\n'.format(
+            sum(latency_sketch.count(sketch) for sketch in sketches.values())))
+        print('{:<30}{:>10}{:>12}{:>12}{:>12}'.format('Leaf', 'Messages', 'p50 [ms]', 'p99 [ms]',
+            'p99.9 [ms]'))
+        for leaf_key, sketch in sorted(sketches.items()):
+            print('{:<30}{:>10}{:>12.0f}{:>12.0f}{:>12.0f}'.format(leaf_key, latency_sketch.count(sketch),
+                *[latency_sketch.quantile(sketch, q) for q in (0.5, 0.99, 0.999)]))
+    print()
+
+# --------------------------------------------------------------------------------------------------
+# Main
+# --------------------------------------------------------------------------------------------------
+
+print('\nGenerating ' + str(NUMBER_OF_MESSAGES) + ' messages...')
+messages, expected_totals = generate_messages()
+records = kinesis_records(messages)
+stages = build_pipeline()
+
+print('Running the ' + constants.SCENARIO + ' pipeline...')
+with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(sys.stdout if LAMBDA_LOGS else devnull):
+    start_time = time.perf_counter()
+    run_pipeline(stages, records)
+    duration = time.perf_counter() - start_time
+
+print_report(stages, duration, expected_totals)
@@ -7,16 +7,18 @@
 
 # General Imports
 import json
-import base64
 import random
-from decimal import Decimal
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # AWS Imports
-import boto3
 from botocore.exceptions import ClientError
 
 # Project Imports
+import functions
 import constants
+from hierarchy import HIERARCHY
+from stage_timer import StageTimer
 
 if constants.TRACK_PERFORMANCE:
     from performance_tracker import EventsCounter, PerformanceTrackerInitializer
@@ -30,92 +32,148 @@ if constants.TRACK_PERFORMANCE:
     perf_tracker = PerformanceTrackerInitializer(
             True, constants.INFLUX_CONNECTION_STRING, constants.GRAFANA_INSTANCE_IP
         )
-    event_counter = EventsCounter(['state_lambda_batch_size', 'state_lambda_random_failures'])
+    event_counter = EventsCounter(['state_lambda_batch_size', 'state_lambda_random_failures',
+        'state_lambda_collapsed_records', 'state_lambda_dropped_duplicates',
+        'state_lambda_dropped_stale_versions', 'state_lambda_failed_conditional_writes',
+        'state_lambda_write_latency_ms'])
+
+# --------------------------------------------------------------------------------------------------
+# Initialize AWS Clients (reused across invocations of a warm container)
+# --------------------------------------------------------------------------------------------------
+
+ddb_client = functions.get_client(constants.DYNAMO_NAME)
+
+# --------------------------------------------------------------------------------------------------
+# Write a single message to the StateTable
+# --------------------------------------------------------------------------------------------------
+
+def write_state_item(ddb_client, message):
+
+    # Get Entries
+    record_id           = message.id
+    record_hierarchy    = message.hierarchy
+    record_value        = message.value
+    record_version      = message.version
+    record_time         = message.timestamp
+
+    # Leaf key for the map Lambdas (saves parsing the Hierarchy JSON on the stream)
+    record_leaf_key     = functions.hierarchy_to_string(record_hierarchy, constants.AGGREGATION_HIERARCHY)
+
+    # Write to DDB
+    # --> We use a conditional update item to ensure we always have the most recent version
+    try:
+        ddb_client.update_item(
+            TableName = constants.STATE_TABLE_NAME,
+            Key = {
+                    constants.STATE_TABLE_KEY: {'S': record_id}
+                },
+            UpdateExpression = 'SET  #VALUE     = :new_value,' + \
+                                    '#VERSION   = :new_version,' + \
+                                    '#HIERARCHY = :new_hierarchy,' + \
+                                    '#LEAF_KEY  = :new_leaf_key,' + \
+                                    '#SIGNATURE = :signature,' + \
+                                    '#TIMESTAMP = :new_time',
+            ConditionExpression = 'attribute_not_exists(' + constants.STATE_TABLE_KEY +
+                                  ') OR ' + constants.VERSION_COLUMN_NAME + '< :new_version',
+            ExpressionAttributeNames={
+                '#VALUE':       constants.VALUE_COLUMN_NAME,
+                '#VERSION':     constants.VERSION_COLUMN_NAME,
+                '#HIERARCHY':   constants.HIERARCHY_COLUMN_NAME,
+                '#LEAF_KEY':    constants.LEAF_KEY_COLUMN_NAME,
+                '#SIGNATURE':   constants.HIERARCHY_SIGNATURE_COLUMN_NAME,
+                '#TIMESTAMP':   constants.TIMESTAMP_COLUMN_NAME
+                },
+            ExpressionAttributeValues={
+                ':new_version':     {'N': str(record_version)},
+                ':new_value':       {'N': str(record_value)},
+                ':new_hierarchy':   {'S': json.dumps(record_hierarchy, sort_keys = True)},
+                ':new_leaf_key':    {'S': record_leaf_key},
+                ':signature':       {'N': HIERARCHY.level_signature},
+                ':new_time':        {'N': str(record_time)}
+                },
+            )
+    except ClientError as e:
+        if e.response['Error']['Code']=='ConditionalCheckFailedException':
+            print('Conditional put failed for Id ' + str(record_id) + ', Version ' + \
+                str(record_version) + '. A more recent version is already stored.')
+            return False
+        else:
+            raise Exception(e)
+
+    return True
 
 # --------------------------------------------------------------------------------------------------
 # Lambda Function
 # --------------------------------------------------------------------------------------------------
 
 def lambda_handler(event, context):
-    
+
     # Print Status at Start
     records = event['Records']
     print('Invoked StateLambda with ' + str(len(records)) + ' record(s).')
 
-    # Initialize DynamoDB
-    ddb_ressource = boto3.resource(constants.DYNAMO_NAME)
-    table = ddb_ressource.Table(constants.STATE_TABLE_NAME)
-    
-    # Loop over records
-    for record in records:
-
-        # Load Record
-        data = json.loads(base64.b64decode(record[constants.KINESIS_NAME]['data']).decode('utf-8'))
-
-        # Get Entries
-        record_id           = data[constants.ID_COLUMN_NAME]
-        record_hierarchy    = data[constants.HIERARCHY_COLUMN_NAME]
-        record_value        = data[constants.VALUE_COLUMN_NAME]
-        record_version      = data[constants.VERSION_COLUMN_NAME]
-        record_time         = data[constants.TIMESTAMP_COLUMN_NAME]
-        
-        # Manually Introduced Random Failure
-        if random.uniform(0,100) < constants.FAILURE_STATE_LAMBDA_PCT / len(records):
-            
-            # Submit measurements
-            if constants.TRACK_PERFORMANCE:
-                event_counter.increment('state_lambda_random_failures', 1)
-                perf_tracker.add_metric_sample(None, event_counter, None, None)
-                perf_tracker.submit_measurements()
-                
-            # Raise exception
-            raise Exception('Manually Introduced Random Failure!')
-
-        # Write to DDB
-        # --> We use a conditional update item to ensure we always have the most recent version
-        try:
-            table.update_item(
-                Key = {
-                        constants.STATE_TABLE_KEY: record_id
-                    },
-                UpdateExpression = 'SET  #VALUE     = :new_value,' + \
-                                        '#VERSION   = :new_version,' + \
-                                        '#HIERARCHY = :new_hierarchy,' + \
-                                        '#TIMESTAMP = :new_time',
-                ConditionExpression = 'attribute_not_exists(' + constants.STATE_TABLE_KEY + 
-                                      ') OR ' + constants.VERSION_COLUMN_NAME + '< :new_version',
-                ExpressionAttributeNames={
-                    '#VALUE':       constants.VALUE_COLUMN_NAME,
-                    '#VERSION':     constants.VERSION_COLUMN_NAME,
-                    '#HIERARCHY':   constants.HIERARCHY_COLUMN_NAME,
-                    '#TIMESTAMP':   constants.TIMESTAMP_COLUMN_NAME
-                    },
-                ExpressionAttributeValues={
-                    ':new_version':     record_version,
-                    ':new_value':       Decimal(str(record_value)),
-                    ':new_hierarchy':   json.dumps(record_hierarchy, sort_keys = True),
-                    ':new_time':        Decimal(str(record_time))
-                    },
-                )
-        except ClientError as e:
-            if e.response['Error']['Code']=='ConditionalCheckFailedException':  
-                print('Conditional put failed.' + \
-                    ' This is either a duplicate or a more recent version already arrived.')
-                print('Id: ',           record_id)
-                print('Hierarchy: ',    record_hierarchy)
-                print('Value: ',        record_value)
-                print('Version: ',      record_version)
-                print('Timestamp: ',    record_time)
-            else:
-                raise Exception(e)
-            
+    # Time the stages of this invocation
+    timer = StageTimer('state_lambda')
+
+    # Load Messages (unpacks aggregated records)
+    messages = functions.kinesis_messages(records)
+    timer.mark('decode')
+
+    # Keep only the most recent version per TradeID
+    # --> Duplicates and versions that lose within the batch would fail the conditional update anyway
+    latest_messages, duplicate_count, stale_count = functions.collapse_versions(messages)
+    collapsed_record_count = duplicate_count + stale_count
+    timer.mark('collapse')
+
+    # Write surviving messages with bounded parallelism
+    # --> Every message has a different TradeID, hence the conditional updates are independent
+    write_start_time = time.time()
+    with ThreadPoolExecutor(max_workers = constants.STATE_LAMBDA_WRITE_THREADS) as executor:
+
+        futures = list()
+        for message in latest_messages:
+
+            # Manually Introduced Random Failure
+            if random.uniform(0,100) < constants.FAILURE_STATE_LAMBDA_PCT / len(latest_messages):
+
+                # Submit measurements
+                if constants.TRACK_PERFORMANCE:
+                    event_counter.increment('state_lambda_random_failures', 1)
+                    perf_tracker.add_metric_sample(timer.stats_dic, event_counter,
+                        timer.first_event(), timer.last_event())
+                    perf_tracker.submit_measurements()
+
+                # Raise exception
+                raise Exception('Manually Introduced Random Failure!')
+
+            futures.append(executor.submit(write_state_item, ddb_client, message))
+
+        # Wait for all writes, re-raises the first unexpected error
+        results = [future.result() for future in futures]
+
+    write_latency_ms = (time.time() - write_start_time) * 1000
+    failed_write_count = results.count(False)
+    timer.mark('write')
+    timer.finish()
+
     # Submit measurements
     if constants.TRACK_PERFORMANCE:
-        event_counter.increment('state_lambda_batch_size', len(records))
-        perf_tracker.add_metric_sample(None, event_counter, None, None)
+        event_counter.increment('state_lambda_batch_size', len(messages))
+        event_counter.increment('state_lambda_collapsed_records', collapsed_record_count)
+        event_counter.increment('state_lambda_dropped_duplicates', duplicate_count)
+        event_counter.increment('state_lambda_dropped_stale_versions', stale_count)
+        event_counter.increment('state_lambda_failed_conditional_writes', failed_write_count)
+        event_counter.set('state_lambda_write_latency_ms', write_latency_ms)
+        perf_tracker.add_metric_sample(timer.stats_dic, event_counter, timer.first_event(),
+            timer.last_event())
         perf_tracker.submit_measurements()
 
     # Print Status at End
-    print('StateLambda successfully processed ' + str(len(records)) + ' record(s).')
+    print('StateLambda successfully processed ' + str(len(messages)) + ' message(s) from ' + \
+        str(len(records)) + ' record(s). ' + \
+        'Dropped ' + str(duplicate_count) + ' duplicate(s) and ' + str(stale_count) + \
+        ' stale version(s) within the batch, wrote ' + \
+        str(len(latest_messages)) + ' item(s) in {:.1f} ms, '.format(write_latency_ms) + \
+        str(failed_write_count) + ' conditional write(s) failed.')
 
-    return {'statusCode': 200}
\ No newline at end of file
+    return {'statusCode': 200}